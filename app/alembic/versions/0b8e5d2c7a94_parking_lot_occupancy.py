@@ -0,0 +1,41 @@
+"""parking_lot_occupancy
+
+Revision ID: 0b8e5d2c7a94
+Revises: f2a7c9e4d1b8
+Create Date: 2026-10-18 17:05:44.810392
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b8e5d2c7a94'
+down_revision: Union[str, Sequence[str], None] = 'f2a7c9e4d1b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('parking_lot_occupancy',
+    sa.Column('parking_lot_id', sa.Integer(), nullable=False),
+    sa.Column('occupied', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['parking_lot_id'], ['parking_lots.id'], ),
+    sa.PrimaryKeyConstraint('parking_lot_id')
+    )
+
+    # Count the sessions that are active right now
+    op.execute("""
+        INSERT INTO parking_lot_occupancy (parking_lot_id, occupied, updated_at)
+        SELECT l.id, (SELECT COUNT(*) FROM parking_sessions s WHERE s.parking_lot_id = l.id AND s.stopped IS NULL), CURRENT_TIMESTAMP
+        FROM parking_lots l
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('parking_lot_occupancy')
@@ -0,0 +1,66 @@
+"""parking_lot_search
+
+Revision ID: 3d9f6b1a7c25
+Revises: 0b8e5d2c7a94
+Create Date: 2026-10-18 19:12:27.503114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d9f6b1a7c25'
+down_revision: Union[str, Sequence[str], None] = '0b8e5d2c7a94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # FTS5 is SQLite only, other databases search without an index
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    # A frozen copy of LotSearch.DDL as of this revision
+    op.execute("""
+        CREATE VIRTUAL TABLE parking_lots_fts USING fts5(
+            name, location, address,
+            content='parking_lots', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    """)
+    op.execute("""
+        CREATE TRIGGER parking_lots_fts_insert AFTER INSERT ON parking_lots BEGIN
+            INSERT INTO parking_lots_fts (rowid, name, location, address) VALUES (new.id, new.name, new.location, new.address);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER parking_lots_fts_delete AFTER DELETE ON parking_lots BEGIN
+            INSERT INTO parking_lots_fts (parking_lots_fts, rowid, name, location, address)
+            VALUES ('delete', old.id, old.name, old.location, old.address);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER parking_lots_fts_update AFTER UPDATE OF name, location, address ON parking_lots BEGIN
+            INSERT INTO parking_lots_fts (parking_lots_fts, rowid, name, location, address)
+            VALUES ('delete', old.id, old.name, old.location, old.address);
+            INSERT INTO parking_lots_fts (rowid, name, location, address) VALUES (new.id, new.name, new.location, new.address);
+        END
+    """)
+
+    # Index the existing parking lots
+    op.execute("INSERT INTO parking_lots_fts (parking_lots_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute("DROP TRIGGER parking_lots_fts_update")
+    op.execute("DROP TRIGGER parking_lots_fts_delete")
+    op.execute("DROP TRIGGER parking_lots_fts_insert")
+    op.execute("DROP TABLE parking_lots_fts")
@@ -0,0 +1,44 @@
+"""hot_lookup_indexes
+
+Revision ID: 5c2e8f4a9d31
+Revises: aff162b03735
+Create Date: 2026-10-18 10:12:04.518733
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c2e8f4a9d31'
+down_revision: Union[str, Sequence[str], None] = 'aff162b03735'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # users.username and users.email are already indexed by their unique constraints
+    op.create_index(op.f('ix_users_phone'), 'users', ['phone'], unique=False)
+    op.create_index(op.f('ix_vehicles_license_plate'), 'vehicles', ['license_plate'], unique=False)
+    op.create_index('ix_parking_sessions_active_license_plate', 'parking_sessions', ['license_plate'], unique=False,
+                    sqlite_where=sa.text('stopped IS NULL'), postgresql_where=sa.text('stopped IS NULL'))
+    op.create_index('ix_parking_sessions_license_plate_started', 'parking_sessions', ['license_plate', 'started'], unique=False)
+    op.create_index('ix_parking_sessions_username_stopped', 'parking_sessions', ['username', 'stopped'], unique=False)
+    op.create_index(op.f('ix_payments_transaction'), 'payments', ['transaction'], unique=False)
+    op.create_index(op.f('ix_payments_hash'), 'payments', ['hash'], unique=False)
+    op.create_index(op.f('ix_payments_initiator_id'), 'payments', ['initiator_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_payments_initiator_id'), table_name='payments')
+    op.drop_index(op.f('ix_payments_hash'), table_name='payments')
+    op.drop_index(op.f('ix_payments_transaction'), table_name='payments')
+    op.drop_index('ix_parking_sessions_username_stopped', table_name='parking_sessions')
+    op.drop_index('ix_parking_sessions_license_plate_started', table_name='parking_sessions')
+    op.drop_index('ix_parking_sessions_active_license_plate', table_name='parking_sessions')
+    op.drop_index(op.f('ix_vehicles_license_plate'), table_name='vehicles')
+    op.drop_index(op.f('ix_users_phone'), table_name='users')
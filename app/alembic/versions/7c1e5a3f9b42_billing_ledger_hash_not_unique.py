@@ -0,0 +1,31 @@
+"""billing_ledger_hash_not_unique
+
+Revision ID: 7c1e5a3f9b42
+Revises: 3d9f6b1a7c25
+Create Date: 2026-10-18 21:03:51.274816
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1e5a3f9b42'
+down_revision: Union[str, Sequence[str], None] = '3d9f6b1a7c25'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Payment hashes of different sessions can be equal, the ledger is keyed on the session instead
+    op.drop_index(op.f('ix_billing_ledger_transaction_hash'), table_name='billing_ledger')
+    op.create_index(op.f('ix_billing_ledger_transaction_hash'), 'billing_ledger', ['transaction_hash'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_billing_ledger_transaction_hash'), table_name='billing_ledger')
+    op.create_index(op.f('ix_billing_ledger_transaction_hash'), 'billing_ledger', ['transaction_hash'], unique=True)
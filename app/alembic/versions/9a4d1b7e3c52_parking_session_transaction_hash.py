@@ -0,0 +1,62 @@
+"""parking_session_transaction_hash
+
+Revision ID: 9a4d1b7e3c52
+Revises: 5c2e8f4a9d31
+Create Date: 2026-10-18 11:02:37.190465
+
+"""
+from hashlib import md5
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4d1b7e3c52'
+down_revision: Union[str, Sequence[str], None] = '5c2e8f4a9d31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 1000
+
+parking_sessions = sa.table(
+    'parking_sessions',
+    sa.column('id', sa.Integer),
+    sa.column('license_plate', sa.String),
+    sa.column('stopped', sa.DateTime),
+    sa.column('transaction_hash', sa.String)
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('parking_sessions', sa.Column('transaction_hash', sa.String(), nullable=True))
+
+    # Backfill the stopped sessions, with the same hash as PaymentUtils.generate_payment_hash
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(parking_sessions.c.id, parking_sessions.c.license_plate)
+            .where(parking_sessions.c.stopped.is_not(None), parking_sessions.c.id > last_id)
+            .order_by(parking_sessions.c.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        connection.execute(
+            parking_sessions.update()
+            .where(parking_sessions.c.id == sa.bindparam('session_id'))
+            .values(transaction_hash=sa.bindparam('hash')),
+            [{'session_id': row.id, 'hash': md5(f"{row.id}{row.license_plate}".encode("utf-8")).hexdigest()} for row in rows]
+        )
+        last_id = rows[-1].id
+
+    op.create_index(op.f('ix_parking_sessions_transaction_hash'), 'parking_sessions', ['transaction_hash'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_parking_sessions_transaction_hash'), table_name='parking_sessions')
+    op.drop_column('parking_sessions', 'transaction_hash')
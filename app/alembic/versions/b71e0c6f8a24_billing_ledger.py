@@ -0,0 +1,71 @@
+"""billing_ledger
+
+Revision ID: b71e0c6f8a24
+Revises: 9a4d1b7e3c52
+Create Date: 2026-10-18 11:48:12.604118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b71e0c6f8a24'
+down_revision: Union[str, Sequence[str], None] = '9a4d1b7e3c52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('billing_ledger',
+    sa.Column('session_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('username', sa.String(), nullable=False),
+    sa.Column('transaction_hash', sa.String(), nullable=False),
+    sa.Column('amount_due', sa.Float(), nullable=False),
+    sa.Column('amount_paid', sa.Float(), nullable=False),
+    sa.Column('balance', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['session_id'], ['parking_sessions.id'], ),
+    sa.PrimaryKeyConstraint('session_id')
+    )
+    op.create_index('ix_billing_ledger_username_session_id', 'billing_ledger', ['username', 'session_id'], unique=False)
+    op.create_index(op.f('ix_billing_ledger_transaction_hash'), 'billing_ledger', ['transaction_hash'], unique=True)
+    op.create_table('user_balances',
+    sa.Column('username', sa.String(), nullable=False),
+    sa.Column('amount_due', sa.Float(), nullable=False),
+    sa.Column('amount_paid', sa.Float(), nullable=False),
+    sa.Column('balance', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('username')
+    )
+    op.create_index(op.f('ix_user_balances_balance'), 'user_balances', ['balance'], unique=False)
+
+    # Build the ledger from the stopped sessions and the payments made for them so far
+    op.execute("""
+        INSERT INTO billing_ledger (session_id, username, transaction_hash, amount_due, amount_paid, balance, updated_at)
+        SELECT id, username, transaction_hash, due, paid, due - paid, CURRENT_TIMESTAMP
+        FROM (
+            SELECT s.id, s.username, s.transaction_hash, COALESCE(s.cost, 0) AS due,
+                   COALESCE((SELECT SUM(p.amount) FROM payments p WHERE p."transaction" = s.transaction_hash), 0) AS paid
+            FROM parking_sessions s
+            WHERE s.stopped IS NOT NULL AND s.transaction_hash IS NOT NULL
+        ) AS sessions
+    """)
+    op.execute("""
+        INSERT INTO user_balances (username, amount_due, amount_paid, balance, updated_at)
+        SELECT username, SUM(amount_due), SUM(amount_paid), SUM(balance), CURRENT_TIMESTAMP
+        FROM billing_ledger
+        GROUP BY username
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_user_balances_balance'), table_name='user_balances')
+    op.drop_table('user_balances')
+    op.drop_index(op.f('ix_billing_ledger_transaction_hash'), table_name='billing_ledger')
+    op.drop_index('ix_billing_ledger_username_session_id', table_name='billing_ledger')
+    op.drop_table('billing_ledger')
@@ -0,0 +1,35 @@
+"""parking_session_search_indexes
+
+Revision ID: d3f5a8c1e607
+Revises: b71e0c6f8a24
+Create Date: 2026-10-18 12:31:50.227841
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3f5a8c1e607'
+down_revision: Union[str, Sequence[str], None] = 'b71e0c6f8a24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Billing reads the ledger now, so nothing searches on (username, stopped) anymore
+    op.drop_index('ix_parking_sessions_username_stopped', table_name='parking_sessions')
+    op.create_index('ix_parking_sessions_started', 'parking_sessions', ['started'], unique=False)
+    op.create_index('ix_parking_sessions_username_started', 'parking_sessions', ['username', 'started'], unique=False)
+    op.create_index('ix_parking_sessions_parking_lot_id_started', 'parking_sessions', ['parking_lot_id', 'started'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_parking_sessions_parking_lot_id_started', table_name='parking_sessions')
+    op.drop_index('ix_parking_sessions_username_started', table_name='parking_sessions')
+    op.drop_index('ix_parking_sessions_started', table_name='parking_sessions')
+    op.create_index('ix_parking_sessions_username_stopped', 'parking_sessions', ['username', 'stopped'], unique=False)
@@ -0,0 +1,43 @@
+"""unique_active_parking_session
+
+Revision ID: e6c2d94b1f70
+Revises: d3f5a8c1e607
+Create Date: 2026-10-18 14:02:37.518094
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6c2d94b1f70'
+down_revision: Union[str, Sequence[str], None] = 'd3f5a8c1e607'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Plates that were started twice before the index existed have to be stopped by hand first,
+    # which session is the real one isn't something a migration can decide
+    duplicates = op.get_bind().execute(sa.text(
+        "SELECT license_plate FROM parking_sessions WHERE stopped IS NULL "
+        "GROUP BY license_plate HAVING COUNT(*) > 1"
+    )).scalars().all()
+    if duplicates:
+        raise RuntimeError(f"Plates with more than one active parking session: {', '.join(duplicates)}")
+
+    op.drop_index('ix_parking_sessions_active_license_plate', table_name='parking_sessions',
+                  sqlite_where=sa.text('stopped IS NULL'), postgresql_where=sa.text('stopped IS NULL'))
+    op.create_index('ix_parking_sessions_active_license_plate', 'parking_sessions', ['license_plate'], unique=True,
+                    sqlite_where=sa.text('stopped IS NULL'), postgresql_where=sa.text('stopped IS NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_parking_sessions_active_license_plate', table_name='parking_sessions',
+                  sqlite_where=sa.text('stopped IS NULL'), postgresql_where=sa.text('stopped IS NULL'))
+    op.create_index('ix_parking_sessions_active_license_plate', 'parking_sessions', ['license_plate'], unique=False,
+                    sqlite_where=sa.text('stopped IS NULL'), postgresql_where=sa.text('stopped IS NULL'))
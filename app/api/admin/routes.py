@@ -0,0 +1,260 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.admin.schemas import QueryStatsResponse, RouteQueryStatsResponse, OutstandingBalanceResponse, \
+    ActiveSessionIndexStatsResponse, IdempotencyStoreStatsResponse, LotCatalogueStatsResponse, OccupancyStreamStatsResponse
+from app.db.database import get_async_db
+from app.db.query_log import QueryLog
+from app.util.active_session_index import ActiveSessionIndex
+from app.util.billing_utils import BillingUtils
+from app.util.idempotency_store import IdempotencyStore
+from app.util.jwt_authenticator import JWTAuthenticator, TokenMissingError, TokenInvalidError, TokenExpiredError
+from app.util.lot_catalogue import LotCatalogue
+from app.util.occupancy_broadcaster import OccupancyBroadcaster
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+@router.get("/queries/slowest", response_model=List[QueryStatsResponse])
+async def get_slowest_queries(
+        request: Request,
+        limit: int = Query(10, description="Amount of statement fingerprints to return", ge=1, le=100)
+):
+    """Get the statement fingerprints with the slowest executions since startup (admin only)"""
+    # Validate token
+    try:
+        user_info: dict = JWTAuthenticator.validate_token(request.headers.get("Authorization"))
+    except TokenMissingError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e)
+        )
+    except TokenInvalidError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e)
+        )
+    except TokenExpiredError as e:
+        raise HTTPException(
+            status_code=498,
+            detail=str(e)
+        )
+
+    role: str = user_info.get("role")
+
+    # Check if user is admin
+    if role.lower() != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+
+    return QueryLog.slowest(limit)
+
+
+@router.get("/queries/routes", response_model=List[RouteQueryStatsResponse])
+async def get_route_query_stats(request: Request):
+    """Get the amount of queries and database time per request for every route since startup (admin only)"""
+    # Validate token
+    try:
+        user_info: dict = JWTAuthenticator.validate_token(request.headers.get("Authorization"))
+    except TokenMissingError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e)
+        )
+    except TokenInvalidError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e)
+        )
+    except TokenExpiredError as e:
+        raise HTTPException(
+            status_code=498,
+            detail=str(e)
+        )
+
+    role: str = user_info.get("role")
+
+    # Check if user is admin
+    if role.lower() != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+
+    return QueryLog.route_stats()
+
+
+@router.get("/billing/outstanding", response_model=List[OutstandingBalanceResponse])
+async def get_outstanding_balances(
+        request: Request,
+        limit: int = Query(50, description="Amount of users to return", ge=1, le=1000),
+        db: AsyncSession = Depends(get_async_db)
+):
+    """Get the users with the highest outstanding balance (admin only)"""
+    # Validate token
+    try:
+        user_info: dict = JWTAuthenticator.validate_token(request.headers.get("Authorization"))
+    except TokenMissingError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e)
+        )
+    except TokenInvalidError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e)
+        )
+    except TokenExpiredError as e:
+        raise HTTPException(
+            status_code=498,
+            detail=str(e)
+        )
+
+    role: str = user_info.get("role")
+
+    # Check if user is admin
+    if role.lower() != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+
+    return await BillingUtils.get_outstanding_balances(db, limit)
+
+
+@router.get("/active_sessions", response_model=ActiveSessionIndexStatsResponse)
+async def get_active_session_index_stats(request: Request):
+    """Get the size and hit rate of the in-memory active session index (admin only)"""
+    # Validate token
+    try:
+        user_info: dict = JWTAuthenticator.validate_token(request.headers.get("Authorization"))
+    except TokenMissingError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e)
+        )
+    except TokenInvalidError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e)
+        )
+    except TokenExpiredError as e:
+        raise HTTPException(
+            status_code=498,
+            detail=str(e)
+        )
+
+    role: str = user_info.get("role")
+
+    # Check if user is admin
+    if role.lower() != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+
+    return ActiveSessionIndex.stats()
+
+
+@router.get("/idempotency", response_model=IdempotencyStoreStatsResponse)
+async def get_idempotency_store_stats(request: Request):
+    """Get the size and replay hit rate of the Idempotency-Key response store (admin only)"""
+    # Validate token
+    try:
+        user_info: dict = JWTAuthenticator.validate_token(request.headers.get("Authorization"))
+    except TokenMissingError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e)
+        )
+    except TokenInvalidError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e)
+        )
+    except TokenExpiredError as e:
+        raise HTTPException(
+            status_code=498,
+            detail=str(e)
+        )
+
+    role: str = user_info.get("role")
+
+    # Check if user is admin
+    if role.lower() != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+
+    return IdempotencyStore.stats()
+
+
+@router.get("/lot_catalogue", response_model=LotCatalogueStatsResponse)
+async def get_lot_catalogue_stats(request: Request):
+    """Get the version, size and hit rate of the in-memory parking lot catalogue (admin only)"""
+    # Validate token
+    try:
+        user_info: dict = JWTAuthenticator.validate_token(request.headers.get("Authorization"))
+    except TokenMissingError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e)
+        )
+    except TokenInvalidError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e)
+        )
+    except TokenExpiredError as e:
+        raise HTTPException(
+            status_code=498,
+            detail=str(e)
+        )
+
+    role: str = user_info.get("role")
+
+    # Check if user is admin
+    if role.lower() != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+
+    return LotCatalogue.stats()
+
+@router.get("/occupancy_stream", response_model=OccupancyStreamStatsResponse)
+async def get_occupancy_stream_stats(request: Request):
+    """Get the amount of clients streaming the parking lot occupancy and the changes sent to them (admin only)"""
+    # Validate token
+    try:
+        user_info: dict = JWTAuthenticator.validate_token(request.headers.get("Authorization"))
+    except TokenMissingError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e)
+        )
+    except TokenInvalidError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e)
+        )
+    except TokenExpiredError as e:
+        raise HTTPException(
+            status_code=498,
+            detail=str(e)
+        )
+
+    role: str = user_info.get("role")
+
+    # Check if user is admin
+    if role.lower() != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+
+    return OccupancyBroadcaster.stats()
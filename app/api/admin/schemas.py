@@ -0,0 +1,79 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class QueryStatsResponse(BaseModel):
+    fingerprint: str
+    count: int
+    total_ms: float
+    mean_ms: float
+    max_ms: float
+    slowest_route: Optional[str]
+
+
+class RouteQueryStatsResponse(BaseModel):
+    route: str
+    requests: int
+    mean_queries: float
+    max_queries: int
+    mean_time_ms: float
+    over_budget: int
+
+
+class OutstandingBalanceResponse(BaseModel):
+    username: str
+    amount_due: float
+    amount_paid: float
+    balance: float
+
+    class Config:
+        from_attributes = True
+
+
+class ReconcileResult(BaseModel):
+    at: datetime
+    added: int
+    removed: int
+
+
+class ActiveSessionIndexStatsResponse(BaseModel):
+    warmed: bool
+    size: int
+    hits: int
+    misses: int
+    hit_rate: float
+    stale: int
+    last_reconcile: Optional[ReconcileResult]
+
+
+class IdempotencyStoreStatsResponse(BaseModel):
+    size: int
+    bytes: int
+    max_bytes: int
+    in_flight: int
+    hits: int
+    misses: int
+    hit_rate: float
+    conflicts: int
+    mismatches: int
+    evictions: int
+    expirations: int
+
+
+class LotCatalogueStatsResponse(BaseModel):
+    loaded: bool
+    version: Optional[int]
+    size: int
+    hits: int
+    misses: int
+    hit_rate: float
+    reloads: int
+    last_reload: Optional[datetime]
+
+
+class OccupancyStreamStatsResponse(BaseModel):
+    subscribers: int
+    published: int
+    coalesced: int
@@ -5,7 +5,7 @@ from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.responses import Response
 from sqlalchemy.orm import Session
 from app.api.auth.schemas import RegisterBody, LoginBody, LoginResponse, LogoutBody
-from app.db.database import SessionLocal
+from app.db.database import get_db
 from app.db.models.user import User
 from app.util.jwt_authenticator import JWTAuthenticator, TokenMissingError, TokenInvalidError, TokenExpiredError
 from app.api.login_sessions.session_manager import LoginSessionManager
@@ -18,15 +18,8 @@ import re
 
 router = APIRouter(prefix="/auth", tags=["Authorization"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/register", status_code=status.HTTP_201_CREATED)
-async def register_user(request: Request, body: RegisterBody, db: Session = Depends(get_db), ):
+def register_user(request: Request, body: RegisterBody, db: Session = Depends(get_db), ):
     """
     Registers a new user
     """
@@ -74,7 +67,7 @@ async def register_user(request: Request, body: RegisterBody, db: Session = Depe
     return { "message": "Registered successfully" }
 
 @router.post("/login", response_model=LoginResponse, status_code=status.HTTP_200_OK)
-async def login_user(body: LoginBody, db: Session = Depends(get_db)):
+def login_user(body: LoginBody, db: Session = Depends(get_db)):
     """
     Logs in a user
     """
@@ -1,29 +1,24 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status, Request
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.billing.schemas import BillingResponse
-from app.db.database import SessionLocal
-from app.db.models.parking_lot import ParkingLot
-from app.db.models.parking_session import ParkingSession
+from app.db.database import get_async_db
+from app.util.billing_utils import BillingUtils
 from app.util.db_utils import DbUtils
 from app.util.jwt_authenticator import JWTAuthenticator, TokenMissingError, TokenInvalidError, TokenExpiredError
-from app.util.payment_utils import PaymentUtils
 
 router = APIRouter(prefix="/billing", tags=["billing"])
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 @router.get("/", response_model=List[BillingResponse])
-async def get_user_billing(request: Request, db: Session = Depends(get_db)):
+async def get_user_billing(
+    request: Request,
+    limit: Optional[int] = Query(None, description="Limit the amount of results", ge=1),
+    after: Optional[int] = Query(None, description="Only sessions with an ID above this one (the last session ID of the previous page)"),
+    db: AsyncSession = Depends(get_async_db)
+):
     """Get billing information for the authenticated user"""
     # Validate token
     try:
@@ -47,67 +42,23 @@ async def get_user_billing(request: Request, db: Session = Depends(get_db)):
     user_id: int = user_info.get("sub")
     
     # Get username
-    username = DbUtils.get_username(db, user_id)
+    username = await DbUtils.get_username(db, user_id)
     if not username:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
     
-    # Get all stopped sessions for this user
-    sessions = db.query(ParkingSession).filter(
-        ParkingSession.username == username,
-        ParkingSession.stopped != None
-    ).all()
-    
-    billing_data = []
-    
-    for session in sessions:
-        # Get parking lot info
-        parking_lot = db.query(ParkingLot).filter(
-            ParkingLot.id == session.parking_lot_id
-        ).first()
-        
-        if not parking_lot:
-            continue
-        
-        # Calculate payment info
-        transaction_hash = PaymentUtils.generate_payment_hash(session.id, session.license_plate)
-        amount_paid = PaymentUtils.check_payment_amount(transaction_hash, db)
-        
-        # Calculate hours and days
-        duration_minutes = session.duration_minutes or 0
-        hours = duration_minutes / 60
-        days = int(duration_minutes / (60 * 24))
-        
-        billing_data.append({
-            "session": {
-                "license_plate": session.license_plate,
-                "started": session.started,
-                "stopped": session.stopped,
-                "hours": hours,
-                "days": days
-            },
-            "parking": {
-                "name": parking_lot.name,
-                "location": parking_lot.location,
-                "tariff": parking_lot.tariff,
-                "daytariff": parking_lot.daytariff
-            },
-            "amount": session.cost or 0,
-            "thash": transaction_hash,
-            "payed": amount_paid,
-            "balance": (session.cost or 0) - amount_paid
-        })
-    
-    return billing_data
+    return await BillingUtils.get_billing(db, username, limit, after)
 
 
 @router.get("/{username}", response_model=List[BillingResponse])
 async def get_user_billing_by_username(
     username: str,
     request: Request,
-    db: Session = Depends(get_db)
+    limit: Optional[int] = Query(None, description="Limit the amount of results", ge=1),
+    after: Optional[int] = Query(None, description="Only sessions with an ID above this one (the last session ID of the previous page)"),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get billing information for a specific user (admin only)"""
     # Validate token
@@ -138,50 +89,4 @@ async def get_user_billing_by_username(
             detail="Access denied"
         )
     
-    # Get all stopped sessions for specified user
-    sessions = db.query(ParkingSession).filter(
-        ParkingSession.username == username,
-        ParkingSession.stopped != None
-    ).all()
-    
-    billing_data = []
-    
-    for session in sessions:
-        # Get parking lot info
-        parking_lot = db.query(ParkingLot).filter(
-            ParkingLot.id == session.parking_lot_id
-        ).first()
-        
-        if not parking_lot:
-            continue
-        
-        # Calculate payment info
-        transaction_hash = PaymentUtils.generate_payment_hash(session.id, session.license_plate)
-        amount_paid = PaymentUtils.check_payment_amount(transaction_hash, db)
-        
-        # Calculate hours and days
-        duration_minutes = session.duration_minutes or 0
-        hours = duration_minutes / 60
-        days = int(duration_minutes / (60 * 24))
-        
-        billing_data.append({
-            "session": {
-                "license_plate": session.license_plate,
-                "started": session.started,
-                "stopped": session.stopped,
-                "hours": hours,
-                "days": days
-            },
-            "parking": {
-                "name": parking_lot.name,
-                "location": parking_lot.location,
-                "tariff": parking_lot.tariff,
-                "daytariff": parking_lot.daytariff
-            },
-            "amount": session.cost or 0,
-            "thash": transaction_hash,
-            "payed": amount_paid,
-            "balance": (session.cost or 0) - amount_paid
-        })
-    
-    return billing_data
\ No newline at end of file
+    return await BillingUtils.get_billing(db, username, limit, after)
\ No newline at end of file
@@ -5,6 +5,7 @@ from pydantic import BaseModel
 
 
 class SessionInfo(BaseModel):
+    id: int
     license_plate: str
     started: datetime
     stopped: Optional[datetime]
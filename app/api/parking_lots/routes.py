@@ -1,29 +1,40 @@
-from datetime import datetime
-from typing import List, Optional
+import json
+import math
+import operator
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import AsyncIterator, List, Optional
 
-from fastapi import APIRouter, Request, Query, HTTPException, status
+from anyio import to_thread
+from fastapi import APIRouter, Request, Response, Query, HTTPException, status
 from fastapi.params import Depends
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 
 from app.util.jwt_authenticator import JWTAuthenticator, TokenMissingError, TokenInvalidError, TokenExpiredError
-from app.api.parking_lots.schemas import ParkingLotsResponse, CreateParkingLotBody, UpdateParkingLotBody
-from app.db.database import SessionLocal
+from app.api.parking_lots.schemas import ParkingLotsResponse, CreateParkingLotBody, UpdateParkingLotBody, \
+    TariffSimulationBody, TariffSimulationResponse, NearbyParkingLotResponse, ParkingLotOccupancyResponse, \
+    ParkingLotSearchResponse
+from app.core.config import settings
+from app.db.database import get_db, SessionLocal
 from app.db.models.parking_lot import ParkingLot
+from app.db.models.parking_lot_occupancy import ParkingLotOccupancy
+from app.util.lot_catalogue import LotCatalogue
+from app.util.lot_listing_index import LotListingIndex
+from app.util.lot_occupancy import LotOccupancy
+from app.util.lot_search import LotSearch
+from app.util.lot_spatial_index import LotSpatialIndex
+from app.util.occupancy_broadcaster import OccupancyBroadcaster
+from app.util.pricing_utils import PricingUtils
 
 router = APIRouter(prefix="/parking_lots", tags=["Parking lots"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 class ParkingLotsService:
     @staticmethod
     def get_all_parking_lots(
             db: Session,
             limit: Optional[int] = None,
+            after: Optional[int] = None,
             parking_lot_id: Optional[int] = None,
             parking_lot_name: Optional[str] = None,
             parking_lot_location: Optional[str] = None,
@@ -32,36 +43,131 @@ class ParkingLotsService:
             parking_lot_reserved: Optional[int] = None,
             parking_lot_tariff: Optional[float] = None,
             parking_lot_daytariff: Optional[str] = None,
-            parking_lot_creation_date: Optional[datetime] = None
-    ):
-        query = db.query(ParkingLot)
+            parking_lot_creation_date: Optional[datetime] = None,
+            tariff_gte: Optional[float] = None,
+            tariff_lte: Optional[float] = None,
+            capacity_gte: Optional[int] = None,
+            capacity_lte: Optional[int] = None,
+            created_after: Optional[date] = None,
+            created_before: Optional[date] = None
+    ) -> list[ParkingLot]:
+        """The parking lots matching every filter, ordered by ID, starting after the given ID"""
+        # Served from the catalogue in memory, lots change rarely
+        version, parking_lots = LotCatalogue.snapshot(db)
+        columns = LotListingIndex.current(parking_lots.values(), version)
+
+        conditions = []
         if parking_lot_id:
-            query = query.filter(ParkingLot.id == parking_lot_id)
-        if parking_lot_name:
-            query = query.filter(ParkingLot.name == parking_lot_name)
-        if parking_lot_location:
-            query = query.filter(ParkingLot.location == parking_lot_location)
-        if parking_lot_address:
-            query = query.filter(ParkingLot.address == parking_lot_address)
+            conditions.append(("id", operator.eq, parking_lot_id))
         if parking_lot_capacity:
-            query = query.filter(ParkingLot.capacity == parking_lot_capacity)
+            conditions.append(("capacity", operator.eq, ParkingLotsService.to_number(parking_lot_capacity)))
         if parking_lot_reserved:
-            query = query.filter(ParkingLot.reserved == parking_lot_reserved)
+            conditions.append(("reserved", operator.eq, parking_lot_reserved))
         if parking_lot_tariff:
-            query = query.filter(ParkingLot.tariff == parking_lot_tariff)
+            conditions.append(("tariff", operator.eq, parking_lot_tariff))
         if parking_lot_daytariff:
-            query = query.filter(ParkingLot.daytariff == parking_lot_daytariff)
+            conditions.append(("daytariff", operator.eq, ParkingLotsService.to_number(parking_lot_daytariff)))
         if parking_lot_creation_date:
-            query = query.filter(ParkingLot.created_at == parking_lot_creation_date)
+            conditions.append(("created_at", operator.eq, parking_lot_creation_date.date()))
+        for column, compare, value in [
+            ("tariff", operator.ge, tariff_gte), ("tariff", operator.le, tariff_lte),
+            ("capacity", operator.ge, capacity_gte), ("capacity", operator.le, capacity_lte),
+            ("created_at", operator.gt, created_after), ("created_at", operator.lt, created_before)
+        ]:
+            if value is not None:
+                conditions.append((column, compare, value))
+
+        matching = (parking_lots[int(lot_id)] for lot_id in LotListingIndex.select(columns, conditions, after))
+        # The text filters are checked one lot at a time, stopping once the page is full
+        if parking_lot_name:
+            matching = (lot for lot in matching if lot.name == parking_lot_name)
+        if parking_lot_location:
+            matching = (lot for lot in matching if lot.location == parking_lot_location)
+        if parking_lot_address:
+            matching = (lot for lot in matching if lot.address == parking_lot_address)
+        return list(islice(matching, limit))
+
+    @staticmethod
+    def available(parking_lot: ParkingLot, occupied: int) -> int:
+        """The spots of a parking lot that are neither reserved nor occupied"""
+        return max(parking_lot.capacity - parking_lot.reserved - occupied, 0)
+
+    @staticmethod
+    def describe(parking_lot: ParkingLot, occupied: int) -> dict:
+        """A parking lot's columns with its occupancy, as ParkingLotsResponse expects them"""
+        return {
+            **{column.name: getattr(parking_lot, column.name) for column in ParkingLot.__table__.columns},
+            "occupied": occupied,
+            "available": ParkingLotsService.available(parking_lot, occupied)
+        }
+
+    @staticmethod
+    def occupancy_event(parking_lot_id: int, occupied: int) -> str:
+        """A server-sent event with a parking lot's occupancy, available is null for lots the catalogue doesn't have yet"""
+        parking_lot = LotCatalogue.get(parking_lot_id)
+        data = {
+            "parking_lot_id": parking_lot_id,
+            "occupied": occupied,
+            "available": ParkingLotsService.available(parking_lot, occupied) if parking_lot is not None else None
+        }
+        return f"event: occupancy\ndata: {json.dumps(data)}\n\n"
+
+    @staticmethod
+    def load_occupancy():
+        """Loads the catalogue and the occupancy counters if they haven't been yet, runs in the threadpool"""
+        with SessionLocal() as db:
+            LotCatalogue.all(db)
+            LotOccupancy.snapshot(db)
+
+    @staticmethod
+    async def stream_occupancy(parking_lot_ids: Optional[set[int]]) -> AsyncIterator[str]:
+        """
+        Yields the current occupancy of the parking lots, then every change to it as server-sent events.
+        A client that reads slowly only gets the latest count of each lot, see OccupancyBroadcaster.
+        """
+        if LotOccupancy.occupied is None:
+            await to_thread.run_sync(ParkingLotsService.load_occupancy)
+
+        # Subscribed right before the snapshot is copied, so every later change is pending on the subscription.
+        # The copy is needed: each yield hands control back to the event loop, where counters keep changing
+        subscription = OccupancyBroadcaster.subscribe(parking_lot_ids)
+        try:
+            occupied = dict(LotOccupancy.occupied or {})
+            for parking_lot_id, count in occupied.items():
+                if parking_lot_ids is None or parking_lot_id in parking_lot_ids:
+                    yield ParkingLotsService.occupancy_event(parking_lot_id, count)
 
-        if limit:
-            return query.order_by(ParkingLot.id).limit(limit).all()
-        return query.order_by(ParkingLot.id).all()
+            while True:
+                changes = await subscription.next(settings.OCCUPANCY_STREAM_KEEPALIVE_SECONDS)
+                if not changes:
+                    yield ": keep-alive\n\n"
+                for parking_lot_id, count in changes.items():
+                    yield ParkingLotsService.occupancy_event(parking_lot_id, count)
+        finally:
+            OccupancyBroadcaster.unsubscribe(subscription)
+
+    @staticmethod
+    def to_number(wanted: str) -> float:
+        """A numeric filter given as text, text that isn't a number matches nothing, the way SQLite did when the filter was a query"""
+        try:
+            return float(wanted)
+        except ValueError:
+            return math.nan
+
+    @staticmethod
+    def project(parking_lot: ParkingLot, occupied: int, fields: list[str]) -> dict:
+        """The requested fields of a parking lot, serialized as ParkingLotsResponse does"""
+        return ParkingLotsResponse.model_validate(
+            ParkingLotsService.describe(parking_lot, occupied)
+        ).model_dump(mode="json", include=set(fields))
 
 @router.get("/", response_model=List[ParkingLotsResponse])
-async def get_parking_lots(
+def get_parking_lots(
         request: Request,
+        response: Response,
         limit: Optional[int] = Query(None, description="Limit the amount of results", ge=1),
+        after: Optional[int] = Query(None, description="Only parking lots with an ID above this one (the X-Next-Cursor header of the previous page)"),
+        fields: Optional[str] = Query(None, description="Only return these comma separated fields, e.g. id,name,coordinates_lat,coordinates_lng (the ID is always returned)"),
         parking_lot_id: Optional[int] = Query(None, description="Filter by parking lot ID"),
         parking_lot_name: Optional[str] = Query(None, description="Filter by parking lot name"),
         parking_lot_location: Optional[str] = Query(None, description="Filter by parking lot location"),
@@ -71,8 +177,73 @@ async def get_parking_lots(
         parking_lot_tariff: Optional[float] = Query(None, description="Filter by parking lot tariff"),
         parking_lot_daytariff: Optional[str] = Query(None, description="Filter by parking lot day tariff"),
         parking_lot_creation_date: Optional[datetime] = Query(None, description="Filter by parking lot creation date (YYYY-MM-DD)"),
+        tariff_gte: Optional[float] = Query(None, description="Only parking lots with at least this tariff"),
+        tariff_lte: Optional[float] = Query(None, description="Only parking lots with at most this tariff"),
+        capacity_gte: Optional[int] = Query(None, description="Only parking lots with at least this capacity"),
+        capacity_lte: Optional[int] = Query(None, description="Only parking lots with at most this capacity"),
+        created_after: Optional[date] = Query(None, description="Only parking lots created after this day (YYYY-MM-DD)"),
+        created_before: Optional[date] = Query(None, description="Only parking lots created before this day (YYYY-MM-DD)"),
+        db: Session = Depends(get_db)
+):
+    """List parking lots ordered by ID, a page at a time when a limit is given"""
+    # Validate token
+    try:
+        user_info: dict = JWTAuthenticator.validate_token(request.headers.get("Authorization"))
+    except TokenMissingError as e:
+        raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=str(e)
+            )
+    except TokenInvalidError as e:
+        raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=str(e)
+            )
+    except TokenExpiredError as e:
+        raise HTTPException(
+            status_code=498,
+            detail=str(e)
+        )
+
+    if fields is not None:
+        fields = ["id"] + [field.strip() for field in fields.split(",") if field.strip() and field.strip() != "id"]
+        unknown = [field for field in fields if field not in ParkingLotsResponse.model_fields]
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown fields: {', '.join(unknown)}"
+            )
+
+    parking_lots = ParkingLotsService.get_all_parking_lots(
+        db, limit, after, parking_lot_id, parking_lot_name, parking_lot_location, parking_lot_address, parking_lot_capacity,
+        parking_lot_reserved, parking_lot_tariff, parking_lot_daytariff, parking_lot_creation_date,
+        tariff_gte, tariff_lte, capacity_gte, capacity_lte, created_after, created_before
+    )
+    occupied = LotOccupancy.snapshot(db)
+
+    # A full page may be followed by another one
+    headers = {"X-Next-Cursor": str(parking_lots[-1].id)} if limit and len(parking_lots) == limit else {}
+    response.headers.update(headers)
+
+    if fields is None:
+        return [ParkingLotsService.describe(parking_lot, occupied.get(parking_lot.id, 0)) for parking_lot in parking_lots]
+    # A subset of ParkingLotsResponse doesn't validate against it, so the projection skips the response model
+    return JSONResponse(
+        [ParkingLotsService.project(parking_lot, occupied.get(parking_lot.id, 0), fields) for parking_lot in parking_lots],
+        headers=headers
+    )
+
+@router.get("/nearby", response_model=List[NearbyParkingLotResponse])
+def get_nearby_parking_lots(
+        request: Request,
+        lat: float = Query(..., description="Latitude of the point to search around", ge=-90, le=90),
+        lng: float = Query(..., description="Longitude of the point to search around", ge=-180, le=180),
+        radius_km: Optional[float] = Query(None, description="Only parking lots within this distance in km", gt=0, le=20_000),
+        limit: int = Query(10, description="The amount of nearest parking lots to return", ge=1, le=1000),
+        min_available: Optional[int] = Query(None, description="Only parking lots with at least this many free spots", ge=1),
         db: Session = Depends(get_db)
 ):
+    """Find the parking lots nearest to a point, nearest first"""
     # Validate token
     try:
         user_info: dict = JWTAuthenticator.validate_token(request.headers.get("Authorization"))
@@ -92,12 +263,133 @@ async def get_parking_lots(
             detail=str(e)
         )
 
-    return ParkingLotsService.get_all_parking_lots(db, limit, parking_lot_id, parking_lot_name, parking_lot_location,
-                                                   parking_lot_address, parking_lot_capacity, parking_lot_reserved,
-                                                   parking_lot_tariff, parking_lot_daytariff, parking_lot_creation_date)
+    version, parking_lots = LotCatalogue.snapshot(db)
+    grid = LotSpatialIndex.current(parking_lots.values(), version)
+    occupied = LotOccupancy.snapshot(db)
+
+    accept = None
+    if min_available:
+        accept = lambda parking_lot_id: ParkingLotsService.available(
+            parking_lots[parking_lot_id], occupied.get(parking_lot_id, 0)
+        ) >= min_available
+
+    return [
+        {
+            **ParkingLotsService.describe(parking_lots[parking_lot_id], occupied.get(parking_lot_id, 0)),
+            "distance_km": distance
+        }
+        for parking_lot_id, distance in LotSpatialIndex.nearest(grid, lat, lng, limit, radius_km, accept)
+    ]
+
+@router.get("/search", response_model=List[ParkingLotSearchResponse])
+def search_parking_lots(
+        request: Request,
+        q: str = Query(..., description="Words the name, location or address start with, e.g. part of an address", min_length=1, max_length=200),
+        limit: int = Query(20, description="The amount of parking lots to return", ge=1, le=100),
+        db: Session = Depends(get_db)
+):
+    """Search parking lots by name, location and address, best match first"""
+    # Validate token
+    try:
+        user_info: dict = JWTAuthenticator.validate_token(request.headers.get("Authorization"))
+    except TokenMissingError as e:
+        raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=str(e)
+            )
+    except TokenInvalidError as e:
+        raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=str(e)
+            )
+    except TokenExpiredError as e:
+        raise HTTPException(
+            status_code=498,
+            detail=str(e)
+        )
+
+    matches = LotSearch.search(db, q, limit)
+    occupied = LotOccupancy.snapshot(db)
+    found = []
+    for parking_lot_id, score in matches:
+        # Another worker's new lot may not be in the catalogue yet
+        parking_lot: ParkingLot | None = LotCatalogue.get(parking_lot_id) or db.get(ParkingLot, parking_lot_id)
+        if parking_lot is not None:
+            found.append({**ParkingLotsService.describe(parking_lot, occupied.get(parking_lot_id, 0)), "score": score})
+    return found
+
+@router.get("/{parking_lot_id}/occupancy", response_model=ParkingLotOccupancyResponse)
+def get_parking_lot_occupancy(parking_lot_id: int, request: Request, db: Session = Depends(get_db)):
+    """Get how many spots of a parking lot are occupied and available right now"""
+    # Validate token
+    try:
+        user_info: dict = JWTAuthenticator.validate_token(request.headers.get("Authorization"))
+    except TokenMissingError as e:
+        raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=str(e)
+            )
+    except TokenInvalidError as e:
+        raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=str(e)
+            )
+    except TokenExpiredError as e:
+        raise HTTPException(
+            status_code=498,
+            detail=str(e)
+        )
+
+    parking_lot: ParkingLot | None = LotCatalogue.get(parking_lot_id) or db.get(ParkingLot, parking_lot_id)
+    if parking_lot is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Parking lot with ID {parking_lot_id} not found."
+        )
+
+    occupied = LotOccupancy.snapshot(db).get(parking_lot_id, 0)
+    return {
+        "parking_lot_id": parking_lot_id,
+        "capacity": parking_lot.capacity,
+        "reserved": parking_lot.reserved,
+        "occupied": occupied,
+        "available": ParkingLotsService.available(parking_lot, occupied)
+    }
+
+@router.get("/occupancy/stream")
+async def stream_parking_lot_occupancy(
+        request: Request,
+        parking_lot_id: Optional[List[int]] = Query(None, description="Only stream these parking lots, repeat it for several")
+):
+    """Stream the occupancy of the parking lots as server-sent events: the current counts first, then every change"""
+    # Validate token
+    try:
+        user_info: dict = JWTAuthenticator.validate_token(request.headers.get("Authorization"))
+    except TokenMissingError as e:
+        raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=str(e)
+            )
+    except TokenInvalidError as e:
+        raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=str(e)
+            )
+    except TokenExpiredError as e:
+        raise HTTPException(
+            status_code=498,
+            detail=str(e)
+        )
+
+    return StreamingResponse(
+        ParkingLotsService.stream_occupancy(set(parking_lot_id) if parking_lot_id else None),
+        media_type="text/event-stream",
+        # Proxies mustn't cache or buffer the events
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
-async def create_parking_lot(request: Request, body: CreateParkingLotBody, db: Session = Depends(get_db)):
+def create_parking_lot(request: Request, body: CreateParkingLotBody, db: Session = Depends(get_db)):
     # Validate token
     try:
         user_info: dict = JWTAuthenticator.validate_token(request.headers.get("Authorization"))
@@ -139,12 +431,16 @@ async def create_parking_lot(request: Request, body: CreateParkingLotBody, db: S
     )
 
     db.add(parking_lot)
+    db.flush()
+    db.add(ParkingLotOccupancy(parking_lot_id=parking_lot.id, occupied=0, updated_at=datetime.now()))
+    LotCatalogue.bump_version(db)
     db.commit()
+    LotCatalogue.refresh(db)
 
     return { "message": "Parking lot created successfully" }
 
 @router.put("/{parking_lot_id}", status_code=status.HTTP_200_OK)
-async def update_parking_lot(parking_lot_id: int, request: Request, body: Optional[UpdateParkingLotBody], db: Session = Depends(get_db)):
+def update_parking_lot(parking_lot_id: int, request: Request, body: Optional[UpdateParkingLotBody], db: Session = Depends(get_db)):
     # Validate token
     try:
         user_info: dict = JWTAuthenticator.validate_token(request.headers.get("Authorization"))
@@ -204,11 +500,64 @@ async def update_parking_lot(parking_lot_id: int, request: Request, body: Option
     if body.coordinates_lat:
         parking_lot.coordinates_lat = body.coordinates_lat
 
+    LotCatalogue.bump_version(db)
     db.commit()
+    LotCatalogue.refresh(db)
     return {"message": "Parking lot updated successfully"}
 
+@router.post("/{parking_lot_id}/tariff_simulation", response_model=TariffSimulationResponse, status_code=status.HTTP_200_OK)
+def simulate_tariff(parking_lot_id: int, request: Request, body: TariffSimulationBody, db: Session = Depends(get_db)):
+    """Replay the recent sessions of a parking lot under proposed tariffs, to see how revenue would shift (admin only)"""
+    # Validate token
+    try:
+        user_info: dict = JWTAuthenticator.validate_token(request.headers.get("Authorization"))
+    except TokenMissingError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e)
+        )
+    except TokenInvalidError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e)
+        )
+    except TokenExpiredError as e:
+        raise HTTPException(
+            status_code=498,
+            detail=str(e)
+        )
+
+    role: str = user_info.get("role")
+
+    if role.lower() != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User is not admin"
+        )
+
+    parking_lot: ParkingLot | None = db.get(ParkingLot, parking_lot_id)
+    if parking_lot is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Parking lot with ID {parking_lot_id} not found."
+        )
+
+    tariff = parking_lot.tariff if body.tariff is None else body.tariff
+    daytariff = parking_lot.daytariff if body.daytariff is None else body.daytariff
+    since = datetime.now() - timedelta(days=body.days)
+
+    return {
+        "parking_lot_id": parking_lot.id,
+        "since": since,
+        "current_tariff": parking_lot.tariff,
+        "current_daytariff": parking_lot.daytariff,
+        "proposed_tariff": tariff,
+        "proposed_daytariff": daytariff,
+        **PricingUtils.simulate_tariff(db, parking_lot, tariff, daytariff, since)
+    }
+
 @router.delete("/{parking_lot_id}", status_code=status.HTTP_200_OK)
-async def delete_parking_lot(parking_lot_id: int, request: Request, db: Session = Depends(get_db)):
+def delete_parking_lot(parking_lot_id: int, request: Request, db: Session = Depends(get_db)):
     # Validate token
     try:
         user_info: dict = JWTAuthenticator.validate_token(request.headers.get("Authorization"))
@@ -241,6 +590,9 @@ async def delete_parking_lot(parking_lot_id: int, request: Request, db: Session
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Parking lot with ID {parking_lot_id} not found."
         )
+    db.query(ParkingLotOccupancy).filter(ParkingLotOccupancy.parking_lot_id == parking_lot_id).delete()
 
+    LotCatalogue.bump_version(db)
     db.commit()
+    LotCatalogue.refresh(db)
     return {"message": "Parking lot deleted successfully"}
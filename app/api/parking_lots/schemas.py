@@ -1,7 +1,7 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class ParkingLotsResponse(BaseModel):
@@ -16,10 +16,27 @@ class ParkingLotsResponse(BaseModel):
     created_at: datetime
     coordinates_lat: float
     coordinates_lng: float
+    # Active sessions, and the spots neither reserved nor occupied
+    occupied: int
+    available: int
 
     class Config:
         from_attributes = True
 
+class NearbyParkingLotResponse(ParkingLotsResponse):
+    distance_km: float
+
+class ParkingLotSearchResponse(ParkingLotsResponse):
+    # Relevance of the match, higher is better
+    score: float
+
+class ParkingLotOccupancyResponse(BaseModel):
+    parking_lot_id: int
+    capacity: int
+    reserved: int
+    occupied: int
+    available: int
+
 class CreateParkingLotBody(BaseModel):
     name: str
     location: str
@@ -41,3 +58,33 @@ class UpdateParkingLotBody(BaseModel):
     daytariff: Optional[int] = None
     coordinates_lat: Optional[float] = None
     coordinates_lng: Optional[float] = None
+
+class TariffSimulationBody(BaseModel):
+    # Left out tariffs keep their current value
+    tariff: Optional[float] = Field(None, ge=0)
+    daytariff: Optional[int] = Field(None, ge=0)
+    days: int = Field(30, ge=1, le=3650, description="Replay the sessions started in this many past days")
+
+class DurationRevenue(BaseModel):
+    duration: str
+    sessions: int
+    current_revenue: float
+    proposed_revenue: float
+    revenue_delta: float
+
+class TariffSimulationResponse(BaseModel):
+    parking_lot_id: int
+    since: datetime
+    current_tariff: float
+    current_daytariff: int
+    proposed_tariff: float
+    proposed_daytariff: int
+    sessions: int
+    current_revenue: float
+    proposed_revenue: float
+    revenue_delta: float
+    revenue_delta_percent: Optional[float]
+    sessions_cheaper: int
+    sessions_unchanged: int
+    sessions_pricier: int
+    by_duration: List[DurationRevenue]
@@ -1,36 +1,40 @@
-from datetime import datetime
+from datetime import datetime, date as Date
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, Query
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.api.parking_sessions.schemas import ParkingSessionResponse
-from app.db.database import SessionLocal
-from app.db.models.parking_lot import ParkingLot
+from app.api.parking_sessions.schemas import ParkingSessionResponse, ParkingSessionQuoteResponse, GateEventsRequest, \
+    GateEventsResponse
+from app.db.database import get_async_db
 from app.db.models.parking_session import ParkingSession
+from app.db.write_queue import write_queue
+from app.util.active_session_index import ActiveSessionIndex
 from app.util.db_utils import DbUtils
+from app.util.gate_event_utils import GateEventUtils
 from app.util.jwt_authenticator import JWTAuthenticator, TokenMissingError, TokenInvalidError, TokenExpiredError
+from app.util.lot_catalogue import LotCatalogue
+from app.util.lot_occupancy import LotOccupancy
 from app.util.parking_session_utils import ParkingSessionService
 
 router = APIRouter(prefix="/parking_sessions", tags=["parking_sessions"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.get("/", response_model=List[ParkingSessionResponse])
 async def get_parking_sessions(
         request: Request,
-        limit: Optional[int] = Query(None, description="Limit the amount of results", ge=1),
+        response: Response,
+        limit: int = Query(100, description="Limit the amount of results", ge=1, le=1000),
         parking_lot_id: Optional[int] = Query(None, description="Filter by parking lot ID"),
         license_plate: Optional[str] = Query(None, description="Filter by license plate"),
-        date: Optional[datetime] = Query(None, description="Filter by date (YYYY-MM-DD)"),
+        date: Optional[Date] = Query(None, description="Filter by the day the session started (YYYY-MM-DD)"),
         search_username: Optional[str] = Query(None, description="Filter by username"),
-        db: Session = Depends(get_db)
+        started_from: Optional[datetime] = Query(None, description="Filter by sessions started at or after this moment"),
+        started_until: Optional[datetime] = Query(None, description="Filter by sessions started before this moment"),
+        cursor: Optional[str] = Query(None, description="The X-Next-Cursor header of the previous page"),
+        db: AsyncSession = Depends(get_async_db)
 ):
+    """Search parking sessions, newest first, a page at a time (users only see their own sessions)"""
     # Validate token
     try:
         user_info: dict = JWTAuthenticator.validate_token(request.headers.get("Authorization"))
@@ -52,18 +56,22 @@ async def get_parking_sessions(
 
     user_id: int = user_info.get("sub")
     role: str = user_info.get("role")
-    username = DbUtils.get_username(db, user_id)
+    username = await DbUtils.get_username(db, user_id)
 
     # Return sessions based on role
     if role.lower() == "admin":
-        sessions = ParkingSessionService.get_all_sessions(
-            db, limit, parking_lot_id, license_plate, date, search_username
+        sessions = await ParkingSessionService.get_all_sessions(
+            db, limit, parking_lot_id, license_plate, date, search_username, started_from, started_until, cursor
         )
     else:
-        sessions = ParkingSessionService.get_user_sessions(
-            db, username, limit, parking_lot_id, license_plate, date, search_username
+        sessions = await ParkingSessionService.get_user_sessions(
+            db, username, limit, parking_lot_id, license_plate, date, search_username, started_from, started_until, cursor
         )
 
+    # A full page may be followed by another one
+    if len(sessions) == limit:
+        response.headers["X-Next-Cursor"] = ParkingSessionService.encode_cursor(sessions[-1])
+
     return sessions
 
 @router.post("/start/{parking_lot_id}/{license_plate}", response_model=ParkingSessionResponse, status_code=status.HTTP_201_CREATED)
@@ -71,7 +79,7 @@ async def start_parking_session(
         parking_lot_id: int,
         license_plate: str,
         request: Request,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     # Validate token
     try:
@@ -96,64 +104,62 @@ async def start_parking_session(
     role: str = user_info.get("role")
 
 
+    # Look up the parking lot and the owner of the plate in one go
+    context = await ParkingSessionService.get_start_context(db, parking_lot_id, license_plate, user_id)
+
     # Check if parking lot exists
-    parking_lot = db.query(ParkingLot).filter(ParkingLot.id == parking_lot_id).first()
-    if not parking_lot:
+    if context.lot_exists is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Parking lot with ID {parking_lot_id} not found"
         )
-    
-    # Check if there's already an active session for this license plate
-    if ParkingSessionService.check_active_session(db, license_plate):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="An active parking session already exists for this license plate"
-        )
 
-    username = ParkingSessionService.get_username(db, user_id) or "guest"
+    username = context.username or "guest"
     
     # Skip verification if user is admin
     if not role.lower() == "admin":
-        # Check if license plate is registered to an account
-        registered_user = ParkingSessionService.get_user_by_license_plate(db, license_plate)
-        
         # If license plate is registered to a user, verify
-        if registered_user:
+        if context.owner:
             if not request.headers.get("Authorization"):
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
                     detail=f"This license plate is registered to another user. You cannot start a session for it."
                 )
-            if username != registered_user.username:
+            if username != context.owner:
                 raise HTTPException(
                     status_code=status.HTTP_403_FORBIDDEN,
                     detail=f"This license plate is registered to another user. You cannot start a session for it."
                 )
 
     # Create new parking session
-    new_session = ParkingSession(
-        parking_lot_id=parking_lot_id,
-        license_plate=license_plate,
-        username=username,
-        started=datetime.now(),
-        stopped=None,
-        duration_minutes=None,
-        cost=None,
-        payment_status="ongoing"
-    )
+    values = {
+        "parking_lot_id": parking_lot_id,
+        "license_plate": license_plate,
+        "username": username,
+        "started": datetime.now(),
+        "stopped": None,
+        "duration_minutes": None,
+        "cost": None,
+        "payment_status": "ongoing"
+    }
     
-    db.add(new_session)
-    db.commit()
-    db.refresh(new_session)
-
+    # The unique index on active sessions rejects a plate that's already parked, even when two gates race
+    try:
+        new_session = await write_queue.run(lambda writer: ParkingSessionService.insert_session(writer, values))
+    except IntegrityError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="An active parking session already exists for this license plate"
+        )
+    ActiveSessionIndex.add(new_session, user_id if context.username else None)
+    LotOccupancy.change(new_session.parking_lot_id, 1)
     return new_session
 
 @router.post("/stop/{license_plate}", response_model=ParkingSessionResponse, status_code=status.HTTP_200_OK)
 async def stop_parking_session(
         license_plate: str,
         request: Request,
-        db: Session = Depends(get_db)):
+        db: AsyncSession = Depends(get_async_db)):
     # Validate token
     try:
         user_info: dict = JWTAuthenticator.validate_token(request.headers.get("Authorization"))
@@ -177,10 +183,7 @@ async def stop_parking_session(
     role: str = user_info.get("role")
     
     # Find active parking session
-    active_session = db.query(ParkingSession).filter(
-        ParkingSession.license_plate == license_plate,
-        ParkingSession.stopped == None
-    ).first()
+    active_session = await ActiveSessionIndex.find(db, license_plate)
     
     if not active_session:
         raise HTTPException(
@@ -191,7 +194,7 @@ async def stop_parking_session(
     # Try to get username and role from token (optional)
     # token = request.headers.get("Authorization")
 
-    username = DbUtils.get_username(db, user_id) or None
+    username = await DbUtils.get_username(db, user_id) or None
     
     # Skip verification if user is admin
     if not role.lower() == "admin":
@@ -209,15 +212,140 @@ async def stop_parking_session(
                     detail="You can only stop your own parking sessions"
                 )
 
-    # Stop the session
-    active_session.stopped = datetime.now()
-    active_session.duration_minutes = int((active_session.stopped - active_session.started).total_seconds() / 60)
-    
-    # Calculate cost based on duration and parking lot rates
-    active_session.cost = ParkingSessionService.calculate_price(DbUtils.get_parking_lot_by_id(db, active_session.parking_lot_id), active_session)
-    active_session.payment_status = "pending"
-    
-    db.commit()
-    db.refresh(active_session)
+    parking_lot = LotCatalogue.get(active_session.parking_lot_id) \
+        or await DbUtils.get_parking_lot_by_id(db, active_session.parking_lot_id)
+
+    # Stop the session through the write queue, or the plate's current one when another worker stopped it already
+    try:
+        session = await write_queue.run(
+            lambda writer: ParkingSessionService.stop_session(writer, active_session.id, parking_lot, datetime.now(), license_plate)
+        )
+    finally:
+        # Stopped now, or already stopped by someone else
+        ActiveSessionIndex.remove(license_plate, active_session.id)
+    if session.id != active_session.id:
+        ActiveSessionIndex.stale += 1
+        ActiveSessionIndex.remove(license_plate, session.id)
+    LotOccupancy.change(session.parking_lot_id, -1)
+    return session
+
+@router.get("/{license_plate}/quote", response_model=ParkingSessionQuoteResponse, status_code=status.HTTP_200_OK)
+async def quote_parking_session(
+        license_plate: str,
+        request: Request,
+        db: AsyncSession = Depends(get_async_db)):
+    """Get what the active parking session of a license plate would cost if it stopped now"""
+    # Validate token
+    try:
+        user_info: dict = JWTAuthenticator.validate_token(request.headers.get("Authorization"))
+    except TokenMissingError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e)
+        )
+    except TokenInvalidError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e)
+        )
+    except TokenExpiredError as e:
+        raise HTTPException(
+            status_code=498,
+            detail=str(e)
+        )
+
+    user_id: int = user_info.get("sub")
+    role: str = user_info.get("role")
+
+    # The session and its parking lot both come from memory, quotes are polled while parked
+    active_session = await ActiveSessionIndex.find(db, license_plate)
+
+    if not active_session:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No active parking session found for this license plate"
+        )
+
+    # Same rules as stopping: guest sessions are anyone's, a user's sessions only their own. The index has the
+    # ID of the session's user, so the token is checked against it instead of looking up the caller's username
+    if not role.lower() == "admin" and active_session.username != "guest":
+        if active_session.user_id != user_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You can only quote your own parking sessions"
+            )
+
+    parking_lot = LotCatalogue.get(active_session.parking_lot_id) \
+        or await DbUtils.get_parking_lot_by_id(db, active_session.parking_lot_id)
+
+    quoted_at = datetime.now()
+    return {
+        "session_id": active_session.id,
+        "parking_lot_id": active_session.parking_lot_id,
+        "license_plate": license_plate,
+        "started": active_session.started,
+        "quoted_at": quoted_at,
+        "duration_minutes": int((quoted_at - active_session.started).total_seconds() / 60),
+        "tariff": parking_lot.tariff,
+        "daytariff": parking_lot.daytariff,
+        "cost": ParkingSessionService.calculate_price(
+            parking_lot, ParkingSession(started=active_session.started, stopped=quoted_at)
+        )
+    }
+
+@router.post("/gate_events", response_model=GateEventsResponse, status_code=status.HTTP_200_OK)
+async def post_gate_events(
+        body: GateEventsRequest,
+        request: Request):
+    """Apply a batch of entry and exit events from the gates, in order and in one transaction (admins only)"""
+    # Validate token
+    try:
+        user_info: dict = JWTAuthenticator.validate_token(request.headers.get("Authorization"))
+    except TokenMissingError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e)
+        )
+    except TokenInvalidError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(e)
+        )
+    except TokenExpiredError as e:
+        raise HTTPException(
+            status_code=498,
+            detail=str(e)
+        )
+
+    role: str = user_info.get("role")
+    if role.lower() != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+
+    events = [event.model_dump() for event in body.events]
+    results = await write_queue.run(lambda writer: GateEventUtils.apply_events(writer, events))
+
+    # Replayed in order, so a plate that entered and left again ends up out of the index
+    for result in results:
+        if result["status"] == "started":
+            ActiveSessionIndex.add(result["session"], result["user_id"])
+            LotOccupancy.change(result["session"].parking_lot_id, 1)
+        elif result["status"] == "stopped":
+            ActiveSessionIndex.remove(result["license_plate"], result["session"].id)
+            LotOccupancy.change(result["session"].parking_lot_id, -1)
 
-    return active_session
+    return {
+        "started": sum(result["status"] == "started" for result in results),
+        "stopped": sum(result["status"] == "stopped" for result in results),
+        "rejected": sum(result["status"] == "rejected" for result in results),
+        "results": [
+            {
+                **result,
+                "session_id": result["session"].id if result["session"] else None,
+                "cost": result["session"].cost if result["status"] == "stopped" else None
+            }
+            for result in results
+        ]
+    }
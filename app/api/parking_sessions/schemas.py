@@ -1,7 +1,7 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Literal, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 
 
 class ParkingSessionResponse(BaseModel):
@@ -14,6 +14,55 @@ class ParkingSessionResponse(BaseModel):
     duration_minutes: Optional[int]
     cost: Optional[float]
     payment_status: str
+    transaction_hash: Optional[str] = None
 
     class Config:
         from_attributes = True
+
+
+
+class ParkingSessionQuoteResponse(BaseModel):
+    session_id: int
+    parking_lot_id: int
+    license_plate: str
+    started: datetime
+    quoted_at: datetime
+    duration_minutes: int
+    tariff: float
+    daytariff: int
+    cost: float
+
+class GateEvent(BaseModel):
+    type: Literal["entry", "exit"]
+    parking_lot_id: int
+    license_plate: str
+    timestamp: datetime
+
+    @field_validator("timestamp")
+    @classmethod
+    def to_local_time(cls, timestamp: datetime) -> datetime:
+        """Sessions are stored in naive local time, timestamps with a timezone are converted to it"""
+        if timestamp.tzinfo is not None:
+            return timestamp.astimezone().replace(tzinfo=None)
+        return timestamp
+
+
+class GateEventsRequest(BaseModel):
+    events: List[GateEvent] = Field(min_length=1, max_length=10_000)
+
+
+class GateEventResult(BaseModel):
+    index: int
+    type: str
+    license_plate: str
+    status: str
+    session_id: Optional[int] = None
+    cost: Optional[float] = None
+    detail: Optional[str] = None
+
+
+class GateEventsResponse(BaseModel):
+    started: int
+    stopped: int
+    rejected: int
+    results: List[GateEventResult]
@@ -1,25 +1,21 @@
 from datetime import datetime
 
 from fastapi import APIRouter, Depends, HTTPException, status, Request
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.payments.schemas import PaymentCreate
-from app.db.database import SessionLocal
+from app.db.database import get_async_db
 from app.db.models.payment import Payment
+from app.db.write_queue import write_queue
 from app.util.jwt_authenticator import JWTAuthenticator, TokenMissingError, TokenInvalidError, TokenExpiredError
+from app.util.ledger_utils import LedgerUtils
 from app.util.payment_utils import PaymentUtils
 
 router = APIRouter(prefix="/payments", tags=["payments"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.get("/")
-async def get_payments(request: Request, db: Session = Depends(get_db)):
+async def get_payments(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Get all payments for the current user"""
     # Validate token
     try:
@@ -43,9 +39,9 @@ async def get_payments(request: Request, db: Session = Depends(get_db)):
     user_id: int = user_info.get("sub")
     
     # Get payments where user is the initiator
-    payments = db.query(Payment).filter(
-        Payment.initiator_id == user_id
-    ).all()
+    payments = (await db.scalars(
+        select(Payment).where(Payment.initiator_id == user_id)
+    )).all()
     
     return payments
 
@@ -53,7 +49,7 @@ async def get_payments(request: Request, db: Session = Depends(get_db)):
 async def get_payments_by_user(
     user_id: int,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all payments for a specific user (admin only)"""
     # Validate token
@@ -85,9 +81,9 @@ async def get_payments_by_user(
         )
     
     # Get payments for specified user
-    payments = db.query(Payment).filter(
-        Payment.initiator_id == user_id
-    ).all()
+    payments = (await db.scalars(
+        select(Payment).where(Payment.initiator_id == user_id)
+    )).all()
     
     return payments
 
@@ -96,7 +92,7 @@ async def get_payments_by_user(
 async def post_payment(
     body: PaymentCreate,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new payment transaction"""
     # Validate token
@@ -129,9 +125,7 @@ async def post_payment(
         hash=PaymentUtils.generate_transaction_validation_hash()
     )
     
-    db.add(payment)
-    db.commit()
-    db.refresh(payment)
+    payment = await write_queue.add(payment, then=LedgerUtils.record_payment)
     
     return {
         "payment": payment
@@ -4,22 +4,15 @@ from fastapi import APIRouter, HTTPException, Depends, status, Request, Body
 from sqlalchemy.orm import Session
 
 from app.api.profile.schemas import UpdateProfileBody
-from app.db.database import SessionLocal
+from app.db.database import get_db
 from app.util.jwt_authenticator import JWTAuthenticator, TokenMissingError, TokenInvalidError, TokenExpiredError
 
 from app.db.models.user import User
 
 router = APIRouter(prefix="/profile", tags=["Profile"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.put("/", status_code=status.HTTP_200_OK)
-async def update_profile(request: Request, body: Optional[UpdateProfileBody] = Body(None), db: Session = Depends(get_db)):
+def update_profile(request: Request, body: Optional[UpdateProfileBody] = Body(None), db: Session = Depends(get_db)):
     """
     Update Profile
     """
@@ -1,19 +1,29 @@
-from fastapi import APIRouter
+from typing import List, Optional
+
+from fastapi import APIRouter, Query, Response
 from fastapi import Depends
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
-from app.db.database import SessionLocal
-from app.db.models.user import User
+from app.api.users.schemas import UserSummaryResponse
+from app.db.database import get_db
+from app.util.user_utils import UserUtils
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
-@router.get("/")
-async def root(db: Session = Depends(get_db)):
-    return db.query(User).all()
+@router.get("/", response_model=List[UserSummaryResponse])
+def root(
+        response: Response,
+        limit: int = Query(100, description="Limit the amount of results", ge=1, le=1000),
+        after: Optional[int] = Query(None, description="Only users with an ID above this one (the X-Next-Cursor header of the previous page)"),
+        stream: bool = Query(False, description="Stream every user after `after` as newline delimited JSON, ignoring `limit`"),
+        db: Session = Depends(get_db)
+):
+    if stream:
+        return StreamingResponse(UserUtils.stream_users(after), media_type="application/x-ndjson")
+    users = db.execute(UserUtils.users_query(after, limit)).all()
+    # A full page may be followed by another one
+    if len(users) == limit:
+        response.headers["X-Next-Cursor"] = str(users[-1].id)
+    return users
@@ -0,0 +1,16 @@
+from datetime import date
+
+from pydantic import BaseModel
+
+
+class UserSummaryResponse(BaseModel):
+    id: int
+    username: str
+    name: str
+    email: str
+    role: str
+    created_at: date
+    active: bool
+
+    class Config:
+        from_attributes = True
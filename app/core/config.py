@@ -9,6 +9,53 @@ class Settings(BaseSettings):
     debug: bool = True
 
     DATABASE_URL: str = f"sqlite:///{BASE_DIR / 'database.db'}"
+    # Derived from DATABASE_URL (e.g. sqlite -> sqlite+aiosqlite) when not set
+    ASYNC_DATABASE_URL: str | None = None
+
+    # SQLite performance profile, applied to every new connection
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    # Negative values are in KiB, positive values in pages
+    SQLITE_CACHE_SIZE: int = -64 * 1024
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+
+    # Group commits of the write queue: at most this many jobs per transaction,
+    # waiting at most this long for more jobs to arrive once one is queued
+    WRITE_QUEUE_MAX_BATCH: int = 128
+    WRITE_QUEUE_MAX_WAIT_MS: float = 0
+
+    # Echo every statement to stdout, for local debugging only
+    SQL_ECHO: bool = False
+    # Statements slower than this are always logged, this fraction of the faster ones too
+    SLOW_QUERY_THRESHOLD_MS: float = 100
+    QUERY_LOG_SAMPLE_RATE: float = 0.0
+    # Number of distinct statement fingerprints to keep statistics for
+    QUERY_LOG_MAX_FINGERPRINTS: int = 1000
+    # Query budget per request: at most this many queries, and the same statement shape at most
+    # this many times (more usually means an N+1 loop). Exceeding it logs a warning, or raises
+    # QueryBudgetExceededError when strict (the test suite turns this on)
+    QUERY_BUDGET_PER_REQUEST: int = 30
+    QUERY_REPEAT_LIMIT: int = 5
+    QUERY_BUDGET_STRICT: bool = False
+
+    # How often the in-memory active session index and the stored parking lot occupancy are compared with the database
+    ACTIVE_SESSION_RECONCILE_SECONDS: float = 60
+    # How often the in-memory parking lot occupancy is reloaded, to pick up other workers' sessions
+    OCCUPANCY_REFRESH_SECONDS: float = 5
+    # Occupancy streams send a comment after this long without changes, so proxies keep the connection open
+    OCCUPANCY_STREAM_KEEPALIVE_SECONDS: float = 15
+    # How often the in-memory parking lot catalogue checks whether another worker changed the parking lots
+    LOT_CATALOGUE_POLL_SECONDS: float = 1
+
+    # Responses to requests with an Idempotency-Key header are replayed to retries for this long,
+    # keeping at most this many bytes of them (oldest evicted first)
+    IDEMPOTENCY_TTL_SECONDS: float = 24 * 60 * 60
+    IDEMPOTENCY_MAX_BYTES: int = 16 * 1024 * 1024
+
+    # Maximum number of worker threads used to run blocking route handlers
+    # (sync SQLAlchemy sessions, bcrypt hashing) outside of the event loop
+    THREADPOOL_SIZE: int = 40
 
     class Config:
         env_file = ".env"
@@ -9,3 +9,7 @@ from app.db.models import reservation
 from app.db.models import vehicle
 from app.db.models import transaction
 from app.db.models import payment
+from app.db.models import billing_ledger
+from app.db.models import user_balance
+from app.db.models import cache_version
+from app.db.models import parking_lot_occupancy
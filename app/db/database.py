@@ -1,13 +1,103 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
+from app.db.query_log import QueryLog
+
+# Async drivers for the sync URLs we support, used when ASYNC_DATABASE_URL isn't set
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def get_async_database_url() -> str:
+    """
+    Gets the URL for the async engine.
+
+    Returns:
+    ASYNC_DATABASE_URL when configured, otherwise DATABASE_URL with its driver swapped for an async one.
+    """
+    if settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+    url = make_url(settings.DATABASE_URL)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername)).render_as_string(hide_password=False)
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Applies the SQLite performance profile from the settings to a new connection"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cursor.execute(f"PRAGMA cache_size={int(settings.SQLITE_CACHE_SIZE)}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.close()
+
+
+def use_explicit_sqlite_transactions(dbapi_connection, connection_record):
+    """
+    Stops pysqlite from managing transactions itself, which breaks SAVEPOINTs.
+    The BEGIN is emitted by begin_immediate instead.
+    """
+    dbapi_connection.isolation_level = None
+
+
+def begin_immediate(connection):
+    """Takes the write lock when the transaction starts, instead of upgrading to it halfway through"""
+    connection.exec_driver_sql("BEGIN IMMEDIATE")
+
 
 engine = create_engine(
     settings.DATABASE_URL,
     connect_args={"check_same_thread": False},
-    echo=True,
+    echo=settings.SQL_ECHO,
     future=True
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+async_engine = create_async_engine(
+    get_async_database_url(),
+    echo=settings.SQL_ECHO
+)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Engine used only by the write queue's writer thread, see app/db/write_queue.py
+writer_engine = create_engine(
+    settings.DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    pool_size=1,
+    echo=settings.SQL_ECHO
+)
+
+WriterSessionLocal = sessionmaker(autoflush=False, expire_on_commit=False, bind=writer_engine)
+
+QueryLog.install(engine)
+QueryLog.install(async_engine.sync_engine)
+QueryLog.install(writer_engine)
+
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+    event.listen(writer_engine, "connect", apply_sqlite_pragmas)
+    event.listen(writer_engine, "connect", use_explicit_sqlite_transactions)
+    event.listen(writer_engine, "begin", begin_immediate)
+
+
+def get_db():
+    """Dependency that yields a sync session, for handlers running in the threadpool"""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    """Dependency that yields an AsyncSession, for handlers awaiting I/O on the event loop"""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index
+
+from app.db.base import Base
+
+
+class BillingLedgerEntry(Base):
+    """What is due, paid and left to pay for a stopped parking session, kept up to date by LedgerUtils"""
+    __tablename__ = "billing_ledger"
+    __table_args__ = (
+        Index("ix_billing_ledger_username_session_id", "username", "session_id"),
+    )
+
+    session_id = Column(Integer, ForeignKey("parking_sessions.id"), primary_key=True, autoincrement=False)
+    username = Column(String, nullable=False)
+    # Not unique: the hash of session 1 with plate "2AB" equals that of session 12 with plate "AB"
+    transaction_hash = Column(String, nullable=False, index=True)
+    amount_due = Column(Float, nullable=False)
+    amount_paid = Column(Float, nullable=False)
+    balance = Column(Float, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
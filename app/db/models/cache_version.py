@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, String
+
+from app.db.base import Base
+
+
+class CacheVersion(Base):
+    """A counter per in-memory cache, bumped with every write to the data behind it so other workers reload"""
+    __tablename__ = "cache_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False)
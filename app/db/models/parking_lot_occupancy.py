@@ -0,0 +1,12 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey
+
+from app.db.base import Base
+
+
+class ParkingLotOccupancy(Base):
+    """The amount of active sessions in a parking lot, kept up to date by LotOccupancy"""
+    __tablename__ = "parking_lot_occupancy"
+
+    parking_lot_id = Column(Integer, ForeignKey("parking_lots.id"), primary_key=True)
+    occupied = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
@@ -1,10 +1,20 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index, text
 
 from app.db.base import Base
 
 
 class ParkingSession(Base):
     __tablename__ = "parking_sessions"
+    __table_args__ = (
+        # Only the active sessions: a plate can have one at a time, and stopping looks it up
+        Index("ix_parking_sessions_active_license_plate", "license_plate", unique=True,
+              sqlite_where=text("stopped IS NULL"), postgresql_where=text("stopped IS NULL")),
+        # Session search, see ParkingSessionService.search_query
+        Index("ix_parking_sessions_started", "started"),
+        Index("ix_parking_sessions_license_plate_started", "license_plate", "started"),
+        Index("ix_parking_sessions_username_started", "username", "started"),
+        Index("ix_parking_sessions_parking_lot_id_started", "parking_lot_id", "started"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     parking_lot_id = Column(Integer, ForeignKey("parking_lots.id"), nullable=False)
@@ -15,3 +25,5 @@ class ParkingSession(Base):
     duration_minutes = Column(Integer)
     cost = Column(Float)
     payment_status = Column(String, nullable=False)
+    # PaymentUtils.generate_payment_hash of the session, set when it's stopped; payments reference it
+    transaction_hash = Column(String, nullable=True, index=True)
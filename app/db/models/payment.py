@@ -8,7 +8,7 @@ class Payment(Base):
 
     transaction = Column(String, index=True)
     amount = Column(Float, nullable=False)
-    initiator_id = Column(Integer, nullable=True)
+    initiator_id = Column(Integer, nullable=True, index=True)
     created_at = Column(DateTime, nullable=False)
     completed = Column(DateTime, nullable=True)
     hash = Column(String, nullable=False, index=True)
@@ -11,7 +11,7 @@ class User(Base):
     password = Column(String, unique=False, nullable=False)
     name = Column(String, unique=False, nullable=False)
     email = Column(String, unique=True, nullable=False)
-    phone = Column(String, unique=False, nullable=False)
+    phone = Column(String, unique=False, nullable=False, index=True)
     role = Column(String, unique=False, nullable=False)
     created_at = Column(Date, unique=False, nullable=False)
     birth_year = Column(Integer, unique=False, nullable=False)
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, String, Float, DateTime
+
+from app.db.base import Base
+
+
+class UserBalance(Base):
+    """The billing ledger totals of a user, kept up to date by LedgerUtils"""
+    __tablename__ = "user_balances"
+
+    username = Column(String, primary_key=True)
+    amount_due = Column(Float, nullable=False)
+    amount_paid = Column(Float, nullable=False)
+    balance = Column(Float, nullable=False, index=True)
+    updated_at = Column(DateTime, nullable=False)
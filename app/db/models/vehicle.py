@@ -8,7 +8,7 @@ class Vehicle(Base):
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    license_plate = Column(String, nullable=False)
+    license_plate = Column(String, nullable=False, index=True)
     make = Column(String, nullable=False)
     model = Column(String, nullable=False)
     color = Column(String, nullable=False)
@@ -0,0 +1,217 @@
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+
+logger = logging.getLogger("app.db.queries")
+
+# The route ("METHOD /path/{param}") the current request was matched to, set by the middleware in main.py
+current_route: ContextVar[str | None] = ContextVar("current_route", default=None)
+# The queries issued while handling the current request, see QueryLog.start_request
+current_request_queries: ContextVar[dict | None] = ContextVar("current_request_queries", default=None)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class QueryBudgetExceededError(Exception):
+    pass
+
+
+class QueryLog:
+    """
+    Times every statement through engine events, keeps per-fingerprint statistics in memory
+    and logs statements slower than SLOW_QUERY_THRESHOLD_MS, plus a QUERY_LOG_SAMPLE_RATE
+    fraction of the faster ones.
+    """
+
+    stats: dict[str, dict] = {}
+    routes: dict[str, dict] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def install(engine: Engine):
+        """Registers the timing hooks on an engine"""
+        event.listen(engine, "before_cursor_execute", QueryLog._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", QueryLog._after_cursor_execute)
+        event.listen(engine, "handle_error", QueryLog._handle_error)
+
+    @staticmethod
+    def fingerprint(statement: str) -> str:
+        """
+        Normalizes a statement so that executions differing only in their values group together.
+
+        Params:
+        statement: the SQL statement as sent to the database
+
+        Returns:
+        the statement with literals replaced by ?, IN lists collapsed and whitespace squashed
+        """
+        statement = _STRING_LITERAL.sub("?", statement)
+        statement = _NUMBER_LITERAL.sub("?", statement)
+        statement = _PLACEHOLDER_LIST.sub("(?...)", statement)
+        return _WHITESPACE.sub(" ", statement).strip()
+
+    @staticmethod
+    def record(statement: str, duration_ms: float, rowcount: int | None):
+        """Adds an executed statement to the statistics and logs it when it's slow or sampled"""
+        fingerprint = QueryLog.fingerprint(statement)
+        route = current_route.get()
+
+        queries = current_request_queries.get()
+        if queries is not None:
+            queries["count"] += 1
+            queries["time_ms"] += duration_ms
+            queries["fingerprints"][fingerprint] += 1
+
+        with QueryLog._lock:
+            entry = QueryLog.stats.get(fingerprint)
+            if entry is None:
+                if len(QueryLog.stats) >= settings.QUERY_LOG_MAX_FINGERPRINTS:
+                    # Make room by forgetting the fingerprint that cost the least in total
+                    del QueryLog.stats[min(QueryLog.stats, key=lambda key: QueryLog.stats[key]["total_ms"])]
+                entry = QueryLog.stats[fingerprint] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "slowest_route": None}
+            entry["count"] += 1
+            entry["total_ms"] += duration_ms
+            if duration_ms >= entry["max_ms"]:
+                entry["max_ms"] = duration_ms
+                entry["slowest_route"] = route
+
+        slow = duration_ms >= settings.SLOW_QUERY_THRESHOLD_MS
+        if slow or random.random() < settings.QUERY_LOG_SAMPLE_RATE:
+            logger.log(logging.WARNING if slow else logging.INFO, json.dumps({
+                "event": "slow_query" if slow else "sampled_query",
+                "fingerprint": fingerprint,
+                "duration_ms": round(duration_ms, 3),
+                "rowcount": rowcount,
+                "route": route
+            }))
+
+    @staticmethod
+    def slowest(limit: int) -> list[dict]:
+        """
+        Gets the fingerprints with the highest maximum duration.
+
+        Params:
+        limit: the amount of fingerprints to return
+
+        Returns:
+        a list of dictionaries with the fingerprint and its count, total, mean and max duration
+        """
+        with QueryLog._lock:
+            entries = [(fingerprint, dict(entry)) for fingerprint, entry in QueryLog.stats.items()]
+        entries.sort(key=lambda item: item[1]["max_ms"], reverse=True)
+        return [
+            {
+                "fingerprint": fingerprint,
+                "count": entry["count"],
+                "total_ms": entry["total_ms"],
+                "mean_ms": entry["total_ms"] / entry["count"],
+                "max_ms": entry["max_ms"],
+                "slowest_route": entry["slowest_route"]
+            }
+            for fingerprint, entry in entries[:limit]
+        ]
+
+    @staticmethod
+    def start_request(route: str) -> dict:
+        """Starts counting the queries of the current request, returning the dictionary they are counted in"""
+        current_route.set(route)
+        queries = {"count": 0, "time_ms": 0.0, "fingerprints": Counter()}
+        current_request_queries.set(queries)
+        return queries
+
+    @staticmethod
+    def finish_request(route: str, queries: dict) -> list[str]:
+        """
+        Adds a finished request to the per-route statistics and checks it against the query budget.
+
+        Params:
+        route: the route the request was matched to
+        queries: the dictionary returned by start_request
+
+        Returns:
+        the ways in which the request exceeded the budget, empty if it didn't
+
+        Raises:
+        QueryBudgetExceededError: when the budget was exceeded and QUERY_BUDGET_STRICT is set
+        """
+        problems = []
+        if queries["count"] > settings.QUERY_BUDGET_PER_REQUEST:
+            problems.append(f"{queries['count']} queries, the budget is {settings.QUERY_BUDGET_PER_REQUEST}")
+        for fingerprint, count in queries["fingerprints"].items():
+            if count > settings.QUERY_REPEAT_LIMIT:
+                problems.append(f"{count} executions of: {fingerprint}")
+
+        with QueryLog._lock:
+            entry = QueryLog.routes.setdefault(route, {"requests": 0, "queries": 0, "max_queries": 0, "time_ms": 0.0, "over_budget": 0})
+            entry["requests"] += 1
+            entry["queries"] += queries["count"]
+            entry["max_queries"] = max(entry["max_queries"], queries["count"])
+            entry["time_ms"] += queries["time_ms"]
+            entry["over_budget"] += 1 if problems else 0
+
+        if problems:
+            logger.warning(json.dumps({
+                "event": "query_budget_exceeded",
+                "route": route,
+                "queries": queries["count"],
+                "time_ms": round(queries["time_ms"], 3),
+                "problems": problems
+            }))
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceededError(f"{route} exceeded its query budget: {'; '.join(problems)}")
+        return problems
+
+    @staticmethod
+    def route_stats() -> list[dict]:
+        """Gets the query statistics per route, the routes issuing the most queries per request first"""
+        with QueryLog._lock:
+            entries = [(route, dict(entry)) for route, entry in QueryLog.routes.items()]
+        entries.sort(key=lambda item: item[1]["queries"] / item[1]["requests"], reverse=True)
+        return [
+            {
+                "route": route,
+                "requests": entry["requests"],
+                "mean_queries": entry["queries"] / entry["requests"],
+                "max_queries": entry["max_queries"],
+                "mean_time_ms": entry["time_ms"] / entry["requests"],
+                "over_budget": entry["over_budget"]
+            }
+            for route, entry in entries
+        ]
+
+    @staticmethod
+    def reset():
+        with QueryLog._lock:
+            QueryLog.stats.clear()
+            QueryLog.routes.clear()
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @staticmethod
+    def _handle_error(context):
+        # A failed statement never reaches after_cursor_execute, drop its start time from the pooled connection
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+    @staticmethod
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration_ms = (time.perf_counter() - conn.info["query_started"].pop()) * 1000
+        # SQLite only reports a row count for INSERT, UPDATE and DELETE
+        rowcount = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None
+        QueryLog.record(statement, duration_ms, rowcount)
@@ -0,0 +1,149 @@
+import asyncio
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, TypeVar
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.core.config import settings
+from app.db.database import WriterSessionLocal
+
+T = TypeVar("T")
+
+
+class WriteQueue:
+    """
+    Serializes database writes through a single writer thread and commits them in groups.
+
+    SQLite allows one writer at a time, so rather than having every request compete for
+    the write lock, write jobs are queued and the writer applies up to `max_batch` of them
+    in one transaction and commits once. Each job runs in its own SAVEPOINT, so a job that
+    raises is rolled back and fails on its own without affecting the rest of the batch.
+    """
+
+    def __init__(self, session_factory: sessionmaker, max_batch: int, max_wait_ms: float):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.jobs = 0
+        self.largest_batch = 0
+
+    def submit(self, job: Callable[[Session], T]) -> Future:
+        """
+        Queues a write job.
+
+        Params:
+        job: a function taking the writer's Session; it must not commit, the writer does
+
+        Returns:
+        a Future resolving to the job's return value after its batch has been committed
+        """
+        future = Future()
+        # The job runs with the caller's context variables (e.g. the current route)
+        self._queue.put((job, contextvars.copy_context(), future))
+        self._ensure_started()
+        return future
+
+    async def run(self, job: Callable[[Session], T]) -> T:
+        """Queues a write job and waits for its batch to be committed"""
+        return await asyncio.wrap_future(self.submit(job))
+
+    async def add(self, instance: T, then: Callable[[Session, T], None] | None = None) -> T:
+        """
+        Inserts a new ORM instance and returns it with all of its columns loaded.
+
+        Params:
+        instance: the instance to insert
+        then: optionally, more writes to commit together with the insert, given the writer's Session and the instance
+        """
+        def insert(db: Session) -> T:
+            db.add(instance)
+            db.flush()
+            # Columns left unset were inserted as NULL unless the database fills them in,
+            # only read back the latter
+            state = inspect(instance)
+            server_generated = [key for key in state.unloaded if state.mapper.columns[key].server_default is not None]
+            for key in state.unloaded - set(server_generated):
+                set_committed_value(instance, key, None)
+            if server_generated:
+                db.refresh(instance, server_generated)
+            if then is not None:
+                then(db, instance)
+            return instance
+
+        return await self.run(insert)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "jobs": self.jobs,
+            "average_batch": self.jobs / self.batches if self.batches else 0,
+            "largest_batch": self.largest_batch,
+            "queued": self._queue.qsize()
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name="write-queue", daemon=True)
+                self._thread.start()
+
+    def _work(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    # Take whatever queued up meanwhile, waiting up to max_wait for more
+                    timeout = deadline - time.monotonic()
+                    batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._apply(batch)
+
+    def _apply(self, batch: list):
+        outcomes = []
+        try:
+            with self.session_factory() as db:
+                for job, context, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with db.begin_nested():
+                            result = context.run(job, db)
+                    except Exception as e:
+                        outcomes.append((future, None, e))
+                    else:
+                        outcomes.append((future, result, None))
+                db.commit()
+        except Exception as e:
+            # The group commit failed, so none of the jobs in it were persisted
+            for future, _, error in outcomes:
+                future.set_exception(error or e)
+            for _, _, future in batch:
+                if future.running():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.jobs += len(outcomes)
+        self.largest_batch = max(self.largest_batch, len(outcomes))
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+write_queue = WriteQueue(WriterSessionLocal, settings.WRITE_QUEUE_MAX_BATCH, settings.WRITE_QUEUE_MAX_WAIT_MS)
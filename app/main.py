@@ -1,6 +1,14 @@
-from fastapi import FastAPI
-from fastapi.responses import RedirectResponse
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from hashlib import sha256
 
+from anyio import to_thread
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, RedirectResponse
+from starlette.routing import Match
+
+from app.api.admin.routes import router as admin_router
 from app.api.auth.routes import router as auth_router
 from app.api.billing.routes import router as billing_router
 from app.api.parking_lots.routes import router as parking_lots_router
@@ -8,6 +16,88 @@ from app.api.parking_sessions.routes import router as parking_sessions_router
 from app.api.payments.routes import router as payments_router
 from app.api.profile.routes import router as profile_router
 from app.api.users.routes import router as users_router
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.db.query_log import QueryLog
+from app.db.write_queue import write_queue
+from app.util.active_session_index import ActiveSessionIndex
+from app.util.idempotency_store import IdempotencyStore
+from app.util.lot_catalogue import LotCatalogue
+from app.util.lot_occupancy import LotOccupancy
+from app.util.occupancy_broadcaster import OccupancyBroadcaster
+
+logger = logging.getLogger(__name__)
+
+# Routes that replay their response to retries with the same Idempotency-Key header
+IDEMPOTENT_ROUTES = {
+    "POST /parking_sessions/start/{parking_lot_id}/{license_plate}",
+    "POST /parking_sessions/stop/{license_plate}",
+    "POST /parking_sessions/gate_events",
+    "POST /payments/",
+}
+
+
+def run_with_session(function):
+    """Runs a function that takes a sync database session, for use with to_thread"""
+    with SessionLocal() as db:
+        return function(db)
+
+
+async def reconcile_active_sessions():
+    """Periodically repairs the drift of the active session index and the parking lot occupancy from the database"""
+    while True:
+        await asyncio.sleep(settings.ACTIVE_SESSION_RECONCILE_SECONDS)
+        try:
+            result = await to_thread.run_sync(run_with_session, ActiveSessionIndex.reconcile)
+            if result["added"] or result["removed"]:
+                logger.warning("Active session index drifted from the database: %s", result)
+        except Exception:
+            logger.exception("Reconciling the active session index failed")
+        try:
+            result = await write_queue.run(LotOccupancy.reconcile)
+            if result["corrected"] or result["added"]:
+                logger.warning("Parking lot occupancy drifted from the active sessions: %s", result)
+        except Exception:
+            logger.exception("Reconciling the parking lot occupancy failed")
+
+
+async def poll_lot_catalogue():
+    """Reloads the parking lot catalogue when another worker changed the parking lots"""
+    while True:
+        await asyncio.sleep(settings.LOT_CATALOGUE_POLL_SECONDS)
+        try:
+            await to_thread.run_sync(run_with_session, LotCatalogue.refresh)
+        except Exception:
+            logger.exception("Polling the parking lot catalogue failed")
+
+
+async def refresh_lot_occupancy():
+    """Reloads the stored parking lot occupancy, which other workers change too"""
+    while True:
+        await asyncio.sleep(settings.OCCUPANCY_REFRESH_SECONDS)
+        try:
+            OccupancyBroadcaster.publish(await to_thread.run_sync(run_with_session, LotOccupancy.refresh))
+        except Exception:
+            logger.exception("Refreshing the parking lot occupancy failed")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Route handlers declared with `def` run in anyio's worker threads,
+    # bound the pool so a burst of requests can't exhaust the database
+    to_thread.current_default_thread_limiter().total_tokens = settings.THREADPOOL_SIZE
+
+    await to_thread.run_sync(run_with_session, ActiveSessionIndex.warm)
+    await to_thread.run_sync(run_with_session, LotCatalogue.refresh)
+    await to_thread.run_sync(run_with_session, LotOccupancy.refresh)
+    reconciler = asyncio.create_task(reconcile_active_sessions())
+    catalogue_poller = asyncio.create_task(poll_lot_catalogue())
+    occupancy_refresher = asyncio.create_task(refresh_lot_occupancy())
+    yield
+    reconciler.cancel()
+    catalogue_poller.cancel()
+    occupancy_refresher.cancel()
+
 
 app = FastAPI(
     title="MobyPark API",
@@ -15,8 +105,73 @@ app = FastAPI(
     docs_url="/docs",
     redoc_url="/redoc",
     openapi_url="/openapi.json",
+    lifespan=lifespan,
 )
 
+def route_of(request: Request) -> str:
+    """Gets the method and path template of the route a request goes to, e.g. `POST /parking_sessions/stop/{license_plate}`"""
+    path = request.url.path
+    for route in request.app.router.routes:
+        if route.matches(request.scope)[0] == Match.FULL:
+            path = route.path
+            break
+    return f"{request.method} {path}"
+
+
+# Middleware added later wraps the earlier ones, so replays still pass through track_queries
+@app.middleware("http")
+async def replay_idempotent_requests(request: Request, call_next):
+    """Answers retries of requests sent with the same Idempotency-Key header from the IdempotencyStore"""
+    idempotency_key = request.headers.get("Idempotency-Key")
+    route = route_of(request)
+    if idempotency_key is None or route not in IDEMPOTENT_ROUTES:
+        return await call_next(request)
+    if len(idempotency_key) > 255:
+        return JSONResponse({"detail": "Idempotency-Key can be at most 255 characters"}, status_code=400)
+
+    # Keys are per caller and route, so one client can't replay another's response
+    key = sha256(f"{request.headers.get('Authorization')}|{route}|{idempotency_key}".encode()).hexdigest()
+    fingerprint = sha256(request.url.path.encode() + b"|" + await request.body()).hexdigest()
+
+    cached = IdempotencyStore.get(key, fingerprint)
+    if cached is not None:
+        if cached.fingerprint != fingerprint:
+            return JSONResponse({"detail": "Idempotency-Key was already used for a different request"}, status_code=422)
+        replay = Response(cached.body, status_code=cached.status_code, media_type=cached.media_type)
+        if cached.headers:
+            replay.raw_headers = list(cached.headers)
+        replay.headers["Idempotent-Replayed"] = "true"
+        return replay
+    if not IdempotencyStore.begin(key):
+        return JSONResponse({"detail": "A request with this Idempotency-Key is still being processed"}, status_code=409)
+
+    try:
+        response = await call_next(request)
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        # Server errors may go away on a retry, everything else is the answer
+        if response.status_code < 500:
+            IdempotencyStore.finish(key, fingerprint, response.status_code, response.media_type, body, response.raw_headers)
+    finally:
+        # Releases the key when nothing was stored, also when the request was cancelled because the client left
+        IdempotencyStore.abandon(key)
+    # The raw headers, a dict would keep only one of repeated headers like Set-Cookie
+    buffered = Response(body, status_code=response.status_code)
+    buffered.raw_headers = list(response.raw_headers)
+    return buffered
+
+
+@app.middleware("http")
+async def track_queries(request: Request, call_next):
+    """Tags the queries of a request with its route, counts them and reports them in the response headers"""
+    route = route_of(request)
+
+    queries = QueryLog.start_request(route)
+    response = await call_next(request)
+    QueryLog.finish_request(route, queries)
+    response.headers["X-DB-Query-Count"] = str(queries["count"])
+    response.headers["X-DB-Time-Ms"] = f"{queries['time_ms']:.3f}"
+    return response
+
 # Optional: redirect root to Swagger UI for convenience
 @app.get("/", include_in_schema=False)
 def root_redirect():
@@ -30,6 +185,7 @@ app.include_router(auth_router)
 app.include_router(profile_router)
 app.include_router(payments_router)
 app.include_router(billing_router)
+app.include_router(admin_router)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,163 @@
+import threading
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select, Row, Select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.db.models.parking_session import ParkingSession
+from app.db.models.user import User
+
+
+class ActiveSession(NamedTuple):
+    id: int
+    parking_lot_id: int
+    username: str
+    started: datetime
+    # The ID of the user the session is for, so quotes can check the caller's token without a query. None for guests
+    user_id: Optional[int] = None
+
+
+class ActiveSessionIndex:
+    """
+    This class keeps the active parking session of every license plate in memory, so stopping
+    or quoting a session doesn't have to query the database to find it.
+
+    The index is warmed at startup and updated by the routes once a start or stop has been committed.
+    A plate missing from it is looked up in the database. Other processes don't update it, so
+    a periodic reconcile pass repairs any drift. It is never asked whether a plate is free:
+    the unique index on active sessions is what keeps a plate from being started twice.
+    """
+
+    sessions: dict[str, ActiveSession] = {}
+    warmed: bool = False
+    hits: int = 0
+    misses: int = 0
+    stale: int = 0
+    last_reconcile: dict | None = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def warm(db: Session):
+        """
+        Loads every active session from the database.
+
+        Params:
+        db: a sync database session, this runs in a worker thread at startup
+        """
+        sessions = ActiveSessionIndex._load(db)
+        with ActiveSessionIndex._lock:
+            ActiveSessionIndex.sessions = sessions
+            ActiveSessionIndex.warmed = True
+
+    @staticmethod
+    def reconcile(db: Session) -> dict:
+        """
+        Compares the index with the active sessions in the database and repairs the differences.
+
+        Params:
+        db: a sync database session
+
+        Returns:
+        the amount of sessions added to and removed from the index
+        """
+        with ActiveSessionIndex._lock:
+            before = dict(ActiveSessionIndex.sessions)
+        actual = ActiveSessionIndex._load(db)
+
+        added = removed = 0
+        with ActiveSessionIndex._lock:
+            for license_plate, session in actual.items():
+                if license_plate not in ActiveSessionIndex.sessions:
+                    ActiveSessionIndex.sessions[license_plate] = session
+                    added += 1
+            # Only drop entries that were there before the database was read, and haven't changed since,
+            # a session started in the meantime is missing from `actual` but isn't stale
+            for license_plate, session in before.items():
+                if license_plate not in actual and ActiveSessionIndex.sessions.get(license_plate) == session:
+                    del ActiveSessionIndex.sessions[license_plate]
+                    removed += 1
+            ActiveSessionIndex.warmed = True
+            ActiveSessionIndex.last_reconcile = {"at": datetime.now(), "added": added, "removed": removed}
+        return {"added": added, "removed": removed}
+
+    @staticmethod
+    async def find(db: AsyncSession, license_plate: str) -> Optional[ActiveSession]:
+        """
+        Gets the active session of a license plate, from the index when it has it, otherwise from the database.
+
+        Params:
+        db: the database session to fall back on
+        license_plate: the license plate to find the active session of
+
+        Returns:
+        the active session, or None if the plate isn't parked
+        """
+        session = ActiveSessionIndex.sessions.get(license_plate)
+        if session is not None:
+            ActiveSessionIndex.hits += 1
+            return session
+
+        ActiveSessionIndex.misses += 1
+        row = (await db.execute(
+            ActiveSessionIndex._query().where(ParkingSession.license_plate == license_plate).limit(1)
+        )).first()
+        if row is None:
+            return None
+        session = ActiveSession(row.id, row.parking_lot_id, row.username, row.started, row.user_id)
+        ActiveSessionIndex.sessions[license_plate] = session
+        return session
+
+    @staticmethod
+    def add(session: ParkingSession | Row, user_id: Optional[int] = None):
+        """
+        Adds a session once its start has been committed.
+
+        Params:
+        session: the started session
+        user_id: the ID of the user the session is for, None for guests
+        """
+        ActiveSessionIndex.sessions[session.license_plate] = ActiveSession(
+            session.id, session.parking_lot_id, session.username, session.started, user_id
+        )
+
+    @staticmethod
+    def remove(license_plate: str, session_id: int):
+        """Removes a session once its stop has been committed, unless the plate has started a newer one"""
+        with ActiveSessionIndex._lock:
+            session = ActiveSessionIndex.sessions.get(license_plate)
+            if session is not None and session.id == session_id:
+                del ActiveSessionIndex.sessions[license_plate]
+
+    @staticmethod
+    def stats() -> dict:
+        """Hits are lookups answered without the database, misses needed it"""
+        lookups = ActiveSessionIndex.hits + ActiveSessionIndex.misses
+        return {
+            "warmed": ActiveSessionIndex.warmed,
+            "size": len(ActiveSessionIndex.sessions),
+            "hits": ActiveSessionIndex.hits,
+            "misses": ActiveSessionIndex.misses,
+            "hit_rate": ActiveSessionIndex.hits / lookups if lookups else 0,
+            "stale": ActiveSessionIndex.stale,
+            "last_reconcile": ActiveSessionIndex.last_reconcile
+        }
+
+    @staticmethod
+    def _load(db: Session) -> dict[str, ActiveSession]:
+        rows = db.execute(ActiveSessionIndex._query())
+        return {
+            row.license_plate: ActiveSession(row.id, row.parking_lot_id, row.username, row.started, row.user_id)
+            for row in rows
+        }
+
+    @staticmethod
+    def _query() -> Select:
+        """The active sessions with the ID of their user, looked up on the unique username"""
+        return (
+            select(ParkingSession.license_plate, ParkingSession.id, ParkingSession.parking_lot_id,
+                   ParkingSession.username, ParkingSession.started, User.id.label("user_id"))
+            .outerjoin(User, User.username == ParkingSession.username)
+            .where(ParkingSession.stopped == None)
+        )
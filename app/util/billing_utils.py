@@ -0,0 +1,91 @@
+from typing import Optional
+
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models.billing_ledger import BillingLedgerEntry
+from app.db.models.parking_lot import ParkingLot
+from app.db.models.parking_session import ParkingSession
+from app.db.models.user_balance import UserBalance
+
+
+class BillingUtils:
+
+    @staticmethod
+    async def get_billing(db: AsyncSession, username: str, limit: Optional[int] = None, after: Optional[int] = None) -> list[dict]:
+        """
+        Get the bill of the stopped sessions of a user from the billing ledger.
+
+        Params:
+        db: the database session
+        username: the user to get the bill of
+        limit: the maximum amount of sessions to return
+        after: only return sessions with an ID above this one, i.e. the last ID of the previous page
+
+        Returns:
+        a list of dictionaries shaped like BillingResponse, ordered by session ID
+        """
+        rows = await db.execute(BillingUtils.billing_query(username, limit, after))
+        return [BillingUtils.billing_entry(row) for row in rows]
+
+    @staticmethod
+    def billing_query(username: str, limit: Optional[int] = None, after: Optional[int] = None) -> Select:
+        """The ledger entries of a user joined with their session and parking lot"""
+        query = (
+            select(
+                ParkingSession.id,
+                ParkingSession.license_plate,
+                ParkingSession.started,
+                ParkingSession.stopped,
+                ParkingSession.duration_minutes,
+                ParkingLot.name,
+                ParkingLot.location,
+                ParkingLot.tariff,
+                ParkingLot.daytariff,
+                BillingLedgerEntry.transaction_hash,
+                BillingLedgerEntry.amount_due,
+                BillingLedgerEntry.amount_paid,
+                BillingLedgerEntry.balance
+            )
+            .join(ParkingSession, ParkingSession.id == BillingLedgerEntry.session_id)
+            .join(ParkingLot, ParkingLot.id == ParkingSession.parking_lot_id)
+            .where(BillingLedgerEntry.username == username)
+            .order_by(BillingLedgerEntry.session_id)
+        )
+        if after is not None:
+            query = query.where(BillingLedgerEntry.session_id > after)
+        if limit:
+            query = query.limit(limit)
+        return query
+
+    @staticmethod
+    async def get_outstanding_balances(db: AsyncSession, limit: int) -> list[UserBalance]:
+        """Get the users that have the most left to pay, from the ledger totals"""
+        return (await db.scalars(
+            select(UserBalance).where(UserBalance.balance > 0).order_by(UserBalance.balance.desc()).limit(limit)
+        )).all()
+
+    @staticmethod
+    def billing_entry(row) -> dict:
+        """Shapes a row of the billing query like BillingResponse"""
+        duration_minutes = row.duration_minutes or 0
+        return {
+            "session": {
+                "id": row.id,
+                "license_plate": row.license_plate,
+                "started": row.started,
+                "stopped": row.stopped,
+                "hours": duration_minutes / 60,
+                "days": int(duration_minutes / (60 * 24))
+            },
+            "parking": {
+                "name": row.name,
+                "location": row.location,
+                "tariff": row.tariff,
+                "daytariff": row.daytariff
+            },
+            "amount": row.amount_due,
+            "thash": row.transaction_hash,
+            "payed": row.amount_paid,
+            "balance": row.balance
+        }
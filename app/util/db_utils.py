@@ -1,5 +1,6 @@
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.models.parking_lot import ParkingLot
 from app.db.models.user import User
@@ -7,8 +8,8 @@ from app.db.models.user import User
 
 class DbUtils:
     @staticmethod
-    def get_user_role(db: Session, user_id: int) -> str:
-        user = db.query(User).filter(User.id == user_id).first()
+    async def get_user_role(db: AsyncSession, user_id: int) -> str:
+        user = await db.get(User, user_id)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -18,8 +19,8 @@ class DbUtils:
 
 
     @staticmethod
-    def get_parking_lot_by_id(db: Session, parking_lot_id: int) -> ParkingLot | None:
-        parking_lot = db.query(ParkingLot).filter(ParkingLot.id == parking_lot_id).first()
+    async def get_parking_lot_by_id(db: AsyncSession, parking_lot_id: int) -> ParkingLot | None:
+        parking_lot = await db.get(ParkingLot, parking_lot_id)
         if not parking_lot:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -28,13 +29,11 @@ class DbUtils:
         return parking_lot
     
     @staticmethod
-    def get_username(db: Session, user_id: int) -> str | None:
+    async def get_username(db: AsyncSession, user_id: int) -> str | None:
         """Get username by user ID"""
-        user = db.query(User).filter(User.id == user_id).first()
-        return user.username if user else None
+        return await db.scalar(select(User.username).where(User.id == user_id))
 
     @staticmethod
-    def get_user(db: Session, user_id: int) -> User | None:
+    async def get_user(db: AsyncSession, user_id: int) -> User | None:
         """Get user by user ID"""
-        user = db.query(User).filter(User.id == user_id).first()
-        return user if user else None
+        return await db.get(User, user_id)
@@ -0,0 +1,148 @@
+from collections import defaultdict, Counter
+
+from sqlalchemy import select, insert, update
+from sqlalchemy.orm import Session
+
+from app.db.models.parking_lot import ParkingLot
+from app.db.models.parking_session import ParkingSession
+from app.db.models.user import User
+from app.db.models.vehicle import Vehicle
+from app.util.ledger_utils import LedgerUtils
+from app.util.lot_occupancy import LotOccupancy
+from app.util.parking_session_utils import ParkingSessionService
+from app.util.payment_utils import PaymentUtils
+
+INSERT_COLUMNS = ("parking_lot_id", "license_plate", "started", "stopped", "username", "duration_minutes", "cost", "payment_status")
+STOP_COLUMNS = ("stopped", "duration_minutes", "cost", "payment_status", "transaction_hash")
+
+
+class GateEventUtils:
+    """
+    Applies batches of entry and exit events that gates buffered, e.g. while they were offline.
+    A batch runs as one write queue job, so it's committed as a whole.
+    """
+
+    @staticmethod
+    def apply_events(db: Session, events: list[dict]) -> list[dict]:
+        """
+        Applies entry and exit events in order. Everything the batch needs from the database is loaded
+        up front with one query per table, after that the events are applied in memory and written at once.
+
+        Params:
+        db: the writer's session
+        events: dicts with `type` ("entry" or "exit"), `parking_lot_id`, `license_plate` and `timestamp`
+
+        Returns:
+        a result per event, with its `status` ("started", "stopped" or "rejected"), the `session`
+        it started or stopped, the `user_id` of the user a started session is for and, for rejected events,
+        the `detail` why
+        """
+        plates = {event["license_plate"] for event in events}
+        # Detached copies, the changes are written with a bulk UPDATE instead of one per session
+        active = {
+            row.license_plate: ParkingSession(**row._mapping)
+            for row in db.execute(
+                select(*ParkingSession.__table__.c)
+                .where(ParkingSession.license_plate.in_(plates), ParkingSession.stopped == None)
+            )
+        }
+        lot_ids = {event["parking_lot_id"] for event in events} | {session.parking_lot_id for session in active.values()}
+        lots = {lot.id: lot for lot in db.scalars(select(ParkingLot).where(ParkingLot.id.in_(lot_ids)))}
+        owners = {}
+        for license_plate, user_id, username in db.execute(
+            select(Vehicle.license_plate, User.id, User.username)
+            .join(User, User.id == Vehicle.user_id)
+            .where(Vehicle.license_plate.in_(plates))
+        ):
+            owners.setdefault(license_plate, (user_id, username))
+
+        results = []
+        new = []
+        stopped = []
+        for index, event in enumerate(events):
+            license_plate = event["license_plate"]
+            result = {"index": index, "type": event["type"], "license_plate": license_plate, "session": None,
+                      "user_id": None, "detail": None}
+            results.append(result)
+
+            if event["type"] == "entry":
+                if event["parking_lot_id"] not in lots:
+                    result["detail"] = f"Parking lot with ID {event['parking_lot_id']} not found"
+                elif license_plate in active:
+                    result["detail"] = "An active parking session already exists for this license plate"
+                else:
+                    # Gates don't know who's driving, the session is for whoever registered the plate
+                    result["user_id"], username = owners.get(license_plate, (None, "guest"))
+                    session = ParkingSession(
+                        parking_lot_id=event["parking_lot_id"],
+                        license_plate=license_plate,
+                        username=username,
+                        started=event["timestamp"],
+                        payment_status="ongoing"
+                    )
+                    new.append(session)
+                    active[license_plate] = result["session"] = session
+            else:
+                session = active.get(license_plate)
+                if session is None:
+                    result["detail"] = "No active parking session found for this license plate"
+                elif event["timestamp"] < session.started:
+                    result["detail"] = "The exit is before the entry of the active parking session"
+                else:
+                    session.stopped = event["timestamp"]
+                    session.duration_minutes = int((session.stopped - session.started).total_seconds() / 60)
+                    session.cost = ParkingSessionService.calculate_price(lots[session.parking_lot_id], session)
+                    session.payment_status = "pending"
+                    del active[license_plate]
+                    stopped.append(session)
+                    result["session"] = session
+
+            if result["detail"] is None:
+                result["status"] = "started" if event["type"] == "entry" else "stopped"
+            else:
+                result["status"] = "rejected"
+
+        # Sessions that were active before the batch are stopped before anything is inserted, a plate that
+        # entered again would otherwise have two active sessions. Sessions started in this batch get their id
+        # from the INSERT and are stopped after it, the payment hash needs the id
+        GateEventUtils.stop_sessions(db, [session for session in stopped if session.id is not None])
+        stopped_new = [session for session in stopped if session.id is None]
+        GateEventUtils.insert_sessions(db, new)
+        GateEventUtils.stop_sessions(db, stopped_new)
+        LedgerUtils.record_sessions(db, stopped)
+        changes = Counter(session.parking_lot_id for session in new)
+        changes.subtract(session.parking_lot_id for session in stopped)
+        LotOccupancy.record(db, changes)
+        db.flush()
+        return results
+
+    @staticmethod
+    def stop_sessions(db: Session, sessions: list[ParkingSession]):
+        """Writes the stop of sessions that have an id with one bulk UPDATE, setting their payment hash"""
+        if not sessions:
+            return
+        for session in sessions:
+            session.transaction_hash = PaymentUtils.generate_payment_hash(session.id, session.license_plate)
+        db.execute(update(ParkingSession), [
+            {column: getattr(session, column) for column in ("id", *STOP_COLUMNS)}
+            for session in sessions
+        ])
+
+    @staticmethod
+    def insert_sessions(db: Session, sessions: list[ParkingSession]):
+        """Inserts new sessions with a few multi-row INSERTs, setting their ids"""
+        if not sessions:
+            return
+        # SQLite doesn't promise RETURNING gives the rows of a multi-row INSERT in order, so they're matched up
+        # by plate. A plate's sessions are inserted in the order of the batch and get ascending ids
+        returned = db.execute(
+            insert(ParkingSession.__table__).returning(ParkingSession.id, ParkingSession.license_plate),
+            [{column: getattr(session, column) for column in INSERT_COLUMNS} for session in sessions]
+        )
+        ids = defaultdict(list)
+        for session_id, license_plate in returned:
+            ids[license_plate].append(session_id)
+        for license_plate in ids:
+            ids[license_plate].sort(reverse=True)
+        for session in sessions:
+            session.id = ids[session.license_plate].pop()
@@ -0,0 +1,137 @@
+import time
+from collections import OrderedDict
+from typing import Iterable, NamedTuple, Optional
+
+from app.core.config import settings
+
+
+class CachedResponse(NamedTuple):
+    fingerprint: str
+    status_code: int
+    media_type: Optional[str]
+    body: bytes
+    expires: float
+    # The response's headers as (name, value) pairs, repeated ones like Set-Cookie included
+    headers: tuple[tuple[bytes, bytes], ...] = ()
+
+
+class IdempotencyStore:
+    """
+    This class keeps the responses of requests sent with an Idempotency-Key header, so a client retrying
+    such a request gets the original response back instead of the request running twice.
+
+    Responses are kept for IDEMPOTENCY_TTL_SECONDS in insertion order. As every response lives equally long
+    that's also the order they expire in, and when the store grows past IDEMPOTENCY_MAX_BYTES the oldest
+    ones are evicted first; retries come shortly after the original request, so those are the least needed.
+    """
+
+    # Rough bookkeeping cost of an entry on top of its key and body
+    ENTRY_OVERHEAD = 200
+
+    responses: OrderedDict[str, CachedResponse] = OrderedDict()
+    in_flight: set[str] = set()
+    size: int = 0
+    hits: int = 0
+    misses: int = 0
+    conflicts: int = 0
+    mismatches: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    @staticmethod
+    def get(key: str, fingerprint: str) -> Optional[CachedResponse]:
+        """
+        Gets the response stored for a key.
+
+        Params:
+        key: the idempotency key, scoped to the caller and the route
+        fingerprint: the hash of the request body, a replay has to send the same body
+
+        Returns:
+        the stored response, or None if there is none (anymore). Compare its fingerprint with the
+        request's before replaying it.
+        """
+        IdempotencyStore._expire()
+        response = IdempotencyStore.responses.get(key)
+        if response is not None:
+            if response.fingerprint == fingerprint:
+                IdempotencyStore.hits += 1
+            else:
+                IdempotencyStore.mismatches += 1
+        return response
+
+    @staticmethod
+    def begin(key: str) -> bool:
+        """
+        Marks a key as in flight before its request runs.
+
+        Returns:
+        False when a request with the same key is still running
+        """
+        if key in IdempotencyStore.in_flight:
+            IdempotencyStore.conflicts += 1
+            return False
+        IdempotencyStore.in_flight.add(key)
+        IdempotencyStore.misses += 1
+        return True
+
+    @staticmethod
+    def finish(
+            key: str,
+            fingerprint: str,
+            status_code: int,
+            media_type: Optional[str],
+            body: bytes,
+            headers: Iterable[tuple[bytes, bytes]] = ()
+    ):
+        """Stores the response of a request that was in flight, evicting the oldest responses to stay within bounds"""
+        IdempotencyStore.in_flight.discard(key)
+        if key in IdempotencyStore.responses:
+            IdempotencyStore.size -= IdempotencyStore._entry_size(key, IdempotencyStore.responses.pop(key).body)
+        IdempotencyStore.responses[key] = CachedResponse(
+            fingerprint, status_code, media_type, body, time.monotonic() + settings.IDEMPOTENCY_TTL_SECONDS, tuple(headers)
+        )
+        IdempotencyStore.size += IdempotencyStore._entry_size(key, body)
+        while IdempotencyStore.size > settings.IDEMPOTENCY_MAX_BYTES and IdempotencyStore.responses:
+            IdempotencyStore._pop_oldest()
+            IdempotencyStore.evictions += 1
+
+    @staticmethod
+    def abandon(key: str):
+        """Forgets a key whose request failed, so it can be retried"""
+        IdempotencyStore.in_flight.discard(key)
+
+    @staticmethod
+    def stats() -> dict:
+        """Hits are retries answered from the store, misses are requests with a key that had to run"""
+        lookups = IdempotencyStore.hits + IdempotencyStore.misses
+        return {
+            "size": len(IdempotencyStore.responses),
+            "bytes": IdempotencyStore.size,
+            "max_bytes": settings.IDEMPOTENCY_MAX_BYTES,
+            "in_flight": len(IdempotencyStore.in_flight),
+            "hits": IdempotencyStore.hits,
+            "misses": IdempotencyStore.misses,
+            "hit_rate": IdempotencyStore.hits / lookups if lookups else 0,
+            "conflicts": IdempotencyStore.conflicts,
+            "mismatches": IdempotencyStore.mismatches,
+            "evictions": IdempotencyStore.evictions,
+            "expirations": IdempotencyStore.expirations
+        }
+
+    @staticmethod
+    def _expire():
+        now = time.monotonic()
+        responses = IdempotencyStore.responses
+        while responses and next(iter(responses.values())).expires <= now:
+            IdempotencyStore._pop_oldest()
+            IdempotencyStore.expirations += 1
+
+    @staticmethod
+    def _pop_oldest():
+        key, response = IdempotencyStore.responses.popitem(last=False)
+        IdempotencyStore.size -= IdempotencyStore._entry_size(key, response.body)
+
+    @staticmethod
+    def _entry_size(key: str, body: bytes) -> int:
+        return len(key) + len(body) + IdempotencyStore.ENTRY_OVERHEAD
@@ -0,0 +1,95 @@
+from datetime import datetime
+
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+
+from app.db.models.billing_ledger import BillingLedgerEntry
+from app.db.models.parking_session import ParkingSession
+from app.db.models.payment import Payment
+from app.db.models.user_balance import UserBalance
+
+
+class LedgerUtils:
+    """
+    Keeps the billing ledger up to date. The methods run as write queue jobs,
+    so the ledger is committed together with the session or payment that changed it.
+    """
+
+    @staticmethod
+    def record_session(db: Session, session: ParkingSession):
+        """Adds a just stopped session to the ledger, including payments made for it before it stopped"""
+        LedgerUtils.record_sessions(db, [session])
+
+    @staticmethod
+    def record_sessions(db: Session, sessions: list[ParkingSession]):
+        """
+        Adds just stopped sessions to the ledger, looking up their payments and users' totals in one query each.
+        Sessions the ledger already has are skipped, so a replayed stop isn't booked twice.
+        """
+        recorded = set(db.scalars(
+            select(BillingLedgerEntry.session_id)
+            .where(BillingLedgerEntry.session_id.in_({session.id for session in sessions}))
+        )) if sessions else set()
+        sessions = [session for session in sessions if session.id not in recorded]
+        if not sessions:
+            return
+        amounts_paid = dict(db.execute(
+            select(Payment.transaction, func.sum(Payment.amount))
+            .where(Payment.transaction.in_({session.transaction_hash for session in sessions}))
+            .group_by(Payment.transaction)
+        ).all())
+        balances = {
+            balance.username: balance
+            for balance in db.scalars(
+                select(UserBalance).where(UserBalance.username.in_({session.username for session in sessions}))
+            )
+        }
+
+        for session in sessions:
+            amount_paid = amounts_paid.get(session.transaction_hash, 0)
+            amount_due = session.cost or 0
+            db.add(BillingLedgerEntry(
+                session_id=session.id,
+                username=session.username,
+                transaction_hash=session.transaction_hash,
+                amount_due=amount_due,
+                amount_paid=amount_paid,
+                balance=amount_due - amount_paid,
+                updated_at=datetime.now()
+            ))
+            if session.username not in balances:
+                balances[session.username] = UserBalance(username=session.username, amount_due=0, amount_paid=0, balance=0)
+                db.add(balances[session.username])
+            LedgerUtils.add_to_balance(balances[session.username], amount_due, amount_paid)
+
+    @staticmethod
+    def record_payment(db: Session, payment: Payment):
+        """
+        Books a just inserted payment on the sessions it pays for that have stopped already, the others pick it
+        up in record_sessions once they stop. Like there, and like PaymentUtils.check_payment_amount, a payment
+        counts for every session with its hash, also when the hashes of two sessions collide.
+        """
+        entries = db.scalars(
+            select(BillingLedgerEntry).where(BillingLedgerEntry.transaction_hash == payment.transaction)
+        ).all()
+        for entry in entries:
+            entry.amount_paid += payment.amount
+            entry.balance -= payment.amount
+            entry.updated_at = datetime.now()
+            LedgerUtils.update_user_balance(db, entry.username, 0, payment.amount)
+
+    @staticmethod
+    def update_user_balance(db: Session, username: str, amount_due: float, amount_paid: float):
+        """Adds to the totals of a user"""
+        balance = db.get(UserBalance, username)
+        if balance is None:
+            balance = UserBalance(username=username, amount_due=0, amount_paid=0, balance=0)
+            db.add(balance)
+        LedgerUtils.add_to_balance(balance, amount_due, amount_paid)
+
+    @staticmethod
+    def add_to_balance(balance: UserBalance, amount_due: float, amount_paid: float):
+        balance.amount_due += amount_due
+        balance.amount_paid += amount_paid
+        balance.balance += amount_due - amount_paid
+        balance.updated_at = datetime.now()
@@ -0,0 +1,130 @@
+import threading
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app.db.models.cache_version import CacheVersion
+from app.db.models.parking_lot import ParkingLot
+
+
+class Catalogue(NamedTuple):
+    version: int
+    lots: dict[int, ParkingLot]
+
+
+class LotCatalogue:
+    """
+    This class keeps every parking lot in memory, so listing lots and pricing sessions don't have to query them.
+
+    Writes to the parking lots bump the `parking_lots` row of cache_versions in their transaction. The worker
+    that wrote reloads the catalogue right after committing, every other worker polls the version every
+    LOT_CATALOGUE_POLL_SECONDS and reloads when it moved on. The lots are detached: read them, don't change them.
+    The version and its lots are swapped in as one tuple, so a reader never pairs the lots with another version.
+    """
+
+    NAME = "parking_lots"
+
+    catalogue: Optional[Catalogue] = None
+    hits: int = 0
+    misses: int = 0
+    reloads: int = 0
+    last_reload: Optional[datetime] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def bump_version(db: Session):
+        """Marks the parking lots as changed, call it in the transaction that writes them"""
+        bumped = db.execute(
+            update(CacheVersion)
+            .where(CacheVersion.name == LotCatalogue.NAME)
+            .values(version=CacheVersion.version + 1)
+        )
+        if bumped.rowcount == 0:
+            db.add(CacheVersion(name=LotCatalogue.NAME, version=1))
+
+    @staticmethod
+    def refresh(db: Session) -> bool:
+        """
+        Reloads the parking lots when their version in the database differs from the loaded one.
+
+        Params:
+        db: a sync database session. The version is read before the lots, so the lots are never older than it
+
+        Returns:
+        True when the catalogue was (re)loaded
+        """
+        version = db.scalar(select(CacheVersion.version).where(CacheVersion.name == LotCatalogue.NAME)) or 0
+        loaded = LotCatalogue.catalogue
+        if loaded is not None and version == loaded.version:
+            return False
+
+        lots = {lot.id: lot for lot in db.scalars(select(ParkingLot).order_by(ParkingLot.id))}
+        for lot in lots.values():
+            db.expunge(lot)
+
+        with LotCatalogue._lock:
+            # A concurrent refresh may have loaded a newer version in the meantime
+            loaded = LotCatalogue.catalogue
+            if loaded is not None and loaded.version > version:
+                return False
+            LotCatalogue.catalogue = Catalogue(version, lots)
+            LotCatalogue.reloads += 1
+            LotCatalogue.last_reload = datetime.now()
+        return True
+
+    @staticmethod
+    def get(parking_lot_id: int) -> Optional[ParkingLot]:
+        """
+        Gets a parking lot from memory.
+
+        Returns:
+        the parking lot, or None when the catalogue isn't loaded or doesn't have it (yet), fall back on the database then
+        """
+        catalogue = LotCatalogue.catalogue
+        parking_lot = catalogue.lots.get(parking_lot_id) if catalogue is not None else None
+        if parking_lot is None:
+            LotCatalogue.misses += 1
+        else:
+            LotCatalogue.hits += 1
+        return parking_lot
+
+    @staticmethod
+    def all(db: Session) -> list[ParkingLot]:
+        """
+        Gets every parking lot ordered by ID, loading the catalogue first if it hasn't been yet.
+
+        Params:
+        db: a sync database session, only used when the catalogue isn't loaded
+        """
+        return list(LotCatalogue.snapshot(db).lots.values())
+
+    @staticmethod
+    def snapshot(db: Session) -> Catalogue:
+        """
+        Gets the version and the lots of the catalogue, loading it first if it hasn't been yet.
+        Indexes built from the lots can be cached by that version.
+
+        Params:
+        db: a sync database session, only used when the catalogue isn't loaded
+        """
+        if LotCatalogue.catalogue is None:
+            LotCatalogue.refresh(db)
+        return LotCatalogue.catalogue
+
+    @staticmethod
+    def stats() -> dict:
+        """Hits are lookups answered from memory, misses had to go to the database"""
+        lookups = LotCatalogue.hits + LotCatalogue.misses
+        catalogue = LotCatalogue.catalogue
+        return {
+            "loaded": catalogue is not None,
+            "version": catalogue.version if catalogue is not None else None,
+            "size": len(catalogue.lots) if catalogue is not None else 0,
+            "hits": LotCatalogue.hits,
+            "misses": LotCatalogue.misses,
+            "hit_rate": LotCatalogue.hits / lookups if lookups else 0,
+            "reloads": LotCatalogue.reloads,
+            "last_reload": LotCatalogue.last_reload
+        }
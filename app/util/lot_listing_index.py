@@ -0,0 +1,87 @@
+import threading
+from typing import Any, Callable, Iterable, NamedTuple, Optional
+
+import numpy as np
+
+from app.db.models.parking_lot import ParkingLot
+
+
+class Columns(NamedTuple):
+    version: Optional[int]
+    # The numeric columns of every parking lot, ordered by ID
+    id: np.ndarray
+    capacity: np.ndarray
+    reserved: np.ndarray
+    tariff: np.ndarray
+    daytariff: np.ndarray
+    created_at: np.ndarray
+
+
+# A filter on a column, e.g. ("tariff", operator.le, 2.5)
+Condition = tuple[str, Callable[[np.ndarray, Any], np.ndarray], Any]
+
+
+class LotListingIndex:
+    """
+    This class filters and pages the parking lots on their numeric columns. The columns are kept as arrays
+    ordered by ID, so a filter compares every lot at once and a page starts with a binary search on the ID.
+
+    Like the LotSpatialIndex, the arrays are built from the LotCatalogue and rebuilt the first time they're
+    used after the catalogue reloaded. They're never changed once built.
+    """
+
+    columns: Optional[Columns] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def build(parking_lots: Iterable[ParkingLot], version: Optional[int] = None) -> Columns:
+        """Lays the numeric columns of parking lots out as arrays ordered by ID"""
+        parking_lots = sorted(parking_lots, key=lambda lot: lot.id)
+        return Columns(
+            version,
+            np.array([lot.id for lot in parking_lots], dtype=np.int64),
+            np.array([lot.capacity for lot in parking_lots], dtype=np.int64),
+            np.array([lot.reserved for lot in parking_lots], dtype=np.int64),
+            np.array([lot.tariff for lot in parking_lots], dtype=np.float64),
+            np.array([lot.daytariff for lot in parking_lots], dtype=np.int64),
+            np.array([lot.created_at for lot in parking_lots], dtype="datetime64[D]")
+        )
+
+    @staticmethod
+    def current(parking_lots: Iterable[ParkingLot], version: Optional[int]) -> Columns:
+        """
+        Gets the columns of a catalogue version, building them first when the version changed.
+
+        Params:
+        parking_lots: all parking lots, only read when the columns have to be (re)built
+        version: the LotCatalogue version of those lots
+        """
+        columns = LotListingIndex.columns
+        if columns is None or columns.version != version:
+            with LotListingIndex._lock:
+                columns = LotListingIndex.columns
+                if columns is None or columns.version != version:
+                    columns = LotListingIndex.columns = LotListingIndex.build(parking_lots, version)
+        return columns
+
+    @staticmethod
+    def select(columns: Columns, conditions: Iterable[Condition], after: Optional[int] = None) -> np.ndarray:
+        """
+        Finds the parking lots matching every condition.
+
+        Params:
+        columns: the columns to search, see current
+        conditions: (column, comparison, value) filters, dates are compared as datetime64[D]
+        after: only parking lots with an ID above this one
+
+        Returns:
+        the IDs of the matching parking lots, in ascending order
+        """
+        start = int(np.searchsorted(columns.id, after, side="right")) if after is not None else 0
+        matches = np.ones(len(columns.id) - start, dtype=bool)
+        for name, compare, value in conditions:
+            column = getattr(columns, name)[start:]
+            if column.dtype.kind == "M":
+                value = np.datetime64(value, "D")
+            matches &= compare(column, value)
+        return columns.id[start:][matches]
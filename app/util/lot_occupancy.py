@@ -0,0 +1,122 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, update, bindparam, func
+from sqlalchemy.orm import Session
+
+from app.db.models.parking_lot import ParkingLot
+from app.db.models.parking_lot_occupancy import ParkingLotOccupancy
+from app.db.models.parking_session import ParkingSession
+from app.util.occupancy_broadcaster import OccupancyBroadcaster
+
+occupancy = ParkingLotOccupancy.__table__
+
+
+class LotOccupancy:
+    """
+    This class counts the active sessions of every parking lot, so availability doesn't need a COUNT(*)
+    over the parking sessions.
+
+    The counters are stored in parking_lot_occupancy, changed in the same transaction that starts or stops
+    a session, and kept in memory: the routes apply their own changes once committed, and the stored
+    counters are reloaded every OCCUPANCY_REFRESH_SECONDS to pick up other workers' changes. A periodic
+    reconcile pass recounts the active sessions and corrects any stored counter that drifted.
+    Changes to the counters in memory are published to the OccupancyBroadcaster.
+    """
+
+    occupied: Optional[dict[int, int]] = None
+    last_refresh: Optional[datetime] = None
+    last_reconcile: Optional[dict] = None
+
+    @staticmethod
+    def record(db: Session, changes: dict[int, int]):
+        """
+        Adds the change in active sessions per parking lot to the stored counters, call it in the
+        transaction that starts or stops the sessions.
+
+        Params:
+        db: the writer's session
+        changes: the amount of sessions started minus stopped, by parking lot ID
+        """
+        changes = [{"lot_id": parking_lot_id, "change": change} for parking_lot_id, change in changes.items() if change]
+        if changes:
+            db.execute(
+                update(occupancy)
+                .where(occupancy.c.parking_lot_id == bindparam("lot_id"))
+                .values(occupied=occupancy.c.occupied + bindparam("change"), updated_at=datetime.now()),
+                changes
+            )
+
+    @staticmethod
+    def change(parking_lot_id: int, change: int):
+        """Applies a committed start (1) or stop (-1) to the counters in memory, and streams it. Call it on the event loop."""
+        occupied = LotOccupancy.occupied
+        if occupied is not None:
+            occupied[parking_lot_id] = occupied.get(parking_lot_id, 0) + change
+            OccupancyBroadcaster.publish({parking_lot_id: occupied[parking_lot_id]})
+
+    @staticmethod
+    def refresh(db: Session) -> dict[int, int]:
+        """
+        Reloads the counters in memory from the stored ones.
+
+        Returns:
+        the counters that changed since the previous reload, e.g. by sessions of other workers, to publish
+        """
+        previous = LotOccupancy.occupied
+        occupied = dict(db.execute(select(ParkingLotOccupancy.parking_lot_id, ParkingLotOccupancy.occupied)).all())
+        LotOccupancy.occupied = occupied
+        LotOccupancy.last_refresh = datetime.now()
+        if previous is None:
+            return {}
+        return {parking_lot_id: count for parking_lot_id, count in occupied.items() if previous.get(parking_lot_id) != count}
+
+    @staticmethod
+    def snapshot(db: Session) -> dict[int, int]:
+        """
+        Gets the counters in memory, by parking lot ID, loading them first if they haven't been yet.
+
+        Params:
+        db: a sync database session, only used when the counters aren't loaded
+        """
+        if LotOccupancy.occupied is None:
+            LotOccupancy.refresh(db)
+        return LotOccupancy.occupied
+
+    @staticmethod
+    def reconcile(db: Session) -> dict:
+        """
+        Recounts the active sessions of every parking lot and corrects the stored counters that differ,
+        adding the missing ones. Runs as a write queue job, so no session starts or stops halfway through.
+
+        Returns:
+        the amount of counters corrected and added
+        """
+        actual = dict(db.execute(
+            select(ParkingSession.parking_lot_id, func.count())
+            .where(ParkingSession.stopped == None)
+            .group_by(ParkingSession.parking_lot_id)
+        ).all())
+        stored = dict(db.execute(select(ParkingLotOccupancy.parking_lot_id, ParkingLotOccupancy.occupied)).all())
+        now = datetime.now()
+
+        corrected = [
+            {"lot_id": parking_lot_id, "count": actual.get(parking_lot_id, 0)}
+            for parking_lot_id, occupied in stored.items() if occupied != actual.get(parking_lot_id, 0)
+        ]
+        if corrected:
+            db.execute(
+                update(occupancy)
+                .where(occupancy.c.parking_lot_id == bindparam("lot_id"))
+                .values(occupied=bindparam("count"), updated_at=now),
+                corrected
+            )
+        missing = [parking_lot_id for parking_lot_id in db.scalars(select(ParkingLot.id)) if parking_lot_id not in stored]
+        db.add_all(
+            ParkingLotOccupancy(parking_lot_id=parking_lot_id, occupied=actual.get(parking_lot_id, 0), updated_at=now)
+            for parking_lot_id in missing
+        )
+        db.flush()
+
+        LotOccupancy.last_reconcile = {"at": now, "corrected": len(corrected), "added": len(missing)}
+        return {"corrected": len(corrected), "added": len(missing)}
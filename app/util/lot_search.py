@@ -0,0 +1,108 @@
+import re
+
+from sqlalchemy import select, text, or_
+from sqlalchemy.orm import Session
+
+from app.db.models.parking_lot import ParkingLot
+
+# At most this many words of a query are searched for
+MAX_TERMS = 8
+# bm25 weights of the name, location and address columns
+WEIGHTS = (4.0, 1.0, 2.0)
+
+
+class LotSearch:
+    """
+    This class searches parking lots by the start of the words in their name, location and address,
+    e.g. "kerk amst" finds "Kerkstraat 12, Amsterdam".
+
+    On SQLite the words are looked up in parking_lots_fts, an FTS5 index over parking_lots that triggers keep
+    in sync with every insert, update and delete, whichever code path writes the lot. Results are ranked with
+    bm25, a match in the name counting most. Other databases fall back on a case-insensitive substring match
+    ordered by ID.
+    """
+
+    DDL = [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS parking_lots_fts USING fts5(
+            name, location, address,
+            content='parking_lots', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS parking_lots_fts_insert AFTER INSERT ON parking_lots BEGIN
+            INSERT INTO parking_lots_fts (rowid, name, location, address) VALUES (new.id, new.name, new.location, new.address);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS parking_lots_fts_delete AFTER DELETE ON parking_lots BEGIN
+            INSERT INTO parking_lots_fts (parking_lots_fts, rowid, name, location, address)
+            VALUES ('delete', old.id, old.name, old.location, old.address);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS parking_lots_fts_update AFTER UPDATE OF name, location, address ON parking_lots BEGIN
+            INSERT INTO parking_lots_fts (parking_lots_fts, rowid, name, location, address)
+            VALUES ('delete', old.id, old.name, old.location, old.address);
+            INSERT INTO parking_lots_fts (rowid, name, location, address) VALUES (new.id, new.name, new.location, new.address);
+        END
+        """,
+        "INSERT INTO parking_lots_fts (parking_lots_fts) VALUES ('rebuild')"
+    ]
+
+    @staticmethod
+    def create_index(cursor):
+        """
+        Creates the search index and its triggers and fills it (SQLite only). The migration has a frozen copy
+        of these statements, a change here needs a new migration.
+
+        Params:
+        cursor: a DB-API cursor or sqlite3 connection, e.g. from engine.raw_connection()
+        """
+        for statement in LotSearch.DDL:
+            cursor.execute(statement)
+
+    @staticmethod
+    def terms(query: str) -> list[str]:
+        """The words of a query, punctuation and FTS5 syntax left out"""
+        return re.findall(r"\w+", query.lower())[:MAX_TERMS]
+
+    @staticmethod
+    def search(db: Session, query: str, limit: int) -> list[tuple[int, float]]:
+        """
+        Finds the parking lots with a word starting with every word of the query.
+
+        Params:
+        db: a sync database session
+        query: the text to search for, e.g. part of an address
+        limit: the amount of parking lots to return
+
+        Returns:
+        (ID, score) of the matching parking lots, best match first, a higher score is a better match
+        """
+        terms = LotSearch.terms(query)
+        if not terms:
+            return []
+
+        if db.get_bind().dialect.name != "sqlite":
+            columns = (ParkingLot.name, ParkingLot.location, ParkingLot.address)
+            ids = db.scalars(
+                select(ParkingLot.id)
+                .where(*(or_(*(column.ilike(f"%{term}%") for column in columns)) for term in terms))
+                .order_by(ParkingLot.id)
+                .limit(limit)
+            )
+            return [(parking_lot_id, 0.0) for parking_lot_id in ids]
+
+        # Every term quoted as a prefix query, so no user input is read as FTS5 syntax
+        match = " ".join(f'"{term}"*' for term in terms)
+        rows = db.execute(text(
+            "SELECT rowid, -bm25(parking_lots_fts, :name_weight, :location_weight, :address_weight) AS score "
+            "FROM parking_lots_fts WHERE parking_lots_fts MATCH :match "
+            "ORDER BY score DESC, rowid LIMIT :limit"
+        ), {
+            "match": match, "limit": limit,
+            "name_weight": WEIGHTS[0], "location_weight": WEIGHTS[1], "address_weight": WEIGHTS[2]
+        })
+        return [(parking_lot_id, score) for parking_lot_id, score in rows]
@@ -0,0 +1,158 @@
+import math
+import threading
+from typing import Callable, Iterable, NamedTuple, Optional
+
+import numpy as np
+
+from app.db.models.parking_lot import ParkingLot
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# Cells of 0.02 by 0.02 degrees, about 2.2 km north to south: a radius of a few km touches a handful of them
+CELL_DEGREES = 0.02
+LNG_CELLS = round(360 / CELL_DEGREES)
+
+
+class Grid(NamedTuple):
+    version: Optional[int]
+    ids: np.ndarray
+    lat: np.ndarray
+    lng: np.ndarray
+    # The slice of the arrays above with the lots in each (lat, lng) cell, the arrays are sorted by cell
+    cells: dict[tuple[int, int], tuple[int, int]]
+
+
+class LotSpatialIndex:
+    """
+    This class finds the parking lots near a point. The lots are bucketed in a grid of CELL_DEGREES cells,
+    a search only measures the distance to the lots in the cells around the point.
+
+    The grid is built from the LotCatalogue and rebuilt the first time it's used after the catalogue
+    reloaded. A grid is never changed once built, searches keep using the one they started with.
+    """
+
+    grid: Optional[Grid] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def build(parking_lots: Iterable[ParkingLot], version: Optional[int] = None) -> Grid:
+        """Buckets parking lots by the grid cell their coordinates fall in"""
+        parking_lots = list(parking_lots)
+        ids = np.array([lot.id for lot in parking_lots], dtype=np.int64)
+        lat = np.array([lot.coordinates_lat for lot in parking_lots], dtype=np.float64)
+        lng = np.array([lot.coordinates_lng for lot in parking_lots], dtype=np.float64)
+
+        lat_cells = np.floor(lat / CELL_DEGREES).astype(np.int64)
+        lng_cells = np.floor(lng / CELL_DEGREES).astype(np.int64) % LNG_CELLS
+        order = np.lexsort((lng_cells, lat_cells))
+        ids, lat, lng, lat_cells, lng_cells = ids[order], lat[order], lng[order], lat_cells[order], lng_cells[order]
+
+        new_cell = np.ones(len(ids), dtype=bool)
+        new_cell[1:] = (lat_cells[1:] != lat_cells[:-1]) | (lng_cells[1:] != lng_cells[:-1])
+        starts = np.flatnonzero(new_cell)
+        ends = list(starts[1:]) + [len(ids)]
+        cells = {
+            (int(lat_cells[start]), int(lng_cells[start])): (int(start), int(end))
+            for start, end in zip(starts, ends)
+        }
+        return Grid(version, ids, np.radians(lat), np.radians(lng), cells)
+
+    @staticmethod
+    def current(parking_lots: Iterable[ParkingLot], version: Optional[int]) -> Grid:
+        """
+        Gets the grid of a catalogue version, building it first when the version changed.
+
+        Params:
+        parking_lots: all parking lots, only read when the grid has to be (re)built
+        version: the LotCatalogue version of those lots
+        """
+        grid = LotSpatialIndex.grid
+        if grid is None or grid.version != version:
+            with LotSpatialIndex._lock:
+                grid = LotSpatialIndex.grid
+                if grid is None or grid.version != version:
+                    grid = LotSpatialIndex.grid = LotSpatialIndex.build(parking_lots, version)
+        return grid
+
+    @staticmethod
+    def within(grid: Grid, lat: float, lng: float, radius_km: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the parking lots within a radius of a point.
+
+        Returns:
+        the IDs of the parking lots and their distances in km, nearest first
+        """
+        candidates = LotSpatialIndex._candidates(grid, lat, lng, radius_km)
+        distances = LotSpatialIndex._distances(grid, candidates, lat, lng)
+        inside = distances <= radius_km
+        candidates, distances = candidates[inside], distances[inside]
+        order = np.argsort(distances, kind="stable")
+        return grid.ids[candidates[order]], distances[order]
+
+    @staticmethod
+    def nearest(
+            grid: Grid,
+            lat: float,
+            lng: float,
+            limit: int,
+            radius_km: Optional[float] = None,
+            accept: Optional[Callable[[int], bool]] = None
+    ) -> list[tuple[int, float]]:
+        """
+        Finds the parking lots nearest to a point.
+
+        Params:
+        grid: the grid to search, see current
+        lat, lng: the point, in degrees
+        limit: the amount of parking lots to find
+        radius_km: only find parking lots this close, otherwise the search widens until it found enough
+        accept: only count the parking lots (by ID) this returns True for, e.g. to skip full ones
+
+        Returns:
+        (ID, distance in km) of at most `limit` parking lots, nearest first
+        """
+        # Every lot within a radius is found, so once `limit` of them are the nearest ones are among them
+        search_km = radius_km if radius_km is not None else 2.0
+        while True:
+            ids, distances = LotSpatialIndex.within(grid, lat, lng, search_km)
+            found = [
+                (int(parking_lot_id), float(distance))
+                for parking_lot_id, distance in zip(ids, distances)
+                if accept is None or accept(int(parking_lot_id))
+            ]
+            if len(found) >= limit or radius_km is not None or search_km >= math.pi * EARTH_RADIUS_KM:
+                return found[:limit]
+            search_km *= 4
+
+    @staticmethod
+    def _candidates(grid: Grid, lat: float, lng: float, radius_km: float) -> np.ndarray:
+        """The positions of the lots in the cells overlapping the bounding box of the circle"""
+        lat_span = radius_km / KM_PER_DEGREE
+        low_lat, high_lat = lat - lat_span, lat + lat_span
+        widest = max(abs(low_lat), abs(high_lat))
+        lng_span = lat_span / math.cos(math.radians(widest)) if widest < 90 else 360
+
+        lat_cells = range(math.floor(low_lat / CELL_DEGREES), math.floor(high_lat / CELL_DEGREES) + 1)
+        first_lng_cell = math.floor((lng - lng_span) / CELL_DEGREES)
+        last_lng_cell = math.floor((lng + lng_span) / CELL_DEGREES)
+        lng_cells = last_lng_cell - first_lng_cell + 1
+
+        # Around a pole or with a large radius, looking at every lot beats looking up every cell of the box
+        if lng_cells >= LNG_CELLS or len(lat_cells) * lng_cells > len(grid.cells):
+            return np.arange(len(grid.ids))
+
+        slices = []
+        for lat_cell in lat_cells:
+            for lng_cell in range(first_lng_cell, last_lng_cell + 1):
+                cell = grid.cells.get((lat_cell, lng_cell % LNG_CELLS))
+                if cell is not None:
+                    slices.append(np.arange(*cell))
+        return np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+
+    @staticmethod
+    def _distances(grid: Grid, candidates: np.ndarray, lat: float, lng: float) -> np.ndarray:
+        """Haversine distances in km from a point to the lots at the given positions"""
+        lat, lng = math.radians(lat), math.radians(lng)
+        lot_lat, lot_lng = grid.lat[candidates], grid.lng[candidates]
+        a = np.sin((lot_lat - lat) / 2) ** 2 + math.cos(lat) * np.cos(lot_lat) * np.sin((lot_lng - lng) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
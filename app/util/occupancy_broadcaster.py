@@ -0,0 +1,85 @@
+import asyncio
+from typing import Optional
+
+
+class Subscription:
+    """
+    The occupancy changes a client hasn't been sent yet. Only the latest count per parking lot is kept,
+    so a client that reads slowly gets fewer, coalesced events instead of a growing backlog.
+    """
+
+    def __init__(self, parking_lot_ids: Optional[set[int]]):
+        # None for every parking lot
+        self.parking_lot_ids = parking_lot_ids
+        self.pending: dict[int, int] = {}
+        self.ready = asyncio.Event()
+
+    async def next(self, timeout: float) -> dict[int, int]:
+        """
+        Waits for changes and takes all of them.
+
+        Returns:
+        the occupied spots by parking lot ID, empty when nothing changed within the timeout
+        """
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return {}
+        self.ready.clear()
+        pending, self.pending = self.pending, {}
+        return pending
+
+
+class OccupancyBroadcaster:
+    """
+    This class fans out parking lot occupancy changes to the clients streaming them, e.g. signage displays.
+    A change costs one dict update per subscribed client, whatever the amount of clients it doesn't query anything.
+
+    LotOccupancy publishes the starts and stops of this worker once committed, and the changes other workers
+    made when it reloads the stored counters. Publish on the event loop, the subscriptions aren't thread safe.
+    """
+
+    subscriptions: set[Subscription] = set()
+    published: int = 0
+    coalesced: int = 0
+
+    @staticmethod
+    def subscribe(parking_lot_ids: Optional[set[int]] = None) -> Subscription:
+        """Starts collecting the changes of some parking lots, or all of them, for a client"""
+        subscription = Subscription(parking_lot_ids)
+        OccupancyBroadcaster.subscriptions.add(subscription)
+        return subscription
+
+    @staticmethod
+    def unsubscribe(subscription: Subscription):
+        """Stops collecting changes for a client that went away"""
+        OccupancyBroadcaster.subscriptions.discard(subscription)
+
+    @staticmethod
+    def publish(changes: dict[int, int]):
+        """
+        Hands changed occupancy to every client subscribed to it.
+
+        Params:
+        changes: the occupied spots by parking lot ID
+        """
+        if not changes:
+            return
+        OccupancyBroadcaster.published += len(changes)
+        for subscription in OccupancyBroadcaster.subscriptions:
+            for parking_lot_id, occupied in changes.items():
+                if subscription.parking_lot_ids is None or parking_lot_id in subscription.parking_lot_ids:
+                    if parking_lot_id in subscription.pending:
+                        OccupancyBroadcaster.coalesced += 1
+                    subscription.pending[parking_lot_id] = occupied
+            if subscription.pending:
+                subscription.ready.set()
+
+    @staticmethod
+    def stats() -> dict:
+        """Coalesced changes replaced one a client hadn't been sent yet"""
+        return {
+            "subscribers": len(OccupancyBroadcaster.subscriptions),
+            "published": OccupancyBroadcaster.published,
+            "coalesced": OccupancyBroadcaster.coalesced
+        }
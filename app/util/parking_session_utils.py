@@ -1,37 +1,226 @@
 import math
-from datetime import datetime
+from datetime import datetime, date, timedelta
 from typing import Optional
 
+from fastapi import HTTPException, status
+from sqlalchemy import select, insert, tuple_, Row, Select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.db.models.parking_lot import ParkingLot
 from app.db.models.parking_session import ParkingSession
 from app.db.models.user import User
 from app.db.models.vehicle import Vehicle
+from app.util.ledger_utils import LedgerUtils
+from app.util.lot_occupancy import LotOccupancy
+from app.util.payment_utils import PaymentUtils
 
 
 class ParkingSessionService:
     
     @staticmethod
-    def check_active_session(db: Session, license_plate: str) -> bool:
-        """Check if there's an active session for the given license plate"""
-        active_session = db.query(ParkingSession).filter(
-            ParkingSession.license_plate == license_plate,
-            ParkingSession.stopped == None
-        ).first()
-        return active_session is not None
-
-    @staticmethod
-    def get_user_by_license_plate(db: Session, license_plate: str) -> Optional[User]:
-        """Get user by license plate if it's registered to their account"""
-        vehicle = db.query(Vehicle).filter(Vehicle.license_plate == license_plate).first()
-        if vehicle:
-            return db.query(User).filter(User.id == vehicle.user_id).first()
-        return None
+    async def get_start_context(db: AsyncSession, parking_lot_id: int, license_plate: str, user_id: Optional[int]) -> Row:
+        """
+        Gets everything starting a session has to check in a single query. Whether the plate is already
+        parked isn't one of them, the unique index on active sessions rejects the insert instead.
+
+        Params:
+        db: the database session
+        parking_lot_id: the parking lot to park in
+        license_plate: the license plate to park
+        user_id: the user starting the session
+
+        Returns:
+        a row with `lot_exists`, `owner` (the username the plate is registered to, if any)
+        and `username` (of the user starting the session)
+        """
+        return (await db.execute(ParkingSessionService.start_context_query(parking_lot_id, license_plate, user_id))).one()
+
+    @staticmethod
+    def start_context_query(parking_lot_id: int, license_plate: str, user_id: Optional[int]) -> Select:
+        """Builds the query of get_start_context, every check is a scalar subquery on an index"""
+        lot_exists = select(ParkingLot.id).where(ParkingLot.id == parking_lot_id).scalar_subquery()
+        owner = (
+            select(User.username)
+            .join(Vehicle, Vehicle.user_id == User.id)
+            .where(Vehicle.license_plate == license_plate)
+            .limit(1)
+            .scalar_subquery()
+        )
+        username = select(User.username).where(User.id == user_id).scalar_subquery()
+
+        return select(
+            lot_exists.label("lot_exists"),
+            owner.label("owner"),
+            username.label("username")
+        )
+
+    @staticmethod
+    def insert_session(db: Session, values: dict) -> Row:
+        """
+        Inserts a parking session, returning all of its columns in the same statement. Runs as a write queue job.
+        Raises IntegrityError when the plate already has an active session.
+        """
+        session = db.execute(insert(ParkingSession).values(**values).returning(*ParkingSession.__table__.c)).one()
+        LotOccupancy.record(db, {session.parking_lot_id: 1})
+        return session
     
+    @staticmethod
+    def search_query(
+            limit: int,
+            username: Optional[str] = None,
+            parking_lot_id: Optional[int] = None,
+            license_plate: Optional[str] = None,
+            started_from: Optional[datetime] = None,
+            started_until: Optional[datetime] = None,
+            cursor: Optional[str] = None
+    ) -> Select:
+        """
+        Builds a session search, newest first. Every filter narrows one of the (column, started) indexes,
+        and the order matches those indexes, so a page reads `limit` index entries instead of sorting the table.
+
+        Params:
+        limit: the page size
+        username, parking_lot_id, license_plate: optional equality filters
+        started_from: only sessions started at or after this moment
+        started_until: only sessions started before this moment
+        cursor: the cursor of the last session of the previous page, see encode_cursor
+        """
+        query = select(ParkingSession)
+        if username is not None:
+            query = query.where(ParkingSession.username == username)
+        if parking_lot_id is not None:
+            query = query.where(ParkingSession.parking_lot_id == parking_lot_id)
+        if license_plate is not None:
+            query = query.where(ParkingSession.license_plate == license_plate)
+        if started_from is not None:
+            query = query.where(ParkingSession.started >= started_from)
+        if started_until is not None:
+            query = query.where(ParkingSession.started < started_until)
+        if cursor is not None:
+            query = query.where(tuple_(ParkingSession.started, ParkingSession.id) < ParkingSessionService.decode_cursor(cursor))
+        return query.order_by(ParkingSession.started.desc(), ParkingSession.id.desc()).limit(limit)
+
+    @staticmethod
+    async def get_all_sessions(
+            db: AsyncSession,
+            limit: int,
+            parking_lot_id: Optional[int] = None,
+            license_plate: Optional[str] = None,
+            day: Optional[date] = None,
+            search_username: Optional[str] = None,
+            started_from: Optional[datetime] = None,
+            started_until: Optional[datetime] = None,
+            cursor: Optional[str] = None
+    ) -> list[ParkingSession]:
+        """Search the sessions of every user, `day` restricts the search to sessions started on that day"""
+        started_from, started_until = ParkingSessionService.started_range(day, started_from, started_until)
+        return (await db.scalars(ParkingSessionService.search_query(
+            limit, search_username, parking_lot_id, license_plate, started_from, started_until, cursor
+        ))).all()
+
+    @staticmethod
+    async def get_user_sessions(
+            db: AsyncSession,
+            username: str,
+            limit: int,
+            parking_lot_id: Optional[int] = None,
+            license_plate: Optional[str] = None,
+            day: Optional[date] = None,
+            search_username: Optional[str] = None,
+            started_from: Optional[datetime] = None,
+            started_until: Optional[datetime] = None,
+            cursor: Optional[str] = None
+    ) -> list[ParkingSession]:
+        """Search the sessions of a single user, a user can't search for the sessions of others"""
+        if search_username is not None and search_username != username:
+            return []
+        started_from, started_until = ParkingSessionService.started_range(day, started_from, started_until)
+        return (await db.scalars(ParkingSessionService.search_query(
+            limit, username, parking_lot_id, license_plate, started_from, started_until, cursor
+        ))).all()
+
+    @staticmethod
+    def started_range(day: Optional[date], started_from: Optional[datetime], started_until: Optional[datetime]) -> tuple[Optional[datetime], Optional[datetime]]:
+        """Narrows a range of start times down to a single day, if given"""
+        if day is None:
+            return started_from, started_until
+        day_start = datetime.combine(day, datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+        return (max(started_from, day_start) if started_from else day_start,
+                min(started_until, day_end) if started_until else day_end)
+
+    @staticmethod
+    def encode_cursor(session: ParkingSession) -> str:
+        """The position of a session in the search order, for fetching the next page"""
+        return f"{session.started.isoformat()}_{session.id}"
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> tuple[datetime, int]:
+        try:
+            started, session_id = cursor.rsplit("_", 1)
+            return datetime.fromisoformat(started), int(session_id)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+
+    @staticmethod
+    def stop_session(
+            db: Session,
+            session_id: int,
+            parking_lot: ParkingLot,
+            stopped: datetime,
+            license_plate: Optional[str] = None
+    ) -> ParkingSession:
+        """
+        Stops a parking session and prices it. Runs as a write queue job, on the writer's session.
+
+        Params:
+        license_plate: when given and the session was stopped in the meantime, e.g. by another worker the
+        active session index doesn't hear from, the plate's current active session is stopped instead,
+        as long as it's of the same user
+
+        Raises:
+        An HTTPException when the plate has no active session (anymore), or a different user's.
+        """
+        session = db.get(ParkingSession, session_id)
+        if (session is None or session.stopped is not None) and license_plate is not None:
+            current = db.scalar(
+                select(ParkingSession).where(ParkingSession.license_plate == license_plate, ParkingSession.stopped == None)
+            )
+            if current is not None and session is not None and current.username != session.username:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="The active parking session of this license plate changed, try again"
+                )
+            session = current
+            if session is not None and session.parking_lot_id != parking_lot.id:
+                parking_lot = db.get(ParkingLot, session.parking_lot_id)
+        if session is None or session.stopped is not None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="No active parking session found for this license plate"
+            )
+
+        session.stopped = stopped
+        session.duration_minutes = int((session.stopped - session.started).total_seconds() / 60)
+
+        # Calculate cost based on duration and parking lot rates
+        session.cost = ParkingSessionService.calculate_price(parking_lot, session)
+        session.payment_status = "pending"
+        session.transaction_hash = PaymentUtils.generate_payment_hash(session.id, session.license_plate)
+        LedgerUtils.record_session(db, session)
+        LotOccupancy.record(db, {session.parking_lot_id: -1})
+        return session
+
     @staticmethod
     def calculate_price(parking_lot: ParkingLot, session: ParkingSession) -> float:
-        """Calculate the price for a parking session based on duration and parking lot rates"""
+        """
+        Calculate the price for a parking session based on duration and parking lot rates.
+        PricingUtils.calculate_prices applies the same rules to many sessions at once, keep them in sync.
+        """
         price = 0
         start = session.started
 
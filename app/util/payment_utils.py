@@ -1,7 +1,8 @@
 import uuid
 from hashlib import md5
 
-from sqlalchemy.orm import Session
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.models.payment import Payment
 
@@ -17,14 +18,11 @@ class PaymentUtils:
         return md5((f"{sessionid}{license_plate}").encode("utf-8")).hexdigest()
     
     @staticmethod
-    def check_payment_amount(transaction_hash: str, db: Session) -> float:
+    async def check_payment_amount(transaction_hash: str, db: AsyncSession) -> float:
         """Check how much has been paid for a transaction"""
-        payments = db.query(Payment).filter(
-            Payment.transaction == transaction_hash
-        ).all()
-        
-        total_paid = sum(payment.amount for payment in payments)
-        return total_paid
+        return await db.scalar(
+            select(func.coalesce(func.sum(Payment.amount), 0)).where(Payment.transaction == transaction_hash)
+        )
     
     @staticmethod
     def generate_transaction_validation_hash() -> str:
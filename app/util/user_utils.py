@@ -0,0 +1,33 @@
+from typing import Iterator, Optional
+
+from sqlalchemy import select, Select
+
+from app.api.users.schemas import UserSummaryResponse
+from app.db.database import SessionLocal
+from app.db.models.user import User
+
+# Rows fetched from the database at a time when streaming
+STREAM_BATCH_SIZE = 1000
+
+
+class UserUtils:
+    @staticmethod
+    def users_query(after: Optional[int] = None, limit: Optional[int] = None) -> Select:
+        """The columns of UserSummaryResponse, ordered by ID, starting after the given ID"""
+        query = select(User.id, User.username, User.name, User.email, User.role, User.created_at, User.active).order_by(User.id)
+        if after is not None:
+            query = query.where(User.id > after)
+        if limit:
+            query = query.limit(limit)
+        return query
+
+    @staticmethod
+    def stream_users(after: Optional[int] = None) -> Iterator[str]:
+        """
+        Yields every user after the given ID as a line of JSON, fetching STREAM_BATCH_SIZE rows at a time
+        so memory use doesn't grow with the table. Starlette iterates it in the threadpool.
+        """
+        with SessionLocal() as db:
+            rows = db.execute(UserUtils.users_query(after).execution_options(yield_per=STREAM_BATCH_SIZE))
+            for row in rows:
+                yield UserSummaryResponse.model_validate(row).model_dump_json() + "\n"
@@ -0,0 +1,85 @@
+"""
+Measures concurrent throughput of the login and parking session endpoints.
+
+Start the server first (see README), then run from the root directory:
+`python benchmarks/concurrency_benchmark.py --base-url http://localhost:8000`
+
+Run it once against the old code and once against the new code to compare.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+
+import httpx
+
+BENCH_USER = {
+    "username": "benchuser",
+    "password": "benchpassword",
+    "name": "Bench User",
+    "email": "benchuser@example.com",
+    "phone": "0600000000",
+    "birth_year": 1990
+}
+
+
+async def run_scenario(client: httpx.AsyncClient, name: str, send, total: int, concurrency: int):
+    """Fires `total` requests with at most `concurrency` in flight and prints the results"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    statuses: Counter = Counter()
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await send(client)
+                statuses[response.status_code] += 1
+            except httpx.TransportError as e:
+                # A blocked event loop shows up as dropped connections
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name}: {total / elapsed:8.1f} req/s | "
+          f"p50 {statistics.median(latencies) * 1000:7.1f} ms | "
+          f"p99 {p99 * 1000:7.1f} ms | statuses {dict(statuses)}")
+
+
+async def main(base_url: str, total: int, concurrency: int):
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        await client.post("/auth/register", json=BENCH_USER)
+        login_body = {"username": BENCH_USER["username"], "password": BENCH_USER["password"]}
+        response = await client.post("/auth/login", json=login_body)
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['token']}"}
+
+        print(f"{total} requests, concurrency {concurrency}")
+        await run_scenario(client, "POST /auth/login      ",
+                           lambda c: c.post("/auth/login", json=login_body), total, concurrency)
+        await run_scenario(client, "GET /parking_sessions/",
+                           lambda c: c.get("/parking_sessions/", headers=headers), total, concurrency)
+
+        # Blocking work on the event loop shows up as session listings stuck behind logins
+        print("while logins are in flight:")
+        await asyncio.gather(
+            run_scenario(client, "POST /auth/login      ",
+                         lambda c: c.post("/auth/login", json=login_body), total // 10, concurrency),
+            run_scenario(client, "GET /parking_sessions/",
+                         lambda c: c.get("/parking_sessions/", headers=headers), total, concurrency)
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+    asyncio.run(main(args.base_url, args.requests, args.concurrency))
@@ -0,0 +1,67 @@
+"""
+Measures nearby parking lot searches with LotSpatialIndex against measuring the distance to every lot,
+and checks they find the same lots.
+
+No database or server needed, run from the root directory:
+`python benchmarks/nearby_benchmark.py --lots 50000`
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.util.lot_spatial_index import LotSpatialIndex
+
+
+def generate(lots: int, seed: int = 42) -> list[SimpleNamespace]:
+    """Lots spread over the Netherlands, denser around a few cities"""
+    generator = np.random.default_rng(seed)
+    cities = np.array([(52.37, 4.89), (51.92, 4.48), (52.09, 5.12), (52.08, 4.30), (51.44, 5.48)])
+    centers = cities[generator.integers(0, len(cities), lots)]
+    points = np.where(
+        generator.random((lots, 1)) < 0.7,
+        centers + generator.normal(0, 0.05, (lots, 2)),
+        np.column_stack([generator.uniform(50.8, 53.5, lots), generator.uniform(3.4, 7.2, lots)])
+    )
+    return [SimpleNamespace(id=number, coordinates_lat=lat, coordinates_lng=lng) for number, (lat, lng) in enumerate(points)]
+
+
+def measure(label: str, queries: list, search) -> list:
+    begin = time.perf_counter()
+    results = [search(lat, lng) for lat, lng in queries]
+    elapsed = (time.perf_counter() - begin) / len(queries) * 1e6
+    print(f"  {label:34} {elapsed:8.1f} µs/query")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lots", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--radius-km", type=float, default=2.0)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    parking_lots = generate(args.lots)
+    begin = time.perf_counter()
+    grid = LotSpatialIndex.build(parking_lots)
+    print(f"{args.lots} lots, grid of {len(grid.cells)} cells built in {(time.perf_counter() - begin) * 1000:.1f} ms")
+
+    queries = [(lot.coordinates_lat, lot.coordinates_lng) for lot in generate(args.queries, seed=7)]
+    # Every lot is a candidate when the whole grid is one cell
+    everything = grid._replace(cells={(0, 0): (0, len(grid.ids))})
+
+    print(f"within {args.radius_km} km:")
+    indexed = measure("grid", queries, lambda lat, lng: LotSpatialIndex.within(grid, lat, lng, args.radius_km)[0].tolist())
+    scanned = measure("every lot", queries, lambda lat, lng: LotSpatialIndex.within(everything, lat, lng, args.radius_km)[0].tolist())
+    print(f"  identical: {indexed == scanned}")
+
+    print(f"{args.k} nearest:")
+    indexed = measure("grid", queries, lambda lat, lng: LotSpatialIndex.nearest(grid, lat, lng, args.k))
+    scanned = measure("every lot", queries, lambda lat, lng: LotSpatialIndex.nearest(everything, lat, lng, args.k, 20_000))
+    print(f"  identical: {[[i for i, _ in r] for r in indexed] == [[i for i, _ in r] for r in scanned]}")
@@ -0,0 +1,64 @@
+"""
+Measures pricing parking sessions with PricingUtils.calculate_prices (NumPy, in one batch)
+against ParkingSessionService.calculate_price (one session at a time), and checks they agree.
+
+No database or server needed, run from the root directory:
+`python benchmarks/pricing_benchmark.py --rows 10000000`
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.util.parking_session_utils import ParkingSessionService
+from app.util.pricing_utils import PricingUtils
+
+FIRST_START = np.datetime64("2023-01-01T00:00:00", "us")
+
+
+def generate(rows: int, seed: int = 42):
+    """Sessions spread over three years, mostly a few hours long, some lasting days"""
+    generator = np.random.default_rng(seed)
+    started = FIRST_START + generator.integers(0, 3 * 365 * 24 * 3600 * 10 ** 6, rows).astype("timedelta64[us]")
+    duration = generator.exponential(3 * 3600 * 10 ** 6, rows).astype(np.int64)
+    stopped = started + duration.astype("timedelta64[us]")
+    tariff = generator.choice([1.0, 2.5, 3.7, 4.25], rows)
+    daytariff = generator.choice([10, 15, 20, 35], rows)
+    return started, stopped, tariff, daytariff
+
+
+def run_scalar(started, stopped, tariff, daytariff) -> list[float]:
+    lots = {(t, d): SimpleNamespace(tariff=t, daytariff=d) for t, d in set(zip(tariff.tolist(), daytariff.tolist()))}
+    return [
+        ParkingSessionService.calculate_price(lots[(t, d)], SimpleNamespace(started=start, stopped=stop))
+        for start, stop, t, d in zip(started.tolist(), stopped.tolist(), tariff.tolist(), daytariff.tolist())
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--scalar-rows", type=int, default=500_000,
+                        help="price this many sessions one at a time, extrapolated to --rows")
+    args = parser.parse_args()
+
+    started, stopped, tariff, daytariff = generate(args.rows)
+    print(f"{args.rows} sessions, {started.nbytes * 4 / 1024 ** 2:.0f} MiB of input")
+
+    begin = time.perf_counter()
+    prices = PricingUtils.calculate_prices(started, stopped, tariff, daytariff)
+    batch = time.perf_counter() - begin
+    print(f"  batch (NumPy)        {batch:8.2f} s | {args.rows / batch / 1e6:6.1f} M sessions/s | revenue {prices.sum():.2f}")
+
+    sample = min(args.scalar_rows, args.rows)
+    begin = time.perf_counter()
+    scalar_prices = run_scalar(started[:sample], stopped[:sample], tariff[:sample], daytariff[:sample])
+    scalar = (time.perf_counter() - begin) * args.rows / sample
+    print(f"  calculate_price loop {scalar:8.2f} s | {args.rows / scalar / 1e6:6.1f} M sessions/s "
+          f"(extrapolated from {sample} sessions)")
+    print(f"  {scalar / batch:.0f}x faster, sample identical: {prices[:sample].tolist() == scalar_prices}")
@@ -0,0 +1,148 @@
+"""
+Measures the parking session search on a large parking_sessions table, with and without
+the search indexes, and compares OFFSET paging with the keyset cursor for deep pages.
+
+Run from the root directory (building the 5M row table takes a minute or two):
+`python benchmarks/session_search_benchmark.py --rows 5000000`
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# The app's engines are configured at import time, so point them at a scratch database first
+DATABASE_PATH = Path(tempfile.mkdtemp()) / "session_search_benchmark.db"
+os.environ["DATABASE_URL"] = f"sqlite:///{DATABASE_PATH}"
+# The queries without indexes are slow on purpose, keep them out of the slow query log
+os.environ["SLOW_QUERY_THRESHOLD_MS"] = "inf"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import text
+from sqlalchemy.dialects import sqlite
+
+from app.db.base import Base
+from app.db.database import engine, SessionLocal
+from app.db.models.parking_session import ParkingSession
+from app.util.parking_session_utils import ParkingSessionService
+
+SEARCH_INDEXES = [
+    "ix_parking_sessions_started",
+    "ix_parking_sessions_license_plate_started",
+    "ix_parking_sessions_username_started",
+    "ix_parking_sessions_parking_lot_id_started",
+]
+USERS = 50_000
+LOTS = 1_500
+FIRST_START = datetime(2023, 1, 1)
+PAGE = 100
+
+
+def populate(rows: int):
+    """Sessions started one after another over three years, by random users in random lots"""
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    interval = timedelta(days=3 * 365) / rows
+    connection = sqlite3.connect(DATABASE_PATH)
+    connection.execute("PRAGMA journal_mode=OFF")
+    connection.execute("PRAGMA synchronous=OFF")
+    for index in SEARCH_INDEXES:
+        connection.execute(f"DROP INDEX {index}")
+    connection.executemany(
+        "INSERT INTO parking_lots (id, name, location, address, capacity, reserved, tariff, daytariff, "
+        "created_at, coordinates_lat, coordinates_lng) VALUES (?, 'Lot', 'Bench', 'Bench', 100, 0, 2.5, 15, '2020-01-01', 52.0, 4.0)",
+        ((lot,) for lot in range(1, LOTS + 1))
+    )
+
+    def sessions():
+        for number in range(rows):
+            started = FIRST_START + interval * number
+            user = random.randrange(USERS)
+            yield (random.randrange(1, LOTS + 1), f"PL-{user:05d}", started.isoformat(" "),
+                   (started + timedelta(hours=2)).isoformat(" "), f"user{user}", 120, 5.0, "pending")
+
+    connection.executemany(
+        "INSERT INTO parking_sessions (parking_lot_id, license_plate, started, stopped, username, "
+        "duration_minutes, cost, payment_status) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        sessions()
+    )
+    connection.commit()
+    connection.close()
+
+
+def set_search_indexes(present: bool):
+    connection = sqlite3.connect(DATABASE_PATH)
+    for table_index in ParkingSession.__table__.indexes:
+        if table_index.name in SEARCH_INDEXES:
+            if present:
+                table_index.create(engine)
+            else:
+                connection.execute(f"DROP INDEX IF EXISTS {table_index.name}")
+    connection.execute("ANALYZE")
+    connection.commit()
+    connection.close()
+    engine.dispose()
+
+
+def measure(name: str, query, repeat: int):
+    with SessionLocal() as db:
+        plan = db.execute(sqlite_explain(query)).all()
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows = db.scalars(query).all()
+            timings.append(time.perf_counter() - started)
+            db.expunge_all()
+    print(f"  {name:<38} {statistics.median(timings) * 1000:9.2f} ms | {len(rows):3d} rows | "
+          f"{'; '.join(row.detail for row in plan)}")
+
+
+def sqlite_explain(query):
+    compiled = query.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True})
+    return text(f"EXPLAIN QUERY PLAN {compiled}").columns()
+
+
+def run(rows: int, repeat: int):
+    month_start = FIRST_START + timedelta(days=400)
+    month_end = month_start + timedelta(days=30)
+    deep_page = min(2000, rows // PAGE // 2)
+
+    with SessionLocal() as db:
+        # The cursor after `deep_page` pages, as a client paging through would have it
+        anchor = db.scalars(
+            ParkingSessionService.search_query(1).offset(deep_page * PAGE - 1)
+        ).one()
+        cursor = ParkingSessionService.encode_cursor(anchor)
+
+    measure("admin, first page", ParkingSessionService.search_query(PAGE), repeat)
+    measure(f"admin, page {deep_page} with OFFSET", ParkingSessionService.search_query(PAGE).offset(deep_page * PAGE), repeat)
+    measure(f"admin, page {deep_page} with cursor", ParkingSessionService.search_query(PAGE, cursor=cursor), repeat)
+    measure("user, one month", ParkingSessionService.search_query(
+        PAGE, username="user42", started_from=month_start, started_until=month_end), repeat)
+    measure("plate, all time", ParkingSessionService.search_query(PAGE, license_plate="PL-00042"), repeat)
+    measure("parking lot, one month", ParkingSessionService.search_query(
+        PAGE, parking_lot_id=7, started_from=month_start, started_until=month_end), repeat)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    populate(args.rows)
+    print(f"{args.rows} sessions in {DATABASE_PATH}, built in {time.perf_counter() - started:.1f} s")
+
+    print("without the search indexes:")
+    set_search_indexes(False)
+    run(args.rows, args.repeat)
+
+    print("with the search indexes:")
+    set_search_indexes(True)
+    run(args.rows, args.repeat)
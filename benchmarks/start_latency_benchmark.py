@@ -0,0 +1,119 @@
+"""
+Measures the latency of POST /parking_sessions/start, reporting p50/p99 and the statements each start runs.
+
+The app runs in-process against a scratch database with a few thousand parked cars,
+registered vehicles and users, so no server is needed. Run from the root directory:
+`python benchmarks/start_latency_benchmark.py --starts 2000 --concurrency 16`
+
+Run it once against the old code and once against the new code to compare.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+# The app's engines are configured at import time, so point them at a scratch database first
+DATABASE_PATH = Path(tempfile.mkdtemp()) / "start_latency_benchmark.db"
+os.environ["DATABASE_URL"] = f"sqlite:///{DATABASE_PATH}"
+# Requests queueing for a connection show up as slow queries, keep them out of the slow query log
+os.environ["SLOW_QUERY_THRESHOLD_MS"] = "inf"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+from sqlalchemy import text
+
+from app.db.base import Base
+from app.db.database import async_engine, engine, SessionLocal
+from app.main import app
+from app.util.active_session_index import ActiveSessionIndex
+from app.util.jwt_authenticator import JWTAuthenticator
+
+USERS = 5_000
+LOTS = 100
+PARKED = 5_000
+
+
+def populate():
+    """Users with a registered vehicle each, and cars already parked under other plates"""
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO parking_lots (id, name, location, address, capacity, reserved, tariff, daytariff, "
+            "created_at, coordinates_lat, coordinates_lng) "
+            "VALUES (:id, 'Bench', 'Bench', 'Bench', 100, 0, 2.5, 15, '2025-01-01', 52.0, 4.0)"
+        ), [{"id": lot} for lot in range(1, LOTS + 1)])
+        connection.execute(text(
+            "INSERT INTO users (id, username, password, name, email, phone, role, created_at, birth_year, active) "
+            "VALUES (:id, :username, 'x', 'Bench', :email, :phone, 'USER', '2025-01-01', 1990, 1)"
+        ), [{"id": user, "username": f"bench{user}", "email": f"bench{user}@example.com", "phone": f"06{user:08d}"}
+            for user in range(1, USERS + 1)])
+        connection.execute(text(
+            "INSERT INTO vehicles (user_id, license_plate, make, model, color, year, created_at) "
+            "VALUES (:user, :plate, 'Bench', 'Bench', 'Grey', 2020, '2025-01-01')"
+        ), [{"user": user, "plate": f"OWN-{user:05d}"} for user in range(1, USERS + 1)])
+        connection.execute(text(
+            "INSERT INTO parking_sessions (parking_lot_id, license_plate, started, username, payment_status) "
+            "VALUES (:lot, :plate, '2025-01-01 08:00:00', 'guest', 'ongoing')"
+        ), [{"lot": number % LOTS + 1, "plate": f"PARKED-{number:05d}"} for number in range(PARKED)])
+    with SessionLocal() as db:
+        ActiveSessionIndex.warm(db)
+
+
+async def run(starts: int, concurrency: int):
+    """Users start sessions for their own registered plate and for unregistered ones, in turn"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    queries: list[int] = []
+    statuses: Counter = Counter()
+    tokens = {user: f"Bearer {JWTAuthenticator.generate_token(user, 'USER')}" for user in range(1, USERS + 1)}
+
+    async def start(client: httpx.AsyncClient, number: int):
+        user = number % USERS + 1
+        plate = f"OWN-{user:05d}" if number % 2 else f"FREE-{number:06d}"
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post(f"/parking_sessions/start/{number % LOTS + 1}/{plate}",
+                                         headers={"Authorization": tokens[user]})
+            latencies.append(time.perf_counter() - started)
+        statuses[response.status_code] += 1
+        queries.append(int(response.headers.get("X-DB-Query-Count", 0)))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(start(client, number) for number in range(starts)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"{starts} starts, {concurrency} in flight: {starts / elapsed:8.1f} starts/s | "
+          f"p50 {statistics.median(latencies) * 1000:6.2f} ms | "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:6.2f} ms | "
+          f"{statistics.mean(queries):.1f} statements per start | {dict(statuses)}")
+
+
+async def main(starts: int, levels: list[int]):
+    for concurrency in levels:
+        await run(starts, concurrency)
+        # Free the plates again for the next round
+        with engine.begin() as connection:
+            connection.execute(text("DELETE FROM parking_sessions WHERE started > '2025-01-01 08:00:00'"))
+        with SessionLocal() as db:
+            ActiveSessionIndex.warm(db)
+    # The aiosqlite connections belong to this event loop
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--starts", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16])
+    args = parser.parse_args()
+
+    populate()
+    print(f"database {DATABASE_PATH}, {ActiveSessionIndex.stats()['size']} cars parked")
+    asyncio.run(main(args.starts, args.concurrency))
@@ -0,0 +1,120 @@
+"""
+Measures parking session writes/sec under contention, comparing:
+- every writer committing on its own connection with SQLite's default settings
+- every writer committing on its own connection with the SQLite profile from the settings
+- all writers going through the write queue, which batches them into group commits
+
+Run from the root directory:
+`python benchmarks/write_benchmark.py --writers 32 --writes 50`
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+# The app's engines are configured at import time, so point them at a scratch database first
+DATABASE_PATH = Path(tempfile.mkdtemp()) / "write_benchmark.db"
+os.environ["DATABASE_URL"] = f"sqlite:///{DATABASE_PATH}"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app.db.database import apply_sqlite_pragmas, engine
+from app.db.models.parking_session import ParkingSession
+from app.db.write_queue import write_queue
+
+
+def new_session(writer: int, write: int) -> ParkingSession:
+    return ParkingSession(
+        parking_lot_id=1,
+        license_plate=f"BENCH-{writer}-{write}",
+        username="guest",
+        started=datetime.now(),
+        payment_status="ongoing"
+    )
+
+
+def report(name: str, total: int, elapsed: float, errors: int):
+    print(f"{name}: {total / elapsed:9.1f} writes/s | {elapsed:6.2f} s | {errors} failed writes")
+
+
+def run_direct(name: str, apply_profile: bool, writers: int, writes: int):
+    """Every writer thread commits each insert on its own connection"""
+    direct_engine = create_engine(os.environ["DATABASE_URL"], connect_args={"check_same_thread": False, "timeout": 5},
+                                  pool_size=writers)
+    if apply_profile:
+        event.listen(direct_engine, "connect", apply_sqlite_pragmas)
+    else:
+        with direct_engine.connect() as connection:
+            connection.exec_driver_sql("PRAGMA journal_mode=DELETE")
+    Session = sessionmaker(bind=direct_engine)
+    errors = 0
+    lock = threading.Lock()
+
+    def writer(number: int):
+        nonlocal errors
+        for write in range(writes):
+            with Session() as db:
+                try:
+                    db.add(new_session(number, write))
+                    db.commit()
+                except OperationalError:
+                    with lock:
+                        errors += 1
+
+    threads = [threading.Thread(target=writer, args=(number,)) for number in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report(name, writers * writes, time.perf_counter() - started, errors)
+    direct_engine.dispose()
+
+
+async def run_write_queue(writers: int, writes: int):
+    """Every writer awaits its inserts one after another, like concurrent requests would"""
+    errors = 0
+
+    async def writer(number: int):
+        nonlocal errors
+        for write in range(writes):
+            try:
+                await write_queue.add(new_session(number, write))
+            except OperationalError:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(writer(number) for number in range(writers)))
+    report("write queue (group commits)    ", writers * writes, time.perf_counter() - started, errors)
+    print(f"  {write_queue.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=32)
+    parser.add_argument("--writes", type=int, default=50)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO parking_lots (id, name, location, address, capacity, reserved, tariff, daytariff, "
+            "created_at, coordinates_lat, coordinates_lng) "
+            "VALUES (1, 'Bench', 'Bench', 'Bench', 100, 0, 2.5, 15, '2025-01-01', 52.0, 4.0)"
+        ))
+    # Leaving WAL mode needs every other connection closed
+    engine.dispose()
+
+    print(f"{args.writers} concurrent writers x {args.writes} writes, database {DATABASE_PATH}")
+    run_direct("direct commits, default pragmas", False, args.writers, args.writes)
+    run_direct("direct commits, SQLite profile ", True, args.writers, args.writes)
+    asyncio.run(run_write_queue(args.writers, args.writes))
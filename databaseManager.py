@@ -1,5 +1,8 @@
 import sqlite3
 import json
+
+from app.util.lot_search import LotSearch
+
 class DatabaseManager:
     def __init__(self, db_name='database.db'):
         self.connection = sqlite3.connect(db_name)
@@ -60,9 +63,14 @@ class DatabaseManager:
                 duration_minutes INTEGER,
                 cost REAL,
                 payment_status TEXT NOT NULL,
+                transaction_hash TEXT,
                 FOREIGN KEY(parking_lot_id) REFERENCES parking_lots(id)
             )
         ''')
+        self.cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS ix_parking_sessions_active_license_plate
+            ON parking_sessions (license_plate) WHERE stopped IS NULL
+        ''')
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS reservations (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -106,6 +114,44 @@ class DatabaseManager:
                 FOREIGN KEY(t_data_id) REFERENCES transactions(id)
             )
         ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS billing_ledger (
+                session_id INTEGER PRIMARY KEY,
+                username TEXT NOT NULL,
+                transaction_hash TEXT NOT NULL,
+                amount_due REAL NOT NULL,
+                amount_paid REAL NOT NULL,
+                balance REAL NOT NULL,
+                updated_at DATETIME NOT NULL,
+                FOREIGN KEY(session_id) REFERENCES parking_sessions(id)
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_balances (
+                username TEXT PRIMARY KEY,
+                amount_due REAL NOT NULL,
+                amount_paid REAL NOT NULL,
+                balance REAL NOT NULL,
+                updated_at DATETIME NOT NULL
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS cache_versions (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            )
+        ''')
+        self.cursor.execute("INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('parking_lots', 1)")
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS parking_lot_occupancy (
+                parking_lot_id INTEGER PRIMARY KEY,
+                occupied INTEGER NOT NULL,
+                updated_at DATETIME NOT NULL,
+                FOREIGN KEY(parking_lot_id) REFERENCES parking_lots(id)
+            )
+        ''')
+        # Search index over the parking lots, the triggers keep it in sync
+        LotSearch.create_index(self.cursor)
         
         self.connection.commit()
     
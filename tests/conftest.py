@@ -1,5 +1,31 @@
 from pathlib import Path
+import os
 import sys
 
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
 # Adjust the path to include the app directory
-sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'app'))
\ No newline at end of file
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'app'))
+
+# Fail tests on routes that exceed their query budget (e.g. N+1 loops) instead of only logging them
+os.environ.setdefault("QUERY_BUDGET_STRICT", "true")
+
+from app.db.base import Base
+
+
+@pytest.fixture
+def engine():
+    """An empty in-memory database with every table, for tests of the utils that take a session"""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    """A session on the in-memory database, classes that need rows in it extend this fixture with their own `db`"""
+    with Session(engine) as db:
+        yield db
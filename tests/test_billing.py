@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from app.db.models.billing_ledger import BillingLedgerEntry
+from app.db.models.parking_session import ParkingSession
+from app.db.models.payment import Payment
+from app.db.models.user_balance import UserBalance
+from app.util.ledger_utils import LedgerUtils
+from app.util.payment_utils import PaymentUtils
+
+START = datetime(2025, 6, 1, 8)
+
+
+class TestLedger:
+
+    def stopped_session(self, db, session_id: int, license_plate: str, cost: float, username: str = "alice") -> ParkingSession:
+        session = ParkingSession(id=session_id, parking_lot_id=1, license_plate=license_plate, username=username,
+                                 started=START, stopped=START + timedelta(hours=2), cost=cost, payment_status="pending",
+                                 transaction_hash=PaymentUtils.generate_payment_hash(session_id, license_plate))
+        db.add(session)
+        db.flush()
+        return session
+
+    def test_sessions_add_up_in_the_user_balance(self, db):
+        """Test every stopped session adds its cost to the totals of its user"""
+        LedgerUtils.record_sessions(db, [self.stopped_session(db, 1, "AB12CD", 5.0), self.stopped_session(db, 2, "AB12CD", 7.5)])
+        LedgerUtils.record_session(db, self.stopped_session(db, 3, "XY34ZZ", 2.5, username="bob"))
+
+        alice, bob = db.get(UserBalance, "alice"), db.get(UserBalance, "bob")
+        assert (alice.amount_due, alice.amount_paid, alice.balance) == (12.5, 0, 12.5)
+        assert (bob.amount_due, bob.amount_paid, bob.balance) == (2.5, 0, 2.5)
+
+    def test_payments_made_before_the_stop_are_booked(self, db):
+        """Test a session that was (partly) paid for while still parked enters the ledger with that payment"""
+        session = self.stopped_session(db, 1, "AB12CD", 5.0)
+        db.add(Payment(transaction=session.transaction_hash, amount=3.0, created_at=START, hash="payment"))
+        db.flush()
+
+        LedgerUtils.record_session(db, session)
+
+        entry = db.get(BillingLedgerEntry, 1)
+        assert (entry.amount_due, entry.amount_paid, entry.balance) == (5.0, 3.0, 2.0)
+        assert db.get(UserBalance, "alice").balance == 2.0
+
+    def test_replayed_stop_is_booked_once(self, db):
+        """Test recording a session the ledger already has doesn't change it or the user's totals"""
+        session = self.stopped_session(db, 1, "AB12CD", 5.0)
+        LedgerUtils.record_session(db, session)
+        db.flush()
+
+        LedgerUtils.record_sessions(db, [session])
+        db.flush()
+
+        assert len(db.scalars(select(BillingLedgerEntry)).all()) == 1
+        assert db.get(UserBalance, "alice").amount_due == 5.0
+
+    def test_sessions_with_equal_payment_hashes_are_both_booked(self, db):
+        """Test the ambiguous payment hash of session 1 with "2AB" and session 12 with "AB" doesn't block a stop"""
+        first, second = self.stopped_session(db, 1, "2AB", 5.0), self.stopped_session(db, 12, "AB", 2.5)
+        assert first.transaction_hash == second.transaction_hash
+
+        LedgerUtils.record_sessions(db, [first])
+        LedgerUtils.record_sessions(db, [second])
+        db.flush()
+
+        assert db.get(UserBalance, "alice").amount_due == 7.5
+
+    def test_payments_count_for_every_session_with_their_hash(self, db):
+        """Test a payment on a colliding hash is booked on both sessions, whether they stop before or after it"""
+        first, second = self.stopped_session(db, 1, "2AB", 5.0), self.stopped_session(db, 12, "AB", 2.5, username="bob")
+        LedgerUtils.record_session(db, first)
+        db.flush()
+        payment = Payment(transaction=first.transaction_hash, amount=2.0, created_at=START, hash="payment")
+        db.add(payment)
+        db.flush()
+
+        LedgerUtils.record_payment(db, payment)
+        LedgerUtils.record_session(db, second)
+        db.flush()
+
+        assert db.get(BillingLedgerEntry, 1).amount_paid == 2.0
+        assert db.get(BillingLedgerEntry, 12).amount_paid == 2.0
+        assert (db.get(UserBalance, "alice").amount_paid, db.get(UserBalance, "bob").amount_paid) == (2.0, 2.0)
+
+    def test_payment_is_booked_on_every_stopped_session_with_its_hash(self, db):
+        """Test a payment made after both colliding sessions stopped is booked on both, not on an arbitrary one"""
+        first, second = self.stopped_session(db, 1, "2AB", 5.0), self.stopped_session(db, 12, "AB", 2.5)
+        LedgerUtils.record_sessions(db, [first, second])
+        db.flush()
+        payment = Payment(transaction=first.transaction_hash, amount=2.0, created_at=START, hash="payment")
+        db.add(payment)
+        db.flush()
+
+        LedgerUtils.record_payment(db, payment)
+        db.flush()
+
+        assert [entry.balance for entry in db.scalars(select(BillingLedgerEntry).order_by(BillingLedgerEntry.session_id))] == [3.0, 0.5]
+        assert db.get(UserBalance, "alice").amount_paid == 4.0
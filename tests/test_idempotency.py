@@ -0,0 +1,112 @@
+import asyncio
+from collections import OrderedDict
+
+import pytest
+from fastapi import Request, Response
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app import main
+from app.main import app
+from app.util.idempotency_store import IdempotencyStore
+from app.util.jwt_authenticator import JWTAuthenticator
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def empty_store(monkeypatch):
+    monkeypatch.setattr(IdempotencyStore, "responses", OrderedDict())
+    monkeypatch.setattr(IdempotencyStore, "in_flight", set())
+    monkeypatch.setattr(IdempotencyStore, "size", 0)
+
+
+class TestIdempotencyStore:
+
+    def test_store_stays_within_max_bytes(self, monkeypatch):
+        """Test the oldest responses are evicted once the store is full"""
+        monkeypatch.setattr(settings, "IDEMPOTENCY_MAX_BYTES", 3 * (IdempotencyStore.ENTRY_OVERHEAD + 100))
+        for number in range(5):
+            IdempotencyStore.begin(f"key{number}")
+            IdempotencyStore.finish(f"key{number}", "body", 201, "application/json", b"x" * 90)
+
+        assert list(IdempotencyStore.responses) == ["key2", "key3", "key4"]
+        assert IdempotencyStore.size <= settings.IDEMPOTENCY_MAX_BYTES
+
+    def test_expired_responses_are_not_replayed(self, monkeypatch):
+        """Test a response isn't replayed after its TTL"""
+        monkeypatch.setattr(settings, "IDEMPOTENCY_TTL_SECONDS", -1)
+        IdempotencyStore.begin("key")
+        IdempotencyStore.finish("key", "body", 201, "application/json", b"{}")
+
+        assert IdempotencyStore.get("key", "body") is None
+        assert IdempotencyStore.size == 0
+
+    def test_key_in_flight_conflicts(self):
+        """Test a retry while the original request is still running isn't run as well"""
+        assert IdempotencyStore.begin("key") is True
+        assert IdempotencyStore.begin("key") is False
+
+
+class TestIdempotencyKeyHeader:
+
+    headers = {
+        "Authorization": f"Bearer {JWTAuthenticator.generate_token(1, 'admin')}",
+        "Idempotency-Key": "test-idempotency-key"
+    }
+
+    def test_retry_is_replayed_without_queries(self):
+        """Test a retry gets the original response back without running the route again"""
+        first = client.post("/parking_sessions/start/999999/IDEMPOTENT1", headers=self.headers)
+        retry = client.post("/parking_sessions/start/999999/IDEMPOTENT1", headers=self.headers)
+
+        assert retry.status_code == first.status_code
+        assert retry.json() == first.json()
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert retry.headers["X-DB-Query-Count"] == "0"
+
+    def test_key_reused_for_other_request(self):
+        """Test a key can't be used for a different request on the same route"""
+        client.post("/parking_sessions/start/999999/IDEMPOTENT1", headers=self.headers)
+        response = client.post("/parking_sessions/start/999999/IDEMPOTENT2", headers=self.headers)
+
+        assert response.status_code == 422
+
+    @pytest.fixture
+    def cookie_route(self, monkeypatch):
+        def set_cookies(response: Response):
+            response.set_cookie("first", "1")
+            response.set_cookie("second", "2")
+            return {"ok": True}
+
+        app.add_api_route("/idempotency_test/cookies", set_cookies, methods=["POST"])
+        monkeypatch.setattr(main, "IDEMPOTENT_ROUTES", main.IDEMPOTENT_ROUTES | {"POST /idempotency_test/cookies"})
+        yield
+        app.router.routes.pop()
+
+    def test_repeated_headers_are_kept(self, cookie_route):
+        """Test every Set-Cookie header reaches the client, on the original response and on a replay"""
+        first = client.post("/idempotency_test/cookies", headers=self.headers)
+        retry = client.post("/idempotency_test/cookies", headers=self.headers)
+
+        for response in (first, retry):
+            assert sorted(response.headers.get_list("set-cookie")) == ["first=1; Path=/; SameSite=lax", "second=2; Path=/; SameSite=lax"]
+        assert retry.headers["Idempotent-Replayed"] == "true"
+
+    def test_cancelled_request_releases_its_key(self):
+        """Test a request cancelled halfway, e.g. because the client disconnected, doesn't block retries with its key"""
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def cancelled(request):
+            raise asyncio.CancelledError
+
+        request = Request({
+            "type": "http", "method": "POST", "path": "/parking_sessions/start/1/CANCELLED1", "query_string": b"",
+            "headers": [(b"idempotency-key", b"test-idempotency-key")], "app": app
+        }, receive)
+
+        with pytest.raises(asyncio.CancelledError):
+            asyncio.run(main.replay_idempotent_requests(request, cancelled))
+
+        assert IdempotencyStore.in_flight == set()
@@ -0,0 +1,241 @@
+import asyncio
+import math
+import operator
+import random
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app.db.models.parking_lot import ParkingLot
+from app.db.models.parking_lot_occupancy import ParkingLotOccupancy
+from app.util.lot_catalogue import LotCatalogue
+from app.util.lot_listing_index import LotListingIndex
+from app.util.lot_occupancy import LotOccupancy
+from app.util.lot_search import LotSearch
+from app.api.parking_lots.routes import ParkingLotsService
+from app.util.lot_spatial_index import LotSpatialIndex, EARTH_RADIUS_KM
+from app.util.occupancy_broadcaster import OccupancyBroadcaster
+from app.util.parking_session_utils import ParkingSessionService
+
+
+def lots_around(generator, count, lat, lng, spread):
+    return [
+        SimpleNamespace(id=number, coordinates_lat=lat + generator.uniform(-spread, spread),
+                        coordinates_lng=(lng + generator.uniform(-spread, spread) + 180) % 360 - 180)
+        for number in range(count)
+    ]
+
+
+def brute_force(parking_lots, lat, lng, radius_km):
+    found = []
+    for lot in parking_lots:
+        lat1, lat2 = math.radians(lat), math.radians(lot.coordinates_lat)
+        a = math.sin((lat2 - lat1) / 2) ** 2 + \
+            math.cos(lat1) * math.cos(lat2) * math.sin(math.radians(lot.coordinates_lng - lng) / 2) ** 2
+        distance = 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+        if distance <= radius_km:
+            found.append((distance, lot.id))
+    return [parking_lot_id for _, parking_lot_id in sorted(found)]
+
+
+# Around Amsterdam, across the antimeridian and near the north pole
+@pytest.mark.parametrize("lat, lng, radius_km", [(52.37, 4.89, 2), (52.37, 4.89, 40), (-16.5, 179.99, 150), (89.9, 10, 300)])
+def test_radius_search_matches_brute_force(lat, lng, radius_km):
+    """Test the grid finds exactly the lots within the radius, nearest first"""
+    parking_lots = lots_around(random.Random(7), 5000, lat, lng, 3)
+    grid = LotSpatialIndex.build(parking_lots)
+
+    ids, distances = LotSpatialIndex.within(grid, lat, lng, radius_km)
+
+    assert ids.tolist() == brute_force(parking_lots, lat, lng, radius_km)
+    assert list(distances) == sorted(distances)
+
+
+def test_nearest_widens_until_enough_lots_are_accepted():
+    """Test the k nearest lots are found beyond the first search radius, skipping the ones not accepted"""
+    parking_lots = lots_around(random.Random(8), 2000, 52.0, 5.0, 1)
+    grid = LotSpatialIndex.build(parking_lots)
+    even = [lot for lot in parking_lots if lot.id % 2 == 0]
+
+    found = LotSpatialIndex.nearest(grid, 40.0, -3.7, 5, accept=lambda parking_lot_id: parking_lot_id % 2 == 0)
+
+    assert [parking_lot_id for parking_lot_id, _ in found] == brute_force(even, 40.0, -3.7, 20_000)[:5]
+
+
+
+def test_listing_filters_match_brute_force_and_pages_by_id():
+    """Test the range filters agree with filtering lot by lot, and paging after an ID continues the same list"""
+    generator = random.Random(7)
+    parking_lots = [
+        SimpleNamespace(id=number, capacity=generator.randrange(50, 1000), reserved=generator.randrange(50),
+                        tariff=generator.choice([1.0, 1.5, 2.5, 3.7]), daytariff=generator.randrange(5, 40),
+                        created_at=date(2015, 1, 1) + timedelta(days=generator.randrange(3650)))
+        for number in generator.sample(range(1, 50_000), 5_000)
+    ]
+    columns = LotListingIndex.build(parking_lots)
+    conditions = [("tariff", operator.le, 2.5), ("capacity", operator.ge, 400), ("created_at", operator.gt, date(2020, 6, 1))]
+
+    expected = sorted(
+        lot.id for lot in parking_lots if lot.tariff <= 2.5 and lot.capacity >= 400 and lot.created_at > date(2020, 6, 1)
+    )
+    assert LotListingIndex.select(columns, conditions).tolist() == expected
+    assert LotListingIndex.select(columns, conditions, after=expected[99]).tolist() == expected[100:]
+    assert LotListingIndex.select(columns, conditions, after=expected[-1]).tolist() == []
+
+
+def test_search_ranks_prefix_matches_and_follows_lot_writes(engine):
+    """Test the search index finds lots by the start of their words, and triggers keep it in sync with writes"""
+    connection = engine.raw_connection()
+    LotSearch.create_index(connection.cursor())
+    connection.commit()
+    with Session(engine) as db:
+        for parking_lot_id, name, address in [
+            (1, "Kerkplein Garage", "Kerkstraat 12, 1017 GC Amsterdam"),
+            (2, "Station Parking", "Stationsplein 1, 3511 CE Utrecht"),
+            (3, "Centrum Garage", "Kerkstraat 40, 3511 AA Utrecht")
+        ]:
+            db.add(ParkingLot(id=parking_lot_id, name=name, location="City Center", address=address, capacity=10,
+                              reserved=0, tariff=2.5, daytariff=15, created_at=datetime(2025, 1, 1),
+                              coordinates_lat=52.0, coordinates_lng=4.0))
+        db.commit()
+
+        assert [parking_lot_id for parking_lot_id, _ in LotSearch.search(db, "kerk", 10)] == [1, 3]
+        assert [parking_lot_id for parking_lot_id, _ in LotSearch.search(db, "kerkstr utr", 10)] == [3]
+        assert LotSearch.search(db, 'kerk" OR station*', 10) == []
+
+        db.get(ParkingLot, 1).name = "Domplein Garage"
+        db.delete(db.get(ParkingLot, 3))
+        db.commit()
+
+        assert [parking_lot_id for parking_lot_id, _ in LotSearch.search(db, "domp", 10)] == [1]
+        assert [parking_lot_id for parking_lot_id, _ in LotSearch.search(db, "kerk", 10)] == [1]
+
+
+class TestLotCatalogue:
+
+    @pytest.fixture
+    def db(self, db, monkeypatch):
+        monkeypatch.setattr(LotCatalogue, "catalogue", None)
+        db.add(ParkingLot(id=1, name="Catalogue", location="Catalogue", address="Catalogue", capacity=10, reserved=0,
+                          tariff=2.5, daytariff=15, created_at=datetime(2025, 1, 1), coordinates_lat=52.0,
+                          coordinates_lng=4.0))
+        LotCatalogue.bump_version(db)
+        db.commit()
+        return db
+
+    def test_catalogue_reloads_when_version_moves_on(self, db):
+        """Test the catalogue only reloads after a write bumped the version, as another worker's would"""
+        assert LotCatalogue.refresh(db) is True
+        assert LotCatalogue.refresh(db) is False
+
+        db.get(ParkingLot, 1).tariff = 3.0
+        LotCatalogue.bump_version(db)
+        db.commit()
+
+        assert LotCatalogue.get(1).tariff == 2.5
+        assert LotCatalogue.refresh(db) is True
+        assert LotCatalogue.get(1).tariff == 3.0
+
+
+class TestLotOccupancy:
+
+    @pytest.fixture
+    def db(self, db):
+        for parking_lot_id in (1, 2):
+            db.add(ParkingLot(id=parking_lot_id, name="Occupancy", location="Occupancy", address="Occupancy", capacity=10,
+                              reserved=2, tariff=2.5, daytariff=15, created_at=datetime(2025, 1, 1),
+                              coordinates_lat=52.0, coordinates_lng=4.0))
+        db.add(ParkingLotOccupancy(parking_lot_id=1, occupied=0, updated_at=datetime.now()))
+        db.commit()
+        return db
+
+    def start(self, db, license_plate):
+        return ParkingSessionService.insert_session(db, {
+            "parking_lot_id": 1, "license_plate": license_plate, "username": "guest", "started": datetime.now(),
+            "payment_status": "ongoing"
+        })
+
+    def test_counter_follows_starts_and_stops(self, db):
+        """Test starting and stopping sessions changes the stored counter in the same transaction"""
+        self.start(db, "OCC1")
+        session = self.start(db, "OCC2")
+        ParkingSessionService.stop_session(db, session.id, db.get(ParkingLot, 1), datetime.now())
+
+        assert db.get(ParkingLotOccupancy, 1).occupied == 1
+
+    def test_reconcile_corrects_drift_and_adds_missing_counters(self, db):
+        """Test the reconcile pass recounts the active sessions of every parking lot"""
+        self.start(db, "OCC1")
+        db.get(ParkingLotOccupancy, 1).occupied = 7
+        db.commit()
+
+        assert LotOccupancy.reconcile(db) == {"corrected": 1, "added": 1}
+        assert db.get(ParkingLotOccupancy, 1).occupied == 1
+        assert db.get(ParkingLotOccupancy, 2).occupied == 0
+
+    def test_refresh_returns_the_counters_other_workers_changed(self, db, monkeypatch):
+        """Test reloading the counters reports the ones that differ from the copy in memory"""
+        monkeypatch.setattr(LotOccupancy, "occupied", None)
+        assert LotOccupancy.refresh(db) == {}
+
+        db.get(ParkingLotOccupancy, 1).occupied = 3
+        db.add(ParkingLotOccupancy(parking_lot_id=2, occupied=0, updated_at=datetime.now()))
+        db.commit()
+
+        assert LotOccupancy.refresh(db) == {1: 3, 2: 0}
+        assert LotOccupancy.refresh(db) == {}
+
+
+class TestOccupancyBroadcaster:
+
+    def test_slow_subscriber_gets_the_latest_count_per_lot(self):
+        """Test changes a client hasn't been sent yet are replaced by newer ones instead of queueing up"""
+        async def scenario():
+            subscription = OccupancyBroadcaster.subscribe()
+            try:
+                for occupied in range(1, 6):
+                    OccupancyBroadcaster.publish({1: occupied})
+                OccupancyBroadcaster.publish({2: 4})
+                first = await subscription.next(1)
+                second = await subscription.next(0.01)
+            finally:
+                OccupancyBroadcaster.unsubscribe(subscription)
+            return first, second
+
+        assert asyncio.run(scenario()) == ({1: 5, 2: 4}, {})
+
+    def test_subscriber_only_gets_its_parking_lots(self):
+        """Test a client streaming some parking lots isn't woken up by changes to others"""
+        async def scenario():
+            subscription = OccupancyBroadcaster.subscribe({2})
+            try:
+                OccupancyBroadcaster.publish({1: 3})
+                skipped = await subscription.next(0.01)
+                OccupancyBroadcaster.publish({1: 4, 2: 1})
+                received = await subscription.next(1)
+            finally:
+                OccupancyBroadcaster.unsubscribe(subscription)
+            return skipped, received
+
+        assert asyncio.run(scenario()) == ({}, {2: 1})
+        assert OccupancyBroadcaster.stats()["subscribers"] == 0
+
+    def test_stream_survives_a_new_lot_changing_mid_snapshot(self, monkeypatch):
+        """Test the first session of a lot that isn't in the counters yet doesn't break a stream sending its snapshot"""
+        monkeypatch.setattr(LotOccupancy, "occupied", {1: 3, 2: 5})
+
+        async def scenario():
+            stream = ParkingLotsService.stream_occupancy(None)
+            try:
+                events = [await stream.__anext__()]
+                LotOccupancy.change(3, 1)
+                events += [await stream.__anext__(), await stream.__anext__()]
+            finally:
+                await stream.aclose()
+            return events
+
+        events = asyncio.run(scenario())
+        assert ['"parking_lot_id": 1' in events[0], '"parking_lot_id": 2' in events[1], '"parking_lot_id": 3' in events[2]] == [True] * 3
+        assert OccupancyBroadcaster.stats()["subscribers"] == 0
@@ -1,14 +1,24 @@
+import asyncio
 import sys
 import os
 
 import pytest
 from fastapi.testclient import TestClient
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 
 from app.main import app
+from app.api.parking_sessions.schemas import GateEvent
+from app.db.models.billing_ledger import BillingLedgerEntry
+from app.util.active_session_index import ActiveSessionIndex, ActiveSession
+from app.util.gate_event_utils import GateEventUtils
 from app.util.parking_session_utils import ParkingSessionService
+from app.util.jwt_authenticator import JWTAuthenticator
+from app.util.lot_catalogue import LotCatalogue, Catalogue
 from app.db.models.parking_session import ParkingSession
 from app.db.models.parking_lot import ParkingLot
+from app.db.models.user import User
 
 client = TestClient(app)
 
@@ -77,6 +87,23 @@ class TestStopParkingSession:
         
         assert response.status_code == 404
     
+    def test_stop_with_stale_index_entry_stops_current_session(self):
+        """Test a plate stopped and parked again through another worker is stopped, not reported as not parked"""
+        headers = {"Authorization": f"Bearer {JWTAuthenticator.generate_token(1, 'admin')}"}
+        stopped = client.post("/parking_sessions/start/1/STALE123", headers=headers).json()
+        client.post("/parking_sessions/stop/STALE123", headers=headers)
+        current = client.post("/parking_sessions/start/1/STALE123", headers=headers).json()
+        # This worker still has the first session, as if another worker stopped it and started the second one
+        ActiveSessionIndex.sessions["STALE123"] = ActiveSession(
+            stopped["id"], 1, stopped["username"], datetime.fromisoformat(stopped["started"])
+        )
+
+        response = client.post("/parking_sessions/stop/STALE123", headers=headers)
+
+        assert response.status_code == 200
+        assert response.json()["id"] == current["id"]
+        assert "STALE123" not in ActiveSessionIndex.sessions
+
     def test_stop_session_has_duration(self):
         """Test stopped session has duration"""
         client.post("/parking_sessions/start/1/DUR123")
@@ -216,4 +243,178 @@ class TestSessionLifecycle:
         assert "license_plate" in data
         assert "username" in data
         assert "started" in data
-        assert "payment_status" in data
\ No newline at end of file
+        assert "payment_status" in data
+
+
+class TestActiveSessionIndex:
+
+    def test_find_answers_indexed_plate_without_database(self, monkeypatch):
+        """Test a plate in the index is found without a database session"""
+        parked = ActiveSession(1, 1, "guest", datetime.now())
+        monkeypatch.setattr(ActiveSessionIndex, "sessions", {"PARKED123": parked})
+
+        assert asyncio.run(ActiveSessionIndex.find(None, "PARKED123")) == parked
+
+    def test_entries_know_the_id_of_their_user(self, db, monkeypatch):
+        """Test sessions loaded from the database carry the ID of their user, guest sessions none"""
+        db.add(User(id=5, username="alice", password="x", name="Alice", email="alice@example.com", phone="0612345678",
+                    role="user", created_at=datetime(2025, 1, 1), birth_year=1990))
+        for license_plate, username in (("ALICE123", "alice"), ("GUEST123", "guest")):
+            db.add(ParkingSession(parking_lot_id=1, license_plate=license_plate, username=username,
+                                  started=datetime(2025, 6, 1, 8), payment_status="ongoing"))
+        db.commit()
+        monkeypatch.setattr(ActiveSessionIndex, "sessions", {})
+        monkeypatch.setattr(ActiveSessionIndex, "warmed", False)
+
+        ActiveSessionIndex.warm(db)
+
+        assert ActiveSessionIndex.sessions["ALICE123"].user_id == 5
+        assert ActiveSessionIndex.sessions["GUEST123"].user_id is None
+
+    def test_remove_keeps_newer_session(self, monkeypatch):
+        """Test removing a stopped session doesn't remove a session the plate started since"""
+        newer = ActiveSession(2, 1, "guest", datetime.now())
+        monkeypatch.setattr(ActiveSessionIndex, "sessions", {"NEWER123": newer})
+
+        ActiveSessionIndex.remove("NEWER123", 1)
+
+        assert ActiveSessionIndex.sessions["NEWER123"] == newer
+
+
+
+class TestQuote:
+
+    headers = {"Authorization": f"Bearer {JWTAuthenticator.generate_token(1, 'admin')}"}
+
+    def test_quote_is_served_from_memory(self, monkeypatch):
+        """Test an ongoing session is quoted from the index and the lot catalogue, without queries"""
+        started = datetime.now() - timedelta(hours=2, minutes=5)
+        monkeypatch.setattr(ActiveSessionIndex, "sessions", {"QUOTE123": ActiveSession(7, 1, "guest", started)})
+        monkeypatch.setattr(LotCatalogue, "catalogue", Catalogue(1, {1: ParkingLot(id=1, tariff=2.5, daytariff=15)}))
+
+        response = client.get("/parking_sessions/QUOTE123/quote", headers=self.headers)
+
+        assert response.status_code == 200
+        assert response.json()["session_id"] == 7
+        quoted_at = datetime.fromisoformat(response.json()["quoted_at"])
+        assert response.json()["cost"] == ParkingSessionService.calculate_price(
+            ParkingLot(tariff=2.5, daytariff=15), ParkingSession(started=started, stopped=quoted_at)
+        )
+        assert response.headers["X-DB-Query-Count"] == "0"
+
+    def test_quote_checks_the_owner_from_the_index(self, monkeypatch):
+        """Test a user can quote their own session and not someone else's, without a query for either"""
+        started = datetime.now() - timedelta(hours=1)
+        monkeypatch.setattr(ActiveSessionIndex, "sessions", {"OWNED123": ActiveSession(7, 1, "alice", started, 5)})
+        monkeypatch.setattr(LotCatalogue, "catalogue", Catalogue(1, {1: ParkingLot(id=1, tariff=2.5, daytariff=15)}))
+
+        own = client.get("/parking_sessions/OWNED123/quote",
+                         headers={"Authorization": f"Bearer {JWTAuthenticator.generate_token(5, 'user')}"})
+        other = client.get("/parking_sessions/OWNED123/quote",
+                           headers={"Authorization": f"Bearer {JWTAuthenticator.generate_token(6, 'user')}"})
+
+        assert own.status_code == 200
+        assert other.status_code == 403
+        assert own.headers["X-DB-Query-Count"] == other.headers["X-DB-Query-Count"] == "0"
+
+    def test_quote_unknown_plate(self, monkeypatch):
+        """Test quoting a plate that isn't parked"""
+        monkeypatch.setattr(ActiveSessionIndex, "sessions", {})
+
+        response = client.get("/parking_sessions/NOTPARKED999/quote", headers=self.headers)
+
+        assert response.status_code == 404
+
+
+class TestUniqueActiveSession:
+
+    def session_values(self, stopped=None) -> dict:
+        return {"parking_lot_id": 1, "license_plate": "RACE123", "username": "guest", "started": datetime.now(),
+                "stopped": stopped, "payment_status": "ongoing"}
+
+    def test_second_active_session_is_rejected(self, db):
+        """Test the database refuses a second active session for a plate, whatever the routes checked"""
+        ParkingSessionService.insert_session(db, self.session_values())
+
+        with pytest.raises(IntegrityError):
+            ParkingSessionService.insert_session(db, self.session_values())
+
+    def test_stopped_sessions_dont_count(self, db):
+        """Test a plate can be started again after its earlier sessions were stopped"""
+        ParkingSessionService.insert_session(db, self.session_values(stopped=datetime.now()))
+        ParkingSessionService.insert_session(db, self.session_values(stopped=datetime.now()))
+
+        assert ParkingSessionService.insert_session(db, self.session_values()).stopped is None
+
+
+class TestGateEvents:
+
+    @pytest.fixture
+    def db(self, db):
+        db.add(ParkingLot(id=1, name="Gate", location="Gate", address="Gate", capacity=10, reserved=0, tariff=2.5,
+                          daytariff=15, created_at=datetime(2025, 1, 1), coordinates_lat=52.0, coordinates_lng=4.0))
+        db.commit()
+        return db
+
+    def event(self, type: str, license_plate: str, hour: int, parking_lot_id: int = 1) -> dict:
+        return {"type": type, "parking_lot_id": parking_lot_id, "license_plate": license_plate,
+                "timestamp": datetime(2025, 6, 1, hour)}
+
+    def test_events_are_applied_in_order(self, db):
+        """Test a plate can enter, leave and enter again within one batch, and exits are priced"""
+        results = GateEventUtils.apply_events(db, [
+            self.event("entry", "GATE123", 8),
+            self.event("exit", "GATE123", 10),
+            self.event("entry", "GATE123", 12),
+        ])
+
+        assert [result["status"] for result in results] == ["started", "stopped", "started"]
+        assert results[1]["session"].cost == 5.0
+        assert results[1]["session"].transaction_hash is not None
+        assert db.get(BillingLedgerEntry, results[1]["session"].id).amount_due == 5.0
+        assert db.scalar(select(ParkingSession.id).where(ParkingSession.stopped == None)) == results[2]["session"].id
+
+    def test_plate_with_an_active_session_can_leave_and_enter_again(self, db):
+        """Test a plate already parked before the batch can leave and enter again within one batch"""
+        parked = ParkingSession(parking_lot_id=1, license_plate="GATE123", username="guest",
+                                started=datetime(2025, 6, 1, 7), payment_status="ongoing")
+        db.add(parked)
+        db.commit()
+
+        results = GateEventUtils.apply_events(db, [
+            self.event("exit", "GATE123", 9),
+            self.event("entry", "GATE123", 10),
+        ])
+
+        assert [result["status"] for result in results] == ["stopped", "started"]
+        assert results[0]["session"].id == parked.id
+        assert db.get(BillingLedgerEntry, parked.id).amount_due == 5.0
+        assert db.scalars(select(ParkingSession.id).where(ParkingSession.stopped == None)).all() == [results[1]["session"].id]
+
+    def test_timestamps_with_a_timezone_are_stored_in_local_time(self, db):
+        """Test gates sending UTC or offset timestamps get their sessions started and stopped like local ones"""
+        entry = datetime(2025, 6, 1, 8, tzinfo=timezone.utc)
+        events = [
+            GateEvent(type="entry", parking_lot_id=1, license_plate="GATE123", timestamp=entry).model_dump(),
+            GateEvent(type="entry", parking_lot_id=1, license_plate="GATE456", timestamp="2025-06-01T09:00:00+02:00").model_dump(),
+            GateEvent(type="exit", parking_lot_id=1, license_plate="GATE123", timestamp=entry + timedelta(hours=2)).model_dump(),
+        ]
+
+        results = GateEventUtils.apply_events(db, events)
+
+        assert [result["status"] for result in results] == ["started", "started", "stopped"]
+        assert results[0]["session"].started == entry.astimezone().replace(tzinfo=None)
+        assert results[2]["session"].cost == 5.0
+        assert db.get(ParkingSession, results[1]["session"].id).license_plate == "GATE456"
+
+    def test_invalid_events_are_rejected(self, db):
+        """Test events that can't be applied are rejected without affecting the rest of the batch"""
+        results = GateEventUtils.apply_events(db, [
+            self.event("entry", "GATE123", 8, parking_lot_id=2),
+            self.event("exit", "GATE123", 9),
+            self.event("entry", "GATE123", 10),
+            self.event("entry", "GATE123", 11),
+            self.event("exit", "GATE123", 9),
+        ])
+
+        assert [result["status"] for result in results] == ["rejected", "rejected", "started", "rejected", "rejected"]
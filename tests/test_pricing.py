@@ -0,0 +1,91 @@
+import random
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.db.models.parking_lot import ParkingLot
+from app.db.models.parking_session import ParkingSession
+from app.util.parking_session_utils import ParkingSessionService
+from app.util.pricing_utils import PricingUtils
+
+START = datetime(2025, 3, 14, 9, 30, 12, 345678)
+# Around the grace period, the hour boundaries, midnight and the multi-day rule
+EDGE_DURATIONS = [
+    timedelta(0), timedelta(seconds=-60), timedelta(seconds=179, microseconds=999999), timedelta(seconds=180),
+    timedelta(hours=1), timedelta(hours=1, microseconds=1), timedelta(hours=5), timedelta(hours=14, minutes=29),
+    timedelta(hours=14, minutes=30), timedelta(days=1), timedelta(days=1, hours=23), timedelta(days=30, seconds=1),
+]
+
+
+def scalar_prices(started, stopped, tariffs, daytariffs):
+    return [
+        ParkingSessionService.calculate_price(
+            SimpleNamespace(tariff=tariff, daytariff=daytariff),
+            SimpleNamespace(started=start, stopped=stop)
+        )
+        for start, stop, tariff, daytariff in zip(started, stopped, tariffs, daytariffs)
+    ]
+
+
+@pytest.mark.parametrize("duration", EDGE_DURATIONS, ids=str)
+def test_batch_pricing_matches_calculate_price_on_edges(duration):
+    """Test the batch pricer agrees with calculate_price around every rule's boundary"""
+    started = [START, START.replace(hour=23, minute=58)]
+    stopped = [start + duration for start in started]
+    tariffs, daytariffs = [2.5, 3.7], [15, 20]
+
+    prices = PricingUtils.calculate_prices(started, stopped, tariffs, daytariffs)
+
+    assert prices.tolist() == scalar_prices(started, stopped, tariffs, daytariffs)
+
+
+def test_batch_pricing_matches_calculate_price_on_random_sessions():
+    """Test the batch pricer agrees with calculate_price on random sessions"""
+    generator = random.Random(42)
+    started = [START + timedelta(seconds=generator.randrange(365 * 24 * 3600)) for _ in range(10_000)]
+    stopped = [start + timedelta(microseconds=generator.randrange(4 * 24 * 3600 * 10 ** 6)) for start in started]
+    tariffs = [generator.choice([1.0, 2.5, 3.7, 4.25]) for _ in started]
+    daytariffs = [generator.choice([10, 15, 20, 35]) for _ in started]
+
+    prices = PricingUtils.calculate_prices(started, stopped, tariffs, daytariffs)
+
+    assert prices.tolist() == scalar_prices(started, stopped, tariffs, daytariffs)
+
+
+def test_active_sessions_are_priced_until_now():
+    """Test a session without a stop is priced up to the given moment"""
+    now = START + timedelta(hours=2, minutes=5)
+
+    prices = PricingUtils.calculate_prices([START], np.array([None], dtype="datetime64[us]"), [2.5], [15], now=now)
+
+    assert prices.tolist() == [7.5]
+
+
+def test_tariff_simulation_replays_recent_stopped_sessions(db):
+    """Test the simulation prices the lot's recent stopped sessions under both tariffs, a chunk at a time"""
+    lot = ParkingLot(id=1, name="Sim", location="Sim", address="Sim", capacity=10, reserved=0, tariff=2.5, daytariff=15,
+                     created_at=START, coordinates_lat=52.0, coordinates_lng=4.0)
+    durations = [timedelta(minutes=2), timedelta(minutes=50), timedelta(hours=3), timedelta(hours=9), timedelta(days=2)]
+    db.add(lot)
+    for number, duration in enumerate(durations):
+        db.add(ParkingSession(parking_lot_id=1, license_plate=f"SIM{number}", username="guest", started=START,
+                              stopped=START + duration, payment_status="pending"))
+    # Too old, still parked and in another lot
+    db.add(ParkingSession(parking_lot_id=1, license_plate="OLD", username="guest", started=START - timedelta(days=60),
+                          stopped=START - timedelta(days=59), payment_status="pending"))
+    db.add(ParkingSession(parking_lot_id=1, license_plate="ACTIVE", username="guest", started=START, payment_status="ongoing"))
+    db.add(ParkingSession(parking_lot_id=2, license_plate="OTHER", username="guest", started=START,
+                          stopped=START + timedelta(hours=1), payment_status="pending"))
+    db.commit()
+
+    result = PricingUtils.simulate_tariff(db, lot, 3.0, 20, START - timedelta(days=30), chunk_size=2)
+
+    started = [START] * len(durations)
+    stopped = [START + duration for duration in durations]
+    assert result["sessions"] == len(durations)
+    assert result["current_revenue"] == sum(scalar_prices(started, stopped, [2.5] * 5, [15] * 5))
+    assert result["proposed_revenue"] == sum(scalar_prices(started, stopped, [3.0] * 5, [20] * 5))
+    assert (result["sessions_cheaper"], result["sessions_unchanged"], result["sessions_pricier"]) == (0, 1, 4)
+    assert [bucket["sessions"] for bucket in result["by_duration"]] == [1, 1, 0, 1, 0, 1, 1]
@@ -0,0 +1,44 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app.db.query_log import QueryLog, QueryBudgetExceededError
+from app.main import app
+
+client = TestClient(app)
+
+
+class TestQueryTiming:
+
+    def test_failed_statement_leaves_no_start_time_behind(self, engine):
+        """Test a statement that fails doesn't leave its start time on the pooled connection"""
+        QueryLog.install(engine)
+
+        with engine.connect() as connection:
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    connection.execute(text("SELECT * FROM no_such_table"))
+            connection.execute(text("SELECT 1"))
+
+            assert connection.info.get("query_started") == []
+
+
+class TestQueryBudget:
+
+    def test_query_count_headers(self):
+        """Test responses report the queries they issued"""
+        response = client.post("/auth/login", json={"username": "budget_nobody", "password": "password123"})
+
+        assert int(response.headers["X-DB-Query-Count"]) > 0
+        assert float(response.headers["X-DB-Time-Ms"]) >= 0
+
+    def test_repeated_statement_exceeds_budget(self):
+        """Test the same statement shape in a loop is reported as over budget"""
+        queries = QueryLog.start_request("GET /test")
+        for session_id in range(10):
+            QueryLog.record(f"SELECT * FROM parking_lots WHERE id = {session_id}", 0.1, None)
+
+        assert queries["count"] == 10
+        with pytest.raises(QueryBudgetExceededError):
+            QueryLog.finish_request("GET /test", queries)
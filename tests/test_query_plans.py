@@ -0,0 +1,89 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects import sqlite
+
+from app.db.models.parking_lot import ParkingLot
+from app.db.models.parking_session import ParkingSession
+from app.db.models.payment import Payment
+from app.db.models.user import User
+from app.db.models.user_balance import UserBalance
+from app.db.models.vehicle import Vehicle
+from app.util.billing_utils import BillingUtils
+from app.util.parking_session_utils import ParkingSessionService
+
+# The lookups the routes run on every request, by the route they belong to
+ROUTE_QUERIES = {
+    "auth register/login: user by username": select(User).where(User.username == "johndoe").limit(1),
+    "auth register: user by email": select(User).where(User.email == "john@example.com").limit(1),
+    "profile update: user by phone": select(User).where(User.phone == "0612345678").limit(1),
+    "sessions start/stop: user by id": select(User.username).where(User.id == 1),
+    "sessions start/stop: active session by plate": select(ParkingSession.id).where(
+        ParkingSession.license_plate == "AB-123-C",
+        ParkingSession.stopped == None
+    ).limit(1),
+    "sessions start: vehicle by plate": select(Vehicle).where(Vehicle.license_plate == "AB-123-C").limit(1),
+    "sessions start: lot, active session and plate owner": ParkingSessionService.start_context_query(1, "AB-123-C", 1),
+    "sessions stop: active session row by plate": select(ParkingSession).where(
+        ParkingSession.license_plate == "AB-123-C",
+        ParkingSession.stopped == None
+    ).limit(1),
+    "sessions: history by plate": select(ParkingSession).where(ParkingSession.license_plate == "AB-123-C"),
+    "sessions start/stop: parking lot by id": select(ParkingLot).where(ParkingLot.id == 1),
+    "sessions search: user in a date range": ParkingSessionService.search_query(
+        100, username="johndoe", started_from=datetime(2025, 1, 1), started_until=datetime(2025, 2, 1)
+    ),
+    "sessions search: parking lot, next page": ParkingSessionService.search_query(
+        100, parking_lot_id=1, cursor="2025-01-15T10:00:00_123"
+    ),
+    "sessions search: plate": ParkingSessionService.search_query(100, license_plate="AB-123-C"),
+    "billing: bill by username": BillingUtils.billing_query("johndoe"),
+    "billing: next page of the bill": BillingUtils.billing_query("johndoe", 50, 1000),
+    "admin: outstanding balances": select(UserBalance).where(UserBalance.balance > 0).order_by(UserBalance.balance.desc()).limit(50),
+    "billing: payments by transaction": select(Payment).where(Payment.transaction == "abc"),
+    "reconciliation: session by transaction hash": select(ParkingSession).where(ParkingSession.transaction_hash == "abc"),
+    "payments: payments by initiator": select(Payment).where(Payment.initiator_id == 1),
+}
+
+
+@pytest.fixture
+def connection(engine):
+    with engine.connect() as connection:
+        yield connection
+
+
+def query_plan(connection, statement) -> list[str]:
+    compiled = statement.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True})
+    return [row.detail for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}")]
+
+
+@pytest.mark.parametrize("statement", ROUTE_QUERIES.values(), ids=ROUTE_QUERIES.keys())
+def test_route_query_uses_index(connection, statement):
+    """Test the query searches an index (or the primary key) instead of scanning its table"""
+    plan = query_plan(connection, statement)
+
+    assert any(detail.startswith("SEARCH") for detail in plan), plan
+    # A SELECT of only subqueries "scans" the single row it returns, which isn't a table
+    assert not any(detail.startswith("SCAN") and detail != "SCAN CONSTANT ROW" for detail in plan), plan
+
+
+def test_active_session_check_uses_partial_index(connection):
+    """Test the active session check only has to look at the active sessions"""
+    plan = query_plan(connection, ROUTE_QUERIES["sessions start/stop: active session by plate"])
+
+    assert any("ix_parking_sessions_active_license_plate" in detail for detail in plan), plan
+
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"username": "johndoe"},
+    {"license_plate": "AB-123-C", "started_from": datetime(2025, 1, 1)},
+    {"parking_lot_id": 1, "cursor": "2025-01-15T10:00:00_123"},
+])
+def test_session_search_reads_in_index_order(connection, filters):
+    """Test a page of the session search is read from an index in order instead of sorting the matches"""
+    plan = query_plan(connection, ParkingSessionService.search_query(100, **filters))
+
+    assert all("USING INDEX" in detail for detail in plan), plan
+    assert not any("TEMP B-TREE" in detail for detail in plan), plan
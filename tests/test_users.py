@@ -404,9 +404,13 @@ import time
 # def test_add_vehicle_name():
 #     pass
 
-from fastapi import FastAPI
+import json
+from datetime import date
+from fastapi import FastAPI, Response
 from fastapi.testclient import TestClient
 from app.main import app
+from app.api.users.routes import root as users_root
+from app.db.models.user import User
 
 client = TestClient(app)
 
@@ -414,6 +418,43 @@ def test_get_all_users():
     response = client.get("/users/")
     assert response is not None
 
+def test_get_users_page():
+    response = client.get("/users/", params={"limit": 2})
+    assert response.status_code == 200
+    users = response.json()
+    assert len(users) <= 2
+    assert all("password" not in user for user in users)
+
+    if len(users) == 2:
+        assert response.headers["X-Next-Cursor"] == str(users[-1]["id"])
+        next_page = client.get("/users/", params={"limit": 2, "after": response.headers["X-Next-Cursor"]}).json()
+        assert all(user["id"] > users[-1]["id"] for user in next_page)
+
+def test_full_users_page_has_next_cursor(db):
+    for user_id in (1, 2, 3):
+        db.add(User(id=user_id, username=f"user{user_id}", password="x", name="User", email=f"user{user_id}@example.com",
+                    phone="0612345678", role="user", created_at=date(2025, 1, 1), birth_year=1990))
+    db.commit()
+
+    first, last = Response(), Response()
+    assert [user.id for user in users_root(first, limit=2, after=None, stream=False, db=db)] == [1, 2]
+    assert first.headers["X-Next-Cursor"] == "2"
+    assert [user.id for user in users_root(last, limit=2, after=2, stream=False, db=db)] == [3]
+    assert "X-Next-Cursor" not in last.headers
+
+def test_last_users_page_has_no_cursor():
+    response = client.get("/users/", params={"limit": 1000, "after": 2 ** 62})
+    assert response.status_code == 200
+    assert response.json() == []
+    assert "X-Next-Cursor" not in response.headers
+
+def test_stream_users():
+    response = client.get("/users/", params={"stream": True})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    ids = [json.loads(line)["id"] for line in response.text.splitlines()]
+    assert ids == sorted(ids)
+
 def test_register_user_success():
     # Setup test data
     register_data = {